@@ -1,6 +1,8 @@
 from django.contrib import admin
+from django.db import transaction
 
-from .models import Facility, LandRecord, Issue
+from .matching import merge_facilities
+from .models import Facility, FacilityMatch, Issue, Job, LandRecord
 
 
 @admin.register(Facility)
@@ -15,6 +17,7 @@ class LandRecordAdmin(admin.ModelAdmin):
 	list_display = ("parcel_number", "owner", "facility", "acreage", "ownership_status", "survey_status")
 	search_fields = ("parcel_number", "owner")
 	list_filter = ("ownership_status", "survey_status")
+	list_select_related = ("facility",)
 
 
 @admin.register(Issue)
@@ -22,6 +25,50 @@ class IssueAdmin(admin.ModelAdmin):
 	list_display = ("facility", "status", "reported_by", "created_at")
 	search_fields = ("facility__name", "description")
 	list_filter = ("status",)
+	list_select_related = ("facility", "reported_by")
 
 
+@admin.register(FacilityMatch)
+class FacilityMatchAdmin(admin.ModelAdmin):
+	list_display = ("facility", "duplicate", "score", "status", "created_at")
+	list_filter = ("status",)
+	list_select_related = ("facility", "duplicate")
+	search_fields = ("facility__name", "duplicate__name")
+	actions = ("merge_selected", "reject_selected")
+
+	@admin.action(description="Merge duplicate into facility")
+	def merge_selected(self, request, queryset):
+		"""
+		Merge every selected pair in one transaction. Pairs can overlap: a
+		facility merged away earlier is replaced by the one it went into,
+		and a duplicate that is already gone is skipped.
+		"""
+		merged, skipped = 0, 0
+		merged_into = {}
+		with transaction.atomic():
+			pairs = list(queryset.filter(status="Pending").order_by("pk").values_list("facility_id", "duplicate_id"))
+			existing = set(Facility.objects.filter(pk__in={pk for pair in pairs for pk in pair}).values_list("pk", flat=True))
+			for facility_pk, duplicate_pk in pairs:
+				while facility_pk in merged_into:
+					facility_pk = merged_into[facility_pk]
+				if duplicate_pk in merged_into or facility_pk == duplicate_pk or not {facility_pk, duplicate_pk} <= existing:
+					skipped += 1
+					continue
+				merged += merge_facilities(facility_pk, [duplicate_pk])
+				merged_into[duplicate_pk] = facility_pk
+		message = f"{merged} facilities merged."
+		if skipped:
+			message += f" {skipped} pairs skipped: one of the facilities had already been merged or deleted."
+		self.message_user(request, message)
+
+	@admin.action(description="Not the same facility")
+	def reject_selected(self, request, queryset):
+		rejected = queryset.update(status="Rejected")
+		self.message_user(request, f"{rejected} pairs rejected.")
+
 
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+	list_display = ("name", "status", "attempts", "progress_done", "progress_total", "message", "created_at", "finished_at")
+	list_filter = ("status", "name")
+	readonly_fields = ("locked_by", "locked_at", "started_at", "finished_at", "error", "result")
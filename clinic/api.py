@@ -0,0 +1,181 @@
+"""
+Read-only JSON API (/api/v1/).
+
+Each Resource lists the fields a client may ask for with ?fields= and the
+relations it may embed with ?include=. Rows are fetched with .values(), so
+no model instances are built, and every include costs one query for the
+whole page (pk__in on the ids the page refers to), whatever the page size.
+Lists are paged with KeysetPaginator on (-created_at, -pk).
+"""
+from .exports import filter_land_records
+from .models import Facility, Issue, LandRecord
+from .pagination import DEFAULT_ORDERING, KeysetPaginator
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+class Include:
+    """
+    An embeddable relation. `many` relations (facility -> land records)
+    are lists keyed on `foreign_key` of the related rows; the others
+    (land record -> facility) follow `foreign_key` of the page's rows.
+    """
+
+    def __init__(self, resource_name, foreign_key, many=False):
+        self.resource_name = resource_name
+        self.foreign_key = foreign_key
+        self.many = many
+
+    @property
+    def resource(self):
+        return RESOURCES[self.resource_name]
+
+    def attach(self, rows, name):
+        resource = self.resource
+        if self.many:
+            pks = [row["id"] for row in rows]
+            related = resource.fetch(resource.model.objects.filter(**{f"{self.foreign_key}__in": pks}),
+                                     resource.default_fields, extra=[self.foreign_key])
+            grouped = {pk: [] for pk in pks}
+            for item in related:
+                grouped[item.pop(self.foreign_key)].append(item)
+            for row in rows:
+                row[name] = grouped[row["id"]]
+        else:
+            ids = {row[self.foreign_key] for row in rows if row[self.foreign_key] is not None}
+            related = resource.fetch(resource.model.objects.filter(pk__in=ids), resource.default_fields)
+            by_id = {item["id"]: item for item in related}
+            for row in rows:
+                row[name] = by_id.get(row[self.foreign_key])
+
+
+class Resource:
+    def __init__(self, model, fields, default_fields=None, includes=None, filters=None):
+        self.model = model
+        self.fields = fields
+        self.default_fields = default_fields or fields
+        self.includes = includes or {}
+        self.filters = filters
+
+    def parse(self, params):
+        """(fields, includes) from ?fields=a,b&include=c; ValueError for unknown names."""
+        fields = _split(params.get("fields")) or list(self.default_fields)
+        unknown = [name for name in fields if name not in self.fields]
+        if unknown:
+            raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+        includes = _split(params.get("include"))
+        unknown = [name for name in includes if name not in self.includes]
+        if unknown:
+            raise ValueError(f"Unknown include(s): {', '.join(unknown)}")
+        return ["id"] + [name for name in fields if name != "id"], includes
+
+    def queryset(self, params):
+        queryset = self.model.objects.all()
+        return self.filters(queryset, params) if self.filters else queryset
+
+    def fetch(self, queryset, fields, extra=()):
+        return list(queryset.values(*fields, *[name for name in extra if name not in fields]))
+
+    def serialize(self, rows, fields, includes, hidden=()):
+        """Attach includes, then drop the columns only fetched for paging / includes."""
+        for name in includes:
+            self.includes[name].attach(rows, name)
+        for row in rows:
+            for name in hidden:
+                row.pop(name, None)
+        return rows
+
+    def _extra(self, fields, includes, ordering=()):
+        extra = [name for name in ordering if name not in fields]
+        extra += [
+            self.includes[name].foreign_key for name in includes
+            if not self.includes[name].many and self.includes[name].foreign_key not in fields + extra
+        ]
+        return extra
+
+    def page(self, params, cursor=None, limit=DEFAULT_LIMIT):
+        """One page of results: (rows, next_cursor, previous_cursor)."""
+        fields, includes = self.parse(params)
+        ordering = [name.lstrip("-") for name in DEFAULT_ORDERING if name.lstrip("-") != "pk"]
+        extra = self._extra(fields, includes, ordering)
+        queryset = self.queryset(params).values(*fields, *extra)
+        page = KeysetPaginator(queryset, limit).page(cursor)
+        rows = self.serialize(list(page.object_list), fields, includes, hidden=extra)
+        return rows, page.next_cursor, page.previous_cursor
+
+    def get(self, pk, params):
+        """One object as a dict, or None."""
+        fields, includes = self.parse(params)
+        extra = self._extra(fields, includes)
+        rows = self.fetch(self.model.objects.filter(pk=pk), fields, extra)
+        return self.serialize(rows, fields, includes, hidden=extra)[0] if rows else None
+
+
+def _split(value):
+    return [name.strip() for name in (value or "").split(",") if name.strip()]
+
+
+def _filter_facilities(queryset, params):
+    # as FacilityListView
+    if params.get("search"):
+        queryset = queryset.filter(name__icontains=params["search"])
+    for name in ("subcounty", "ward", "facility_type"):
+        if params.get(name):
+            queryset = queryset.filter(**{name: params[name]})
+    return queryset
+
+
+def _filter_issues(queryset, params):
+    if params.get("status"):
+        queryset = queryset.filter(status=params["status"])
+    if params.get("facility"):
+        queryset = queryset.filter(facility_id=params["facility"])
+    return queryset
+
+
+def _filter_land_records(queryset, params):
+    # as LandRecordListView, plus the facility and dispute status
+    queryset = filter_land_records(queryset, params)
+    if params.get("facility"):
+        queryset = queryset.filter(facility_id=params["facility"])
+    if params.get("dispute_status"):
+        queryset = queryset.filter(dispute_status=params["dispute_status"])
+    return queryset
+
+
+def _model_fields(model, exclude=()):
+    return [
+        "id" if field.primary_key else field.attname
+        for field in model._meta.concrete_fields
+        if field.name not in exclude
+    ]
+
+
+RESOURCES = {
+    "facilities": Resource(
+        Facility,
+        fields=_model_fields(Facility, exclude=("geo_cell",)),
+        includes={
+            "land_records": Include("landrecords", "facility_id", many=True),
+            "issues": Include("issues", "facility_id", many=True),
+        },
+        filters=_filter_facilities,
+    ),
+    "landrecords": Resource(
+        LandRecord,
+        fields=_model_fields(LandRecord, exclude=("import_key", "import_hash")),
+        default_fields=[
+            "id", "facility_id", "parcel_number", "owner", "acreage", "ownership_status",
+            "land_use", "dispute_status", "survey_status", "created_at",
+        ],
+        includes={"facility": Include("facilities", "facility_id")},
+        filters=_filter_land_records,
+    ),
+    "issues": Resource(
+        Issue,
+        fields=_model_fields(Issue, exclude=("reported_by",)),
+        includes={"facility": Include("facilities", "facility_id")},
+        filters=_filter_issues,
+    ),
+}
@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class ClinicConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'clinic'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from clinic_project.database import enable_wal
+
+        from . import checks, signals, tasks  # noqa: F401
+
+        connection_created.connect(enable_wal, dispatch_uid="clinic_enable_wal")
@@ -0,0 +1,118 @@
+"""
+Batch submission of land records and issues (POST /api/v1/batch/).
+
+The body is NDJSON (one object per line) or a JSON array. Every item names
+its type and facility:
+
+    {"type": "landrecord", "facility": 12, "parcel_number": "...", ...}
+    {"type": "issue", "facility": 12, "description": "...", "status": "Open"}
+
+and is validated with the form the pages use (LandRecordForm, IssueForm).
+The valid items are written with one bulk_create per type inside a single
+transaction; the invalid ones are reported and skipped. Facilities are
+checked with one query for the whole batch, so the cost of a batch is a
+few queries whatever its size.
+"""
+import json
+
+from django.db import transaction
+
+from .forms import IssueForm, LandRecordForm
+from .models import Facility
+from .signals import bulk_saved
+
+MAX_ITEMS = 5000
+BATCH_SIZE = 500
+FORMS = {"landrecord": LandRecordForm, "issue": IssueForm}
+
+
+def parse(body, content_type=""):
+    """
+    The items of a request body, as a list of dicts or (for NDJSON lines
+    that are not valid JSON) error strings. ValueError if the body as a
+    whole cannot be read.
+    """
+    text = body.decode("utf-8") if isinstance(body, bytes) else body
+    if "ndjson" in content_type or not text.lstrip().startswith("["):
+        items = []
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                items.append("Not valid JSON.")
+    else:
+        try:
+            items = json.loads(text)
+        except ValueError as exc:
+            raise ValueError("Body is not valid JSON.") from exc
+    if not items:
+        raise ValueError("No items.")
+    if len(items) > MAX_ITEMS:
+        raise ValueError(f"At most {MAX_ITEMS} items per batch.")
+    return items
+
+
+def _facility_pk(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def validate(item, facilities, user=None):
+    """(kind, unsaved instance) for a valid item, or (None, errors)."""
+    if not isinstance(item, dict):
+        return None, {"__all__": [item if isinstance(item, str) else "Item must be an object."]}
+    kind = item.get("type")
+    if kind not in FORMS:
+        return None, {"type": [f"Must be one of: {', '.join(FORMS)}."]}
+    facility_pk = _facility_pk(item.get("facility"))
+    if facility_pk not in facilities:
+        return None, {"facility": ["Unknown facility."]}
+
+    data = {name: value for name, value in item.items() if name not in ("type", "facility")}
+    form = FORMS[kind](data=data)
+    if not form.is_valid():
+        return None, {name: list(errors) for name, errors in form.errors.items()}
+    instance = form.instance
+    instance.facility_id = facility_pk
+    if kind == "issue" and user is not None and user.is_authenticated:
+        instance.reported_by = user
+    return kind, instance
+
+
+def ingest(items, user=None):
+    """
+    Validate `items` and create the valid ones. Returns one result per item,
+    in order: {"index", "status": "created", "type", "id"} or
+    {"index", "status": "invalid", "errors"}.
+    """
+    facility_pks = {
+        pk for pk in (_facility_pk(item.get("facility")) for item in items if isinstance(item, dict))
+        if pk is not None
+    }
+    facilities = set(Facility.objects.filter(pk__in=facility_pks).values_list("pk", flat=True))
+
+    results = []
+    pending = {kind: [] for kind in FORMS}
+    for index, item in enumerate(items):
+        kind, outcome = validate(item, facilities, user)
+        if kind is None:
+            results.append({"index": index, "status": "invalid", "errors": outcome})
+        else:
+            result = {"index": index, "status": "created", "type": kind, "id": None}
+            results.append(result)
+            pending[kind].append((result, outcome))
+
+    with transaction.atomic():
+        for kind, entries in pending.items():
+            if not entries:
+                continue
+            model = FORMS[kind]._meta.model
+            created = model.objects.bulk_create([instance for _, instance in entries], batch_size=BATCH_SIZE)
+            for (result, _), instance in zip(entries, created):
+                result["id"] = instance.pk
+            bulk_saved.send(sender=model, pks=[instance.pk for instance in created], created=True)
+    return results
@@ -0,0 +1,265 @@
+"""
+Benchmarks of the clinic pages and of import_health_land.
+
+run() requests every URL in clinic.urls a number of times through the test
+client, as a logged-in superuser, and records p50 / p95 latency and the
+number of queries per request; then it imports a generated workbook and
+records rows per second. Latencies are in-process (URL resolving,
+middleware, view, template), without a web server or network in front.
+
+run() commits like production does, so on_commit work (counter updates,
+cache version bumps) is part of the timings. It is meant for a scratch
+database: the benchmark command migrates and seeds one with
+scratch_database() and seeding.seed(), and drops it afterwards. Pages are
+cached in a cache of their own (private_cache()), so --cold-cache never
+empties the cache the running site uses. Results are plain dicts, saved as
+JSON by the benchmark command so runs on different commits can be compared.
+"""
+import math
+import os
+import random
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import Workbook
+
+from . import api, urls
+from .caching import get_cache
+from .models import Facility, ImportRun, Issue, Job, LandRecord, StoredBlob
+from .seeding import PLACES, SUBCOUNTIES
+
+# Not requested: GET logs the client out.
+SKIP = {"logout"}
+# Query strings for pages that need one to do any work.
+QUERIES = {
+    "search": "q=kiambu",
+    "search_api": "q=kiambu",
+    "facility_nearby_api": "lat=-1.0&lon=36.9&k=5",
+    "land_analytics_api": "group_by=subcounty",
+}
+# Models of the <pk> of views that do not say.
+MODELS = {"api_job_status": Job, "api_import_status": ImportRun}
+IMPORT_COLUMNS = [
+    "No", "Health Facility Name", "Sub County", "Ward", "Village",
+    "Land size (acres)", "Land use", "Disputed/ Undisputed",
+]
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def _model_for(pattern):
+    view = pattern.callback
+    initkwargs = getattr(view, "view_initkwargs", {})
+    if "resource_name" in initkwargs:
+        return api.RESOURCES[initkwargs["resource_name"]].model
+    view_class = getattr(view, "view_class", None)
+    return initkwargs.get("model") or getattr(view_class, "model", None) or MODELS.get(pattern.name)
+
+
+def _sample_kwargs(pattern):
+    """URL kwargs pointing at an existing row, or None if there is none."""
+    kwargs = {}
+    for name in pattern.pattern.converters:
+        if name == "pk":
+            model = _model_for(pattern)
+            value = model.objects.order_by("pk").values_list("pk", flat=True).first() if model else None
+        elif name == "facility_pk":
+            value = Facility.objects.order_by("pk").values_list("pk", flat=True).first()
+        elif name == "sha256":
+            value = StoredBlob.objects.order_by("pk").values_list("sha256", flat=True).first()
+        else:
+            value = None
+        if value is None:
+            return None
+        kwargs[name] = value
+    return kwargs
+
+
+def url_targets():
+    """(name, url) for every named URL in clinic.urls, or (name, None) if it cannot be filled in."""
+    targets = []
+    for pattern in urls.urlpatterns:
+        if not pattern.name or pattern.name in SKIP:
+            continue
+        kwargs = _sample_kwargs(pattern)
+        if kwargs is None:
+            targets.append((pattern.name, None))
+            continue
+        url = reverse(f"{urls.app_name}:{pattern.name}", kwargs=kwargs or None)
+        query = QUERIES.get(pattern.name)
+        targets.append((pattern.name, f"{url}?{query}" if query else url))
+    return targets
+
+
+def time_url(client, url, repeat, warmup=1, before=None):
+    """Latency and query count of GET url; `before()` is called ahead of every timed request."""
+    for _ in range(warmup):
+        client.get(url)
+    timings, queries, status = [], [], None
+    for _ in range(repeat):
+        if before:
+            before()
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = client.get(url)
+            if getattr(response, "streaming", False):
+                b"".join(response.streaming_content)
+            timings.append((time.perf_counter() - started) * 1000)
+        queries.append(len(captured.captured_queries))
+        status = response.status_code
+    return {
+        "status": status,
+        "p50_ms": round(percentile(timings, 0.50), 2),
+        "p95_ms": round(percentile(timings, 0.95), 2),
+        "mean_ms": round(sum(timings) / len(timings), 2),
+        "queries": percentile(queries, 0.50),
+    }
+
+
+def write_workbook(path, rows, facilities=200, seed_value=0):
+    """An import_health_land workbook of `rows` land rows spread over `facilities` facilities."""
+    rng = random.Random(seed_value)
+    book = Workbook(write_only=True)
+    sheet = book.create_sheet()
+    sheet.append(IMPORT_COLUMNS)
+    names = []
+    for index in range(facilities):
+        subcounty = rng.choice(list(SUBCOUNTIES))
+        names.append((f"Benchmark {rng.choice(PLACES)} Dispensary {index}", subcounty, rng.choice(SUBCOUNTIES[subcounty])))
+    for number in range(1, rows + 1):
+        name, subcounty, ward = names[number % facilities]
+        sheet.append([
+            number, name, subcounty, ward, rng.choice(PLACES), round(rng.uniform(0.1, 25), 2),
+            "Health facility", "Disputed" if rng.random() < 0.15 else "Undisputed",
+        ])
+    book.save(path)
+
+
+def time_import(rows, batch_size=None):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "benchmark.xlsx")
+        write_workbook(path, rows)
+        options = {"batch_size": batch_size} if batch_size else {}
+        started = time.perf_counter()
+        call_command("import_health_land", file=[path], workers=1, stdout=StringIO(), **options)
+        seconds = time.perf_counter() - started
+    return {"rows": rows, "seconds": round(seconds, 3), "rows_per_second": round(rows / seconds, 1)}
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@contextmanager
+def scratch_database():
+    """
+    Point the default connection at a new, migrated database, as the test
+    runner does, and drop it on the way out. SQLite gets a file rather
+    than the test runner's in-memory database, so timings include disk I/O.
+    """
+    settings_dict = connection.settings_dict
+    old_name, old_test = settings_dict["NAME"], dict(settings_dict["TEST"])
+    with tempfile.TemporaryDirectory() as directory:
+        if connection.vendor == "sqlite":
+            settings_dict["TEST"]["NAME"] = os.path.join(directory, "benchmark.sqlite3")
+        else:
+            settings_dict["TEST"]["NAME"] = f"benchmark_{old_name}"
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            settings_dict["TEST"] = old_test
+
+
+@contextmanager
+def private_cache():
+    """
+    Serve the page cache from a cache of its own: a file-based cache gets a
+    temporary directory, any other backend (whose clear() could empty a
+    shared server) a local-memory cache.
+    """
+    alias = getattr(settings, "CLINIC_CACHE_ALIAS", "default")
+    config = settings.CACHES[alias]
+    with tempfile.TemporaryDirectory() as directory:
+        if config["BACKEND"].endswith("FileBasedCache"):
+            config = {**config, "LOCATION": directory}
+        else:
+            config = {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": directory}
+        with override_settings(CACHES={**settings.CACHES, "benchmark": config}, CLINIC_CACHE_ALIAS="benchmark"):
+            yield
+
+
+def run(repeat=10, warmup=1, import_rows=2000, names=None, cold_cache=False):
+    """
+    Benchmark results as a dict. `names` limits the pages to those URL
+    names; with `cold_cache` the page cache is emptied before every request.
+    Writes to the database (a superuser, the imported rows): use a scratch
+    database.
+    """
+    results = {
+        "commit": git_commit(),
+        "created_at": timezone.now().isoformat(),
+        "database": getattr(settings, "DATABASE_PROFILE", connection.vendor),
+        "repeat": repeat,
+        "cold_cache": cold_cache,
+        "rows": {
+            "facilities": Facility.objects.count(),
+            "land_records": LandRecord.objects.count(),
+            "issues": Issue.objects.count(),
+        },
+        "urls": [],
+        "import": None,
+    }
+    with private_cache():
+        user = User.objects.create_superuser("benchmark", password=None)
+        client = Client(raise_request_exception=False)
+        client.force_login(user)
+        with override_settings(ALLOWED_HOSTS=["*"]):
+            for name, url in url_targets():
+                if names and name not in names:
+                    continue
+                if url is None:
+                    results["urls"].append({"name": name, "url": None, "skipped": "no row to point at"})
+                    continue
+                timing = time_url(client, url, repeat, warmup, before=get_cache().clear if cold_cache else None)
+                results["urls"].append({"name": name, "url": url, **timing})
+        if import_rows:
+            results["import"] = time_import(import_rows)
+    return results
+
+
+def compare(previous, current):
+    """Rows of (name, url, p50 before, p50 now, p95 before, p95 now, queries before, queries now)."""
+    before = {(row["name"], row["url"]): row for row in previous.get("urls", []) if row.get("url")}
+    rows = []
+    for row in current["urls"]:
+        old = before.get((row["name"], row.get("url")))
+        if row.get("url") is None or old is None:
+            continue
+        rows.append((
+            row["name"], row["url"], old["p50_ms"], row["p50_ms"],
+            old["p95_ms"], row["p95_ms"], old["queries"], row["queries"],
+        ))
+    return rows
@@ -0,0 +1,202 @@
+"""
+Reference counting and serving of land document blobs (see clinic.storage).
+
+Every land record pointing at a stored file holds one reference on its
+StoredBlob row; clinic.signals adds and releases them as records are
+created, re-pointed and deleted. The file is deleted, after commit, when
+the last reference goes.
+
+Downloads are addressed by hash, so their content never changes: they are
+served with the hash as ETag, a year-long Cache-Control, and single byte
+ranges (Range / If-Range) streamed from disk in chunks.
+"""
+import mimetypes
+import os
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+
+from . import jobs
+from .models import LandRecord, StoredBlob
+from .storage import blob_hash
+
+CHUNK_SIZE = 64 * 1024
+MAX_AGE = 365 * 24 * 60 * 60
+
+
+def tracked_fields(model):
+    """Fields whose previous values the reference counts depend on."""
+    return ["document"] if model is LandRecord else []
+
+
+def get_storage():
+    return LandRecord._meta.get_field("document").storage
+
+
+def add_reference(name, count=1):
+    sha256 = blob_hash(name)
+    if not sha256:
+        return
+    if StoredBlob.objects.filter(sha256=sha256).update(ref_count=F("ref_count") + count):
+        return
+    try:
+        with transaction.atomic():
+            StoredBlob.objects.create(sha256=sha256, name=name, size=get_storage().size(name), ref_count=count)
+    except IntegrityError:
+        # Created concurrently since the UPDATE above.
+        StoredBlob.objects.filter(sha256=sha256).update(ref_count=F("ref_count") + count)
+    else:
+        jobs.enqueue("process_document", {"sha256": sha256})
+
+
+def release(name, count=1):
+    """Drop `count` references; the last one deletes the row and, after commit, the file."""
+    sha256 = blob_hash(name)
+    if not sha256:
+        return
+    with transaction.atomic():
+        blob = StoredBlob.objects.select_for_update().filter(sha256=sha256).first()
+        if blob is None:
+            return
+        if blob.ref_count > count:
+            StoredBlob.objects.filter(pk=blob.pk).update(ref_count=F("ref_count") - count)
+            return
+        blob.delete()
+    names = [name, blob.thumbnail] if blob.thumbnail else [name]
+    transaction.on_commit(lambda: _delete_unreferenced(sha256, names))
+
+
+def _delete_unreferenced(sha256, names):
+    # The same content may have been uploaded again in the meantime.
+    if not StoredBlob.objects.filter(sha256=sha256).exists():
+        for name in names:
+            get_storage().delete(name)
+
+
+def store_legacy_documents():
+    """
+    Move documents saved under their original names into the hashed storage
+    and point their records at the blobs. Returns the number of records moved.
+    Reference counts are not touched; run recount() afterwards.
+    """
+    storage = get_storage()
+    moved, old_names = 0, set()
+    records = LandRecord.objects.exclude(document="").exclude(document=None).values_list("pk", "document")
+    for pk, name in records.iterator():
+        if blob_hash(name) or not storage.exists(name):
+            continue
+        with storage.open(name, "rb") as handle:
+            new_name = storage.save(name, handle)
+        LandRecord.objects.filter(pk=pk).update(document=new_name)
+        old_names.add(name)
+        moved += 1
+    for name in old_names:
+        storage.delete(name)
+    return moved
+
+
+@transaction.atomic
+def recount(delete_unreferenced=True):
+    """
+    Rebuild StoredBlob from the records' documents and delete blob files no
+    record refers to (unless delete_unreferenced is False). Returns (blobs
+    referenced, files deleted).
+    """
+    references = {}
+    counted = (
+        LandRecord.objects.exclude(document="").exclude(document=None)
+        .values_list("document").annotate(n=Count("pk")).order_by()
+    )
+    for name, n in counted:
+        sha256 = blob_hash(name)
+        if sha256:
+            references[sha256] = (name, references.get(sha256, ("", 0))[1] + n)
+
+    storage = get_storage()
+    StoredBlob.objects.exclude(sha256__in=list(references)).delete()
+    existing = set(StoredBlob.objects.values_list("sha256", flat=True))
+    for sha256, (name, n) in references.items():
+        if sha256 in existing:
+            StoredBlob.objects.filter(sha256=sha256).update(ref_count=n)
+        elif storage.exists(name):
+            StoredBlob.objects.create(sha256=sha256, name=name, size=storage.size(name), ref_count=n)
+            jobs.enqueue("process_document", {"sha256": sha256})
+
+    deleted = 0
+    upload_to = LandRecord._meta.get_field("document").upload_to.strip("/")
+    if delete_unreferenced and storage.exists(upload_to):
+        for prefix in storage.listdir(upload_to)[0]:
+            for filename in storage.listdir(f"{upload_to}/{prefix}")[1]:
+                sha256 = blob_hash(f"{prefix}/{filename}")
+                if sha256 and sha256 not in references:
+                    storage.delete(f"{upload_to}/{prefix}/{filename}")
+                    deleted += 1
+    return len(references), deleted
+
+
+def parse_range(header, size):
+    """
+    (start, end), inclusive, of a single "bytes=" range, or None for no
+    range or several (the whole file is sent then). ValueError if the range
+    cannot be satisfied.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        else:
+            start, end = max(size - int(last), 0), size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+def _read(handle, start, length):
+    with handle:
+        handle.seek(start)
+        while length > 0:
+            chunk = handle.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def serve(request, blob):
+    """Response for a GET of `blob`: 200, 206, 304 or 416."""
+    etag = f'"{blob.sha256}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"private, max-age={MAX_AGE}, immutable",
+        "Accept-Ranges": "bytes",
+    }
+    if etag in request.headers.get("If-None-Match", ""):
+        return HttpResponseNotModified(headers=headers)
+
+    content_type = mimetypes.guess_type(blob.name)[0] or "application/octet-stream"
+    header = request.headers.get("Range")
+    if request.headers.get("If-Range", etag) != etag:
+        header = None
+    try:
+        byte_range = parse_range(header, blob.size)
+    except ValueError:
+        return HttpResponse(status=416, headers={**headers, "Content-Range": f"bytes */{blob.size}"})
+
+    handle = get_storage().open(blob.name, "rb")
+    if byte_range is None:
+        # FileResponse lets the server use sendfile where it can.
+        response = FileResponse(handle, content_type=content_type, filename=os.path.basename(blob.name))
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(_read(handle, start, end - start + 1), status=206, content_type=content_type)
+        response["Content-Length"] = end - start + 1
+        response["Content-Range"] = f"bytes {start}-{end}/{blob.size}"
+    for name, value in headers.items():
+        response[name] = value
+    return response
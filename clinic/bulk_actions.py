@@ -0,0 +1,83 @@
+"""
+Set-based bulk edits of issues and land records.
+
+An action sets one field on a selection of rows with a single UPDATE in one
+transaction. The derived data (counters, rollups, search, page cache,
+change feed) is brought up to date once for the whole selection through
+bulk_saving / bulk_saved, as for the importer, instead of once per row.
+
+Deletes work the same way: delete_rows() deletes a queryset in batches,
+sending bulk_deleting / bulk_deleted around each batch with the per-row
+post_delete receivers silenced. Deleting facilities deletes their land
+records and issues first, as batches of their own.
+"""
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Facility, Issue, LandRecord
+from .signals import bulk_deleted, bulk_deleting, bulk_saved, bulk_saving, deleting_in_bulk
+
+MAX_ROWS = 1000
+DELETE_BATCH_SIZE = 500
+
+# model -> fields an action may set
+ACTIONS = {
+    Issue: ("status", "facility"),
+    LandRecord: ("survey_status", "dispute_status", "facility"),
+}
+
+
+def clean_value(model, field_name, value):
+    """The value to store, checked against the field; ValidationError if it is not allowed."""
+    if field_name not in ACTIONS[model]:
+        raise ValidationError(f"{field_name} cannot be changed in bulk.")
+    field = model._meta.get_field(field_name)
+    if field_name == "facility":
+        try:
+            pk = int(value)
+        except (TypeError, ValueError):
+            raise ValidationError("Choose a facility.")
+        if not Facility.objects.filter(pk=pk).exists():
+            raise ValidationError("Unknown facility.")
+        return pk
+    return field.clean(value, None)
+
+
+def apply(model, pks, field_name, value):
+    """Set `field_name` to `value` on the rows with `pks`. Returns the number of rows changed."""
+    pks = {int(pk) for pk in pks}
+    if not pks:
+        return 0
+    if len(pks) > MAX_ROWS:
+        raise ValidationError(f"At most {MAX_ROWS} rows at a time.")
+    value = clean_value(model, field_name, value)
+    column = model._meta.get_field(field_name).attname
+
+    with transaction.atomic():
+        # Only rows that actually change, so nothing is re-counted or re-numbered for nothing.
+        selected = model.objects.filter(pk__in=pks).exclude(**{column: value})
+        changed = list(selected.values_list("pk", flat=True))
+        if not changed:
+            return 0
+        bulk_saving.send(sender=model, pks=changed)
+        model.objects.filter(pk__in=changed).update(**{column: value, "updated_at": timezone.now()})
+        bulk_saved.send(sender=model, pks=changed, created=False)
+    return len(changed)
+
+
+def delete_rows(queryset, batch_size=DELETE_BATCH_SIZE):
+    """Delete the rows of `queryset` (facilities, land records or issues). Returns the number deleted."""
+    model = queryset.model
+    pks = list(queryset.order_by().values_list("pk", flat=True))
+    with transaction.atomic():
+        for start in range(0, len(pks), batch_size):
+            batch = pks[start:start + batch_size]
+            if model is Facility:
+                for child in (LandRecord, Issue):
+                    delete_rows(child.objects.filter(facility_id__in=batch), batch_size)
+            bulk_deleting.send(sender=model, pks=batch)
+            with deleting_in_bulk():
+                model.objects.filter(pk__in=batch).delete()
+            bulk_deleted.send(sender=model, pks=batch)
+    return len(pks)
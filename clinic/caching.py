@@ -0,0 +1,191 @@
+"""
+Versioned page cache.
+
+Cached pages are keyed on the request (path, query string, user, CSRF
+cookie) plus the current version numbers of the data they show: one
+version per model, and one per facility for the facility detail page.
+clinic.signals bumps the versions whenever a row is saved or deleted, so
+the next request builds a new key and misses; nothing is ever served stale
+and entries never need deleting, they just age out of the cache.
+
+The parcels and issues sections of the facility detail page are also
+cached as template fragments under the facility's version ({% cache %}
+with facility_fragment_context()), shared by every user. A page miss (another
+user, a new CSRF cookie, pending messages, the shorter page timeout) then
+re-renders only the header and the forms, without the section queries.
+
+Versions live in the cache next to the pages. Invalidation across
+processes therefore needs a shared backend (file-based, memcached, redis);
+with the local-memory backend each process keeps its own versions, which
+is only right for a single process (the clinic.E001 startup check fails
+otherwise). A bump writes a new, unique version rather than incrementing
+the old one, so it needs no atomic incr: the file-based backend's is a
+read-modify-write that two processes could both apply to the same value.
+
+Hits and misses are counted in memory by each process, like the request
+histograms of clinic.perf, so counting costs no cache write per request.
+"""
+import hashlib
+import secrets
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+
+PAGE_TIMEOUT = 600
+# Fragments are keyed on versions, so they can live longer than pages.
+FRAGMENT_TIMEOUT = 3600
+# Bulk writes touching more facilities than this bump every facility page
+# at once (through FACILITY_EPOCH) instead of one version per facility.
+MAX_FACILITY_BUMPS = 100
+FACILITY_EPOCH = "clinic:v:facility-pages"
+CACHED_HEADERS = ("Content-Type", "Content-Language")
+
+
+def get_cache():
+    return caches[getattr(settings, "CLINIC_CACHE_ALIAS", "default")]
+
+
+def model_key(model):
+    return f"clinic:v:{model._meta.label_lower}"
+
+
+def facility_key(pk):
+    return f"clinic:v:facility:{pk}"
+
+
+def _new_version():
+    # From the clock plus random bits, so a version key that was evicted, or
+    # bumped by two processes at once, never ends up with a value that old
+    # pages were stored under.
+    return f"{time.time_ns():x}-{secrets.token_hex(4)}"
+
+
+def _bump(keys):
+    get_cache().set_many({key: _new_version() for key in keys}, None)
+
+
+def bump(keys):
+    """
+    Move `keys` to new versions once the current transaction commits; a
+    bump before that would let a request cache the uncommitted old rows
+    under the new version.
+    """
+    keys = list(keys)
+    transaction.on_commit(lambda: _bump(keys))
+
+
+def bump_facilities(pks):
+    pks = set(pks)
+    if len(pks) > MAX_FACILITY_BUMPS:
+        bump([FACILITY_EPOCH])
+    else:
+        bump(facility_key(pk) for pk in pks)
+
+
+def versions(keys):
+    """Current versions of `keys`, initialising any that are missing."""
+    cache = get_cache()
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, _new_version(), None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def facility_fragment_context(pk):
+    """Template context for {% cache %} blocks showing a facility's land records or issues."""
+    return {
+        "fragment_cache": getattr(settings, "CLINIC_CACHE_ALIAS", "default"),
+        "fragment_timeout": FRAGMENT_TIMEOUT,
+        "fragment_version": ".".join(map(str, versions([FACILITY_EPOCH, facility_key(pk)]))),
+    }
+
+
+_counts = Counter()
+_lock = threading.Lock()
+
+
+def _count(outcome):
+    with _lock:
+        _counts[outcome] += 1
+
+
+def stats():
+    """Page cache hits and misses served by this process since it started."""
+    with _lock:
+        return {"hits": _counts["hits"], "misses": _counts["misses"]}
+
+
+def page_key(request, version_keys):
+    csrf = request.COOKIES.get(settings.CSRF_COOKIE_NAME, "")
+    parts = [
+        request.path,
+        request.GET.urlencode(),
+        str(request.user.pk),
+        csrf,
+        *map(str, versions(version_keys)),
+    ]
+    return "clinic:page:" + hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+
+def is_cacheable(request):
+    # Pending messages are shown once by the page that renders them.
+    return request.method in ("GET", "HEAD") and not len(get_messages(request))
+
+
+class CachedPageMixin:
+    """
+    Cache the rendered page of a GET view. `cache_models` are the models
+    whose rows the page shows; `cache_facility_kwarg` names the URL kwarg
+    with the pk of the facility a page is about. Responses carry an X-Cache
+    header saying whether they were served from the cache.
+    """
+
+    cache_models = ()
+    cache_facility_kwarg = None
+    cache_timeout = PAGE_TIMEOUT
+
+    def get_version_keys(self):
+        keys = [model_key(model) for model in self.cache_models]
+        if self.cache_facility_kwarg:
+            keys += [FACILITY_EPOCH, facility_key(self.kwargs[self.cache_facility_kwarg])]
+        return keys
+
+    def dispatch(self, request, *args, **kwargs):
+        if not is_cacheable(request):
+            return super().dispatch(request, *args, **kwargs)
+
+        cache = get_cache()
+        key = page_key(request, self.get_version_keys())
+        cached = cache.get(key)
+        if cached is not None:
+            _count("hits")
+            content, status, headers, uses_csrf = cached
+            if uses_csrf:
+                # Keep renewing the CSRF cookie the page's forms rely on.
+                get_token(request)
+            response = HttpResponse(content, status=status, headers=headers)
+            response["X-Cache"] = "hit"
+            return response
+
+        _count("misses")
+        response = super().dispatch(request, *args, **kwargs)
+        if hasattr(response, "render"):
+            response.render()
+        uses_csrf = bool(request.META.get("CSRF_COOKIE_NEEDS_UPDATE"))
+        # Without a CSRF cookie in the request a page with a form holds a token
+        # for a brand new cookie, so it cannot be reused.
+        has_cookie = settings.CSRF_COOKIE_NAME in request.COOKIES
+        if response.status_code == 200 and (has_cookie or not uses_csrf):
+            headers = {name: response[name] for name in CACHED_HEADERS if response.has_header(name)}
+            cache.set(key, (response.content, response.status_code, headers, uses_csrf), self.cache_timeout)
+        response["X-Cache"] = "miss"
+        return response
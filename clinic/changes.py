@@ -0,0 +1,128 @@
+"""
+Change feed for offline devices.
+
+Every write gives the row it touches the next number from ChangeSequence,
+in its change_seq column; a delete leaves a Tombstone with its own number
+(rows deleted together share one).
+A device keeps the token of the last change it has seen and asks for what
+came after it, so a sync transfers the rows changed since then (each once,
+in its latest state) plus the ids deleted, however large the tables are.
+
+Numbers are allocated inside the writing transaction, and the counter row
+stays locked until it commits, so a change with a lower number is never
+committed after one with a higher number has been read. That holds as long
+as each write and its allocation share a transaction: saves of the tracked
+models are atomic (ChangeTrackedMixin), deletes always are, and the bulk
+writers run in their own transactions.
+
+Bulk writes number a whole batch with one value; ties are broken by kind
+and pk, which are part of the token.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import ChangeSequence, Facility, Issue, LandRecord, Tombstone
+from .pagination import decode_cursor, encode_cursor
+
+COUNTER_PK = 1
+PK_CHUNK = 500
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 2000
+
+# Feed order within one change_seq: kind code, then pk.
+KIND_CODES = {"facility": 1, "landrecord": 2, "issue": 3, "deleted": 4}
+KIND_MODELS = {"facility": Facility, "landrecord": LandRecord, "issue": Issue}
+MODEL_KINDS = {model: kind for kind, model in KIND_MODELS.items()}
+
+
+def allocate():
+    """The next change sequence number (locks the counter until commit)."""
+    with transaction.atomic():
+        if not ChangeSequence.objects.filter(pk=COUNTER_PK).update(value=F("value") + 1):
+            try:
+                with transaction.atomic():
+                    ChangeSequence.objects.create(pk=COUNTER_PK, value=1)
+            except IntegrityError:
+                # Created concurrently since the UPDATE above.
+                ChangeSequence.objects.filter(pk=COUNTER_PK).update(value=F("value") + 1)
+        return ChangeSequence.objects.filter(pk=COUNTER_PK).values_list("value", flat=True).get()
+
+
+def mark_changed(model, pks):
+    """Give rows written in bulk one new sequence number (and updated_at)."""
+    pks = list(pks)
+    if not pks:
+        return
+    seq = allocate()
+    now = timezone.now()
+    for start in range(0, len(pks), PK_CHUNK):
+        model.objects.filter(pk__in=pks[start:start + PK_CHUNK]).update(change_seq=seq, updated_at=now)
+
+
+def record_deletions(model, pks):
+    """Leave tombstones for rows deleted together, all under one new sequence number."""
+    pks = list(pks)
+    if not pks:
+        return
+    seq = allocate()
+    kind = MODEL_KINDS[model]
+    Tombstone.objects.bulk_create(
+        [Tombstone(kind=kind, object_id=pk, change_seq=seq) for pk in pks], batch_size=PK_CHUNK
+    )
+
+
+def _after(position, kind):
+    """Filter for rows of `kind` after `position` = (seq, kind code, pk) in feed order."""
+    seq, code, pk = position
+    own = KIND_CODES[kind]
+    if own < code:
+        return Q(change_seq__gt=seq)
+    if own > code:
+        return Q(change_seq__gte=seq)
+    return Q(change_seq__gt=seq) | Q(change_seq=seq, pk__gt=pk)
+
+
+def decode_token(token):
+    """(seq, kind code, pk) from a token; ValueError if it is garbled."""
+    if not token:
+        return (-1, 0, 0)
+    values, _ = decode_cursor(token)
+    if len(values) != 3 or not all(isinstance(value, int) for value in values):
+        raise ValueError("Invalid token")
+    return tuple(values)
+
+
+def changes_since(token=None, fields=None, limit=DEFAULT_LIMIT):
+    """
+    The first `limit` changes after `token` (all rows for no token), as
+    {"facility": [...], "landrecord": [...], "issue": [...],
+     "deleted": {kind: [ids]}, "next": token, "has_more": bool}.
+    `fields` maps kind to the fields to send (default: every field).
+    """
+    position = decode_token(token)
+    entries = []
+    for kind, model in KIND_MODELS.items():
+        names = list((fields or {}).get(kind) or [f.attname for f in model._meta.concrete_fields])
+        names = ["id" if name == model._meta.pk.attname else name for name in names]
+        queryset = model.objects.filter(_after(position, kind)).order_by("change_seq", "pk")
+        for row in queryset.values(*names, "change_seq")[: limit + 1]:
+            entries.append(((row["change_seq"], KIND_CODES[kind], row["id"]), kind, row))
+    tombstones = Tombstone.objects.filter(_after(position, "deleted")).order_by("change_seq", "pk")
+    for tombstone in tombstones.values("id", "kind", "object_id", "change_seq")[: limit + 1]:
+        entries.append(((tombstone["change_seq"], KIND_CODES["deleted"], tombstone["id"]), "deleted", tombstone))
+
+    entries.sort(key=lambda entry: entry[0])
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    result = {kind: [] for kind in KIND_MODELS}
+    result["deleted"] = {kind: [] for kind in KIND_MODELS}
+    for _, kind, row in entries:
+        if kind == "deleted":
+            result["deleted"][row["kind"]].append(row["object_id"])
+        else:
+            result[kind].append(row)
+    result["next"] = encode_cursor(list(entries[-1][0])) if entries else (token or encode_cursor(list(position)))
+    result["has_more"] = has_more
+    return result
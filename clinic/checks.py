@@ -0,0 +1,60 @@
+"""
+Startup checks (manage.py check, runserver, migrate) for the database
+profile and the page cache.
+"""
+from django.conf import settings
+from django.core import checks
+from django.db import connections
+
+from clinic_project.database import SQLITE_JOURNAL_MODE, describe
+
+# Cache backends whose entries live in one process.
+PER_PROCESS_CACHES = ("django.core.cache.backends.locmem.LocMemCache",)
+
+
+@checks.register()
+def database_profile(app_configs, **kwargs):
+    """Say which database profile is active."""
+    profile = getattr(settings, "DATABASE_PROFILE", "custom")
+    return [checks.Info(describe(profile, settings.DATABASES["default"]), id="clinic.I001")]
+
+
+@checks.register(checks.Tags.database)
+def sqlite_journal_mode(app_configs, databases=None, **kwargs):
+    """Warn when a file-backed SQLite database is not actually in WAL mode."""
+    errors = []
+    for alias in databases or []:
+        connection = connections[alias]
+        if connection.vendor != "sqlite" or connection.is_in_memory_db():
+            continue
+        with connection.cursor() as cursor:
+            mode = cursor.execute("PRAGMA journal_mode").fetchone()[0]
+        if mode.lower() != SQLITE_JOURNAL_MODE:
+            errors.append(
+                checks.Warning(
+                    f"SQLite database '{alias}' uses journal_mode={mode}, not WAL.",
+                    hint="Readers will block the writer. clinic_project.database.enable_wal "
+                    "switches the mode when a connection opens; is the database file writable?",
+                    id="clinic.W001",
+                )
+            )
+    return errors
+
+
+@checks.register(checks.Tags.caches)
+def page_cache_backend(app_configs, **kwargs):
+    """Fail when several worker processes would each keep their own page cache versions."""
+    workers = getattr(settings, "WEB_CONCURRENCY", 1)
+    alias = getattr(settings, "CLINIC_CACHE_ALIAS", "default")
+    backend = settings.CACHES.get(alias, {}).get("BACKEND")
+    if workers > 1 and backend in PER_PROCESS_CACHES:
+        return [
+            checks.Error(
+                f"The page cache ('{alias}', {backend.rsplit('.', 1)[-1]}) is per process, "
+                f"but WEB_CONCURRENCY={workers} worker processes would serve it.",
+                hint="A save in one worker would leave the others serving stale pages; "
+                "use CACHE_BACKEND=file or another shared cache.",
+                id="clinic.E001",
+            )
+        ]
+    return []
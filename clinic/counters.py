@@ -0,0 +1,114 @@
+"""
+Dashboard counters.
+
+SummaryCounters holds the totals (and a few breakdowns) that the home page
+and dashboard show. Rather than counting the tables on every request, each
+write adjusts the single row by the difference it makes, with an
+UPDATE ... SET n = n + delta so concurrent writers do not lose increments.
+clinic.signals calls into this module on save, delete and bulk writes.
+
+reconcile() recounts everything and overwrites the row; it also creates the
+row the first time it is needed.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .models import Facility, Issue, LandRecord, SummaryCounters
+
+ROW_PK = 1
+PK_CHUNK = 500
+
+# counter -> (model, field, value): rows of `model` whose `field` equals
+# `value` are counted, or every row when field is None.
+COUNTERS = {
+    "facilities": (Facility, None, None),
+    "land_records": (LandRecord, None, None),
+    "disputed_land_records": (LandRecord, "dispute_status", "Disputed"),
+    "issues": (Issue, None, None),
+    "open_issues": (Issue, "status", "Open"),
+    "in_progress_issues": (Issue, "status", "In Progress"),
+    "closed_issues": (Issue, "status", "Closed"),
+}
+
+
+def counters_for(model):
+    return {name: (field, value) for name, (counted, field, value) in COUNTERS.items() if counted is model}
+
+
+def tracked_fields(model):
+    """Fields whose changes move a counter of `model`."""
+    return sorted({field for field, _ in counters_for(model).values() if field})
+
+
+def contribution(model, values):
+    """The counters one row adds, given its tracked field values (a dict)."""
+    return {
+        name: 1
+        for name, (field, value) in counters_for(model).items()
+        if field is None or values.get(field) == value
+    }
+
+
+def subtract(a, b):
+    return {name: a.get(name, 0) - b.get(name, 0) for name in a.keys() | b.keys()}
+
+
+def _aggregates(model):
+    return {
+        name: Count("pk", filter=Q(**{field: value}) if field else None)
+        for name, (field, value) in counters_for(model).items()
+    }
+
+
+def contribution_of_rows(model, pks):
+    """The counters the rows with these pks add, in one query per chunk."""
+    totals = {}
+    pks = list(pks)
+    for start in range(0, len(pks), PK_CHUNK):
+        queryset = model.objects.filter(pk__in=pks[start:start + PK_CHUNK])
+        for name, count in queryset.aggregate(**_aggregates(model)).items():
+            totals[name] = totals.get(name, 0) + count
+    return totals
+
+
+def apply(deltas):
+    """Add `deltas` ({counter: n}) to the counters row."""
+    deltas = {name: n for name, n in deltas.items() if n}
+    if not deltas:
+        return
+    updated = SummaryCounters.objects.filter(pk=ROW_PK).update(
+        updated_at=timezone.now(), **{name: F(name) + n for name, n in deltas.items()}
+    )
+    if not updated:
+        # No row yet: count from scratch, which already includes this change.
+        reconcile()
+
+
+def recount():
+    totals = {}
+    for model in (Facility, LandRecord, Issue):
+        totals.update(model.objects.aggregate(**_aggregates(model)))
+    return totals
+
+
+@transaction.atomic
+def reconcile():
+    """
+    Recount the tables and overwrite the counters row. Returns the row and
+    the drift that was corrected ({counter: stored - actual}, non-zero only).
+    """
+    totals = recount()
+    row = SummaryCounters.objects.select_for_update().filter(pk=ROW_PK).first()
+    if row is None:
+        return SummaryCounters.objects.create(pk=ROW_PK, **totals), {}
+    drift = {name: getattr(row, name) - n for name, n in totals.items() if getattr(row, name) != n}
+    for name, n in totals.items():
+        setattr(row, name, n)
+    row.save()
+    return row, drift
+
+
+def get_counters():
+    """The counters row, created on first use."""
+    return SummaryCounters.objects.filter(pk=ROW_PK).first() or reconcile()[0]
@@ -0,0 +1,106 @@
+"""
+Metadata, text and thumbnails of stored land documents.
+
+The process_document job (clinic.tasks) runs this once per distinct file,
+when its StoredBlob is created; records sharing a deed share the result.
+The PDF page count is read from the raw bytes in chunks; text extraction
+uses pypdf and image thumbnails Pillow, when those optional packages are
+installed.
+"""
+import mimetypes
+import re
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.utils import timezone
+
+try:
+    import pypdf
+except ImportError:  # optional
+    pypdf = None
+
+try:
+    from PIL import Image
+except ImportError:  # optional
+    Image = None
+
+CHUNK_SIZE = 1024 * 1024
+MAX_TEXT = 200_000
+THUMBNAIL_SIZE = (320, 320)
+THUMBNAIL_DIR = "land_documents/thumbnails"
+# "/Type /Page" but not "/Type /Pages" (the page tree nodes)
+PDF_PAGE = re.compile(rb"/Type\s*/Page(?![A-Za-z])")
+TAIL = 64  # longer than any PDF_PAGE match
+
+
+def pdf_page_count(handle):
+    """Count page objects in a PDF read chunk by chunk."""
+    count, tail, counted_to = 0, b"", 0
+    while True:
+        chunk = handle.read(CHUNK_SIZE)
+        buffer = tail + chunk
+        # Until the end of the file, leave the last byte for the lookahead.
+        limit = len(buffer) if not chunk else len(buffer) - 1
+        count += sum(1 for match in PDF_PAGE.finditer(buffer) if counted_to < match.end() <= limit)
+        if not chunk:
+            return count
+        tail = buffer[-TAIL:]
+        counted_to = limit - (len(buffer) - len(tail))
+
+
+def pdf_text(handle, report=None):
+    if pypdf is None:
+        return ""
+    reader = pypdf.PdfReader(handle)
+    parts, size = [], 0
+    for number, page in enumerate(reader.pages, 1):
+        text = page.extract_text() or ""
+        parts.append(text)
+        size += len(text)
+        if report:
+            report(number, len(reader.pages))
+        if size >= MAX_TEXT:
+            break
+    return "\n".join(parts)[:MAX_TEXT]
+
+
+def thumbnail(handle):
+    """PNG bytes of a thumbnail of an image document, or None."""
+    if Image is None:
+        return None
+    with Image.open(handle) as image:
+        image.thumbnail(THUMBNAIL_SIZE)
+        output = BytesIO()
+        image.convert("RGB").save(output, format="PNG")
+    return output.getvalue()
+
+
+def process(blob, storage, report=None):
+    """
+    Fill in the blob's content type, page count, text and thumbnail and
+    save it. `report(done, total)` is called as PDF pages are read.
+    """
+    content_type = mimetypes.guess_type(blob.name)[0] or "application/octet-stream"
+    blob.content_type = content_type
+    if content_type == "application/pdf":
+        with storage.open(blob.name, "rb") as handle:
+            blob.page_count = pdf_page_count(handle)
+        with storage.open(blob.name, "rb") as handle:
+            blob.text = pdf_text(handle, report)
+    elif content_type.startswith("text/"):
+        with storage.open(blob.name, "rb") as handle:
+            blob.text = handle.read(MAX_TEXT).decode("utf-8", "replace")
+    elif content_type.startswith("image/"):
+        blob.page_count = 1
+        with storage.open(blob.name, "rb") as handle:
+            png = thumbnail(handle)
+        if png:
+            blob.thumbnail = storage.save(f"{THUMBNAIL_DIR}/{blob.sha256}.png", ContentFile(png))
+    blob.processed_at = timezone.now()
+    blob.save(update_fields=["content_type", "page_count", "text", "thumbnail", "processed_at"])
+    return {
+        "content_type": blob.content_type,
+        "page_count": blob.page_count,
+        "text_length": len(blob.text),
+        "thumbnail": bool(blob.thumbnail),
+    }
@@ -0,0 +1,152 @@
+"""
+Query plans of the list and detail views.
+
+explain_views requests each page in VIEWS with the test client, captures
+the SELECTs it runs and asks the database for their plans, flagging full
+table scans (and, on SQLite, sorts that no index provides). Pages are
+rendered with an empty private page cache, so every request runs its
+queries.
+"""
+import re
+from dataclasses import dataclass, field
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from .models import Facility, Issue, LandRecord
+
+# (url name, kwargs from the sample objects, query string)
+VIEWS = [
+    ("clinic:home", None, ""),
+    ("clinic:admin_dashboard", None, ""),
+    ("clinic:facility_list", None, ""),
+    ("clinic:facility_list", None, "search=kiambu"),
+    ("clinic:facility_detail", "facility", ""),
+    ("clinic:landrecord_list", None, ""),
+    ("clinic:landrecord_list", None, "parcel=KIAMBU"),
+    ("clinic:issue_list", None, ""),
+    ("clinic:api_facility_list", None, "subcounty=Ruiru"),
+    ("clinic:api_facility_list", None, "subcounty=Ruiru&ward=Kiuu"),
+    ("clinic:api_facility_list", None, "facility_type=Hospital"),
+    ("clinic:api_facility_detail", "facility", "include=land_records,issues"),
+    ("clinic:api_landrecord_detail", "landrecord", "include=facility"),
+    ("clinic:api_landrecord_list", None, "dispute_status=Disputed"),
+    ("clinic:api_landrecord_list", "facility_filter", ""),
+    ("clinic:api_issue_detail", "issue", "include=facility"),
+    ("clinic:api_issue_list", None, "status=Open"),
+    ("clinic:api_issue_list", "facility_filter", ""),
+    ("clinic:api_sync", None, ""),
+    ("clinic:land_analytics_api", None, "group_by=subcounty"),
+]
+
+# Single-row tables and the rollup table, which is small by design and read
+# whole to group. Substring (icontains) searches are not flagged either: no
+# B-tree index can serve them (full-text search goes through clinic.search).
+EXPECTED_SCANS = {"clinic_summarycounters", "clinic_changesequence", "clinic_landrollup"}
+
+FULL_SCAN = [
+    re.compile(r"^SCAN (\w+)$"),  # SQLite, no index at all
+    re.compile(r"Seq Scan on (\w+)"),  # PostgreSQL
+    re.compile(r"Table scan on (\w+)"),  # MySQL
+]
+TEMP_SORT = re.compile(r"USE TEMP B-TREE FOR (ORDER|GROUP) BY")
+SUBSTRING = re.compile(r"LIKE '%", re.IGNORECASE)
+
+
+@dataclass
+class Plan:
+    sql: str
+    lines: list
+    scans: list = field(default_factory=list)
+    sorts: bool = False
+
+    @property
+    def flagged(self):
+        return bool(self.scans)
+
+
+@dataclass
+class Report:
+    url: str
+    status: int
+    plans: list
+
+    @property
+    def flagged(self):
+        return [plan for plan in self.plans if plan.flagged]
+
+
+def sample_kwargs():
+    """URL kwargs and filters pointing at real rows, per VIEWS kwargs name."""
+    facility = Facility.objects.filter(land_records__isnull=False).order_by("pk").first()
+    facility = facility or Facility.objects.order_by("pk").first()
+    record = LandRecord.objects.order_by("pk").first()
+    issue = Issue.objects.order_by("pk").first()
+    return {
+        "facility": {"pk": facility.pk} if facility else None,
+        "landrecord": {"pk": record.pk} if record else None,
+        "issue": {"pk": issue.pk} if issue else None,
+        "facility_filter": f"facility={facility.pk}" if facility else None,
+    }
+
+
+def plan_lines(sql):
+    prefix = connection.ops.explain_query_prefix()
+    with connection.cursor() as cursor:
+        cursor.execute(f"{prefix} {sql}")
+        rows = cursor.fetchall()
+    if connection.vendor == "sqlite":
+        # (id, parent, notused, detail); indent by depth
+        depth = {0: -1}
+        lines = []
+        for node, parent, _, detail in rows:
+            depth[node] = depth.get(parent, -1) + 1
+            lines.append("  " * depth[node] + detail)
+        return lines
+    return [" ".join(str(value) for value in row) for row in rows]
+
+
+def explain(sql):
+    lines = plan_lines(sql)
+    plan = Plan(sql, lines)
+    for line in lines:
+        for pattern in FULL_SCAN:
+            match = pattern.search(line.strip())
+            if match and match.group(1) not in EXPECTED_SCANS:
+                plan.scans.append(match.group(1))
+        plan.sorts = plan.sorts or bool(TEMP_SORT.search(line))
+    if plan.scans and SUBSTRING.search(sql):
+        # a substring search has to read every row it might match
+        plan.scans = []
+    return plan
+
+
+def explain_views(views=VIEWS):
+    """A Report per page in `views`. Run inside a transaction that is rolled back."""
+    user = User.objects.create_superuser("explain-views", password=None)
+    client = Client(raise_request_exception=False)
+    client.force_login(user)
+    samples = sample_kwargs()
+    reports = []
+    empty_cache = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "explain-views"}
+    }
+    with override_settings(CACHES=empty_cache, CLINIC_CACHE_ALIAS="default", ALLOWED_HOSTS=["*"]):
+        for name, sample, query in views:
+            kwargs = samples.get(sample) if sample else None
+            if sample and kwargs is None:
+                continue
+            if isinstance(kwargs, str):
+                query, kwargs = kwargs, None
+            url = reverse(name, kwargs=kwargs) + (f"?{query}" if query else "")
+            with CaptureQueriesContext(connection) as captured:
+                response = client.get(url)
+            selects = dict.fromkeys(
+                query["sql"] for query in captured.captured_queries
+                if query["sql"].lstrip().upper().startswith("SELECT")
+            )
+            reports.append(Report(url, response.status_code, [explain(sql) for sql in selects]))
+    return reports
@@ -0,0 +1,112 @@
+"""
+Streaming exports of the land record register.
+
+Rows are read with values_list(...).iterator(), so only one chunk of plain
+tuples is in memory at a time, with the facility's locality columns
+joined in the same query. CSV is produced line by line for a
+StreamingHttpResponse (the header goes out before the first query runs);
+XLSX goes through openpyxl's write-only mode, which spools rows to a
+temporary file instead of building the sheet in memory.
+"""
+import csv
+
+from openpyxl import Workbook
+
+from .models import LandRecord
+
+CHUNK_SIZE = 2000
+
+# (header, field) pairs, in column order.
+COLUMNS = [
+    ("Land record ID", "pk"),
+    ("Facility", "facility__name"),
+    ("Location", "facility__location"),
+    ("Subcounty", "facility__subcounty"),
+    ("Ward", "facility__ward"),
+    ("Facility type", "facility__facility_type"),
+    ("Longitude", "facility__gps_x"),
+    ("Latitude", "facility__gps_y"),
+    ("Parcel number", "parcel_number"),
+    ("Owner", "owner"),
+    ("Acreage", "acreage"),
+    ("Ownership status", "ownership_status"),
+    ("Land use", "land_use"),
+    ("Document type", "document_type"),
+    ("Proprietorship", "proprietorship"),
+    ("Dispute status", "dispute_status"),
+    ("Planning status", "planning_status"),
+    ("Surveyed", "survey_status"),
+    ("Acquisition date", "acquisition_date"),
+    ("Registration date", "registration_date"),
+    ("Encumbrances", "encumbrances"),
+    ("Acquisition amount", "acquisition_amount"),
+    ("Fair value", "fair_value"),
+    ("Disposal date", "disposal_date"),
+    ("Disposal value", "disposal_value"),
+    ("Annual rental income", "annual_rental_income"),
+    ("Created", "created_at"),
+]
+HEADERS = [header for header, _ in COLUMNS]
+# Positions of timezone-aware datetimes, which openpyxl refuses.
+DATETIME_COLUMNS = [index for index, (_, field) in enumerate(COLUMNS) if field == "created_at"]
+
+
+def filter_land_records(queryset, params):
+    """The land record list filters: ?search= (facility name) and ?parcel=."""
+    facility_search = params.get("search")
+    parcel_search = params.get("parcel")
+
+    if facility_search:
+        queryset = queryset.filter(facility__name__icontains=facility_search)
+
+    if parcel_search:
+        queryset = queryset.filter(parcel_number__icontains=parcel_search)
+
+    return queryset
+
+
+def export_rows(params=None, chunk_size=CHUNK_SIZE):
+    """Tuples of the COLUMNS values of the matching land records, in pk order."""
+    queryset = filter_land_records(LandRecord.objects.all(), params or {})
+    return queryset.values_list(*[field for _, field in COLUMNS]).order_by("pk").iterator(chunk_size=chunk_size)
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to csv.writer's caller."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(HEADERS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def write_csv(rows, file):
+    writer = csv.writer(file)
+    writer.writerow(HEADERS)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def write_xlsx(rows, file):
+    """Write the rows to `file` (path or binary file) as XLSX; return the row count."""
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Land records")
+    sheet.append(HEADERS)
+    count = 0
+    for row in rows:
+        row = list(row)
+        for index in DATETIME_COLUMNS:
+            if row[index] is not None:
+                row[index] = row[index].replace(tzinfo=None)
+        sheet.append(row)
+        count += 1
+    workbook.save(file)
+    return count
@@ -1,5 +1,5 @@
 from django import forms
-from .models import LandRecord, Facility, Issue
+from .models import LandRecord, Facility, Issue, ImportRun
 
 
 class LandRecordForm(forms.ModelForm):
@@ -34,4 +34,25 @@ class IssueForm(forms.ModelForm):
             'description': forms.Textarea(attrs={'class': 'form-control', 'rows': 3}),
             'remarks': forms.Textarea(attrs={'class': 'form-control', 'rows': 2}),
             'recommendation': forms.Textarea(attrs={'class': 'form-control', 'rows': 2}),
-        }
\ No newline at end of file
+        }
+
+
+class ImportRunForm(forms.ModelForm):
+    class Meta:
+        model = ImportRun
+        fields = ["workbook", "upsert", "retire", "fuzzy"]
+        widgets = {
+            "workbook": forms.ClearableFileInput(attrs={"accept": ".xlsx,.xlsm"}),
+        }
+
+    def clean_workbook(self):
+        workbook = self.cleaned_data["workbook"]
+        if not workbook.name.lower().endswith((".xlsx", ".xlsm")):
+            raise forms.ValidationError("Upload an Excel workbook (.xlsx or .xlsm).")
+        return workbook
+
+    def clean(self):
+        cleaned = super().clean()
+        if cleaned.get("retire") and not cleaned.get("upsert"):
+            self.add_error("retire", "Retiring missing records needs upsert.")
+        return cleaned
@@ -0,0 +1,124 @@
+"""
+Grid index for facility coordinates, without PostGIS.
+
+The map is cut into CELL_SIZE x CELL_SIZE degree cells numbered row by row,
+and every facility stores the number of its cell in the indexed geo_cell
+column. A bounding box covers a few runs of consecutive cell numbers (one
+per row of cells), so it becomes a handful of indexed range scans; the
+exact coordinates and, for radius queries, the great-circle distance are
+then checked on those candidates only.
+
+Coordinates follow the sheets: gps_x is the longitude, gps_y the latitude.
+"""
+import math
+
+from django.db.models import F, FloatField, Func, IntegerField, Q, Value
+from django.db.models.functions import ASin, Cast, Cos, Floor, Power, Radians, Sin, Sqrt
+
+CELL_SIZE = 0.01  # degrees, about 1.1 km at the equator
+COLUMNS = round(360 / CELL_SIZE)
+EARTH_RADIUS_KM = 6371.0088
+# Bounding boxes spanning more rows than this are not worth splitting into
+# cell ranges; only the coordinates are filtered.
+MAX_ROWS = 200
+
+
+def cell_for(lat, lon):
+    """Cell number of a point, or None when a coordinate is missing."""
+    if lat is None or lon is None:
+        return None
+    row = math.floor((lat + 90) / CELL_SIZE)
+    column = math.floor((lon + 180) / CELL_SIZE)
+    return row * COLUMNS + column
+
+
+def cell_expression():
+    """cell_for() as a database expression, for bulk updates."""
+    row = Floor((F("gps_y") + 90) / CELL_SIZE)
+    column = Floor((F("gps_x") + 180) / CELL_SIZE)
+    return Cast(row * COLUMNS + column, IntegerField())
+
+
+def bbox_filter(min_lat, min_lon, max_lat, max_lon):
+    """
+    Q for points inside the box: cell ranges (which use the index) and the
+    exact coordinate bounds. Boxes crossing the antimeridian are not
+    supported; longitudes are clamped to [-180, 180].
+    """
+    min_lat, max_lat = max(min_lat, -90), min(max_lat, 90)
+    min_lon, max_lon = max(min_lon, -180), min(max_lon, 180)
+    exact = Q(gps_y__gte=min_lat, gps_y__lte=max_lat, gps_x__gte=min_lon, gps_x__lte=max_lon)
+
+    # One cell of slack on every side: the database and Python may floor a
+    # point lying exactly on a cell edge differently.
+    first_row = math.floor((min_lat + 90) / CELL_SIZE) - 1
+    last_row = math.floor((max_lat + 90) / CELL_SIZE) + 1
+    first_column = max(math.floor((min_lon + 180) / CELL_SIZE) - 1, 0)
+    last_column = min(math.floor((max_lon + 180) / CELL_SIZE) + 1, COLUMNS - 1)
+    if last_row - first_row + 1 > MAX_ROWS:
+        return exact
+
+    cells = Q()
+    for row in range(first_row, last_row + 1):
+        cells |= Q(geo_cell__range=(row * COLUMNS + first_column, row * COLUMNS + last_column))
+    return cells & exact
+
+
+def radius_bbox(lat, lon, radius_km):
+    """(min_lat, min_lon, max_lat, max_lon) of a box containing the circle."""
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    # Widest longitude span is at the latitude nearest the pole.
+    polar_lat = min(abs(lat) + dlat, 90)
+    cos_lat = math.cos(math.radians(polar_lat))
+    dlon = 180 if cos_lat < 1e-9 else min(math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat)), 180)
+    return lat - dlat, lon - dlon, lat + dlat, lon + dlon
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """Haversine distance in kilometres."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (
+        math.sin((phi2 - phi1) / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1)))
+
+
+class DistanceKm(Func):
+    """
+    distance_km() from a fixed point to each row. SQLite computes it with
+    the clinic_distance_km() function registered on every connection (one
+    Python call per row instead of one per operator); other databases build
+    it from their trigonometric functions.
+    """
+
+    function = "clinic_distance_km"
+    output_field = FloatField()
+
+    def __init__(self, lat, lon):
+        self.lat, self.lon = lat, lon
+        super().__init__(Value(lat), Value(lon), F("gps_y"), F("gps_x"))
+
+    def as_sql(self, compiler, connection, **extra_context):
+        if connection.vendor == "sqlite":
+            return super().as_sql(compiler, connection, **extra_context)
+        phi = math.radians(self.lat)
+        a = (
+            Power(Sin((Radians(F("gps_y")) - phi) / 2), 2)
+            + Value(math.cos(phi)) * Cos(Radians(F("gps_y")))
+            * Power(Sin((Radians(F("gps_x")) - math.radians(self.lon)) / 2), 2)
+        )
+        expression = 2 * EARTH_RADIUS_KM * ASin(Sqrt(a), output_field=FloatField())
+        return compiler.compile(expression.resolve_expression(compiler.query))
+
+
+def _sqlite_distance_km(lat1, lon1, lat2, lon2):
+    if lat2 is None or lon2 is None:
+        return None
+    return distance_km(lat1, lon1, lat2, lon2)
+
+
+def register_sqlite_functions(sender, connection, **kwargs):
+    """connection_created receiver adding clinic_distance_km() to SQLite."""
+    if connection.vendor == "sqlite":
+        connection.connection.create_function("clinic_distance_km", 4, _sqlite_distance_km, deterministic=True)
@@ -0,0 +1,414 @@
+"""
+Streaming import engine for the county health facility / land workbooks.
+
+Sheets are read and normalized by clinic.sheets (optionally in worker
+processes); this module is the single writer. Facilities are resolved
+against an in-memory index built with a single query, and new facilities /
+land records are written with bulk_create in batches, each batch in its own
+transaction.
+
+In upsert mode every row gets a stable key and a content hash, so re-running
+the same sheet only touches the rows that actually changed.
+"""
+import hashlib
+import sys
+import time
+
+import pandas as pd
+from django.db import connection, transaction
+
+from .bulk_actions import delete_rows
+from .matching import FacilityMatcher, queue_for_review
+from .models import Facility, ImportRun, LandRecord
+from .normalize import ERROR, REJECT_COLUMNS
+from .sheets import count_data_rows, iter_chunks, normalize_rows, read_workbook
+from .signals import bulk_saved, bulk_saving
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+
+DEFAULT_BATCH_SIZE = 2000
+
+
+# LandRecord fields written by the importer; these make up the content hash.
+LAND_FIELDS = ("parcel_number", "acreage", "land_use", "dispute_status")
+
+
+def row_key(row, repeat=1):
+    """
+    Stable key for a land row: the facility it belongs to plus its parcel
+    number, or its sheet row number when it has none. Rejected or fixed
+    rows elsewhere in the sheet do not change it. `repeat` tells apart rows
+    that would otherwise share a key (a parcel listed twice for a facility).
+    """
+    parts = [row["name"].lower(), row["subcounty"].lower(), row["ward"].lower()]
+    if row["parcel_number"]:
+        parts += ["parcel", row["parcel_number"].lower()]
+    else:
+        parts += ["row", str(row["row"])]
+    if repeat > 1:
+        parts.append(str(repeat))
+    return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def row_hash(row):
+    """Hash of the values a row writes to its LandRecord."""
+    payload = "\x1f".join(repr(row[field]) for field in LAND_FIELDS)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def fill_pks(objects, model, key_fields):
+    """
+    Set the pks of objects just written with bulk_create on databases that
+    do not return them (MySQL), from the newest row with each object's
+    key_fields. Only for objects whose key is unique among them.
+    """
+    if connection.features.can_return_rows_from_bulk_insert or not objects:
+        return
+    first = key_fields[0]
+    rows = (
+        model.objects.filter(**{f"{first}__in": {getattr(obj, first) for obj in objects}})
+        .order_by("pk")
+        .values_list("pk", *key_fields)
+    )
+    pks = {tuple(key): pk for pk, *key in rows}
+    for obj in objects:
+        obj.pk = pks[tuple(getattr(obj, name) for name in key_fields)]
+
+
+def peak_memory_mb():
+    """Peak resident set size of this process in MB, or None if unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes everywhere else.
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+class ImportStats:
+    """Counters collected while an import runs."""
+
+    def __init__(self):
+        self.rows = 0
+        self.skipped = 0
+        self.rejected = 0
+        self.warnings = 0
+        self.facilities_created = 0
+        self.facilities_matched = 0
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.retired = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+
+    @property
+    def land_records_created(self):
+        return self.inserted
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+class StreamingImporter:
+    """
+    Write normalized sheet rows to Facility / LandRecord in batches.
+
+    Facilities are matched on (name, subcounty, ward), exactly like the old
+    get_or_create lookup, but against an index loaded once up front.
+
+    With upsert=True rows are matched to earlier imports by import_key:
+    unchanged rows are skipped and changed rows are updated in bulk. With
+    retire=True, imported land records whose key is no longer in the source
+    are deleted at the end of the run, but only those of facilities the
+    source has rows for: importing one sub-county's sheet leaves the other
+    sub-counties' records alone.
+
+    Passing a matching.FacilityMatcher makes facility resolution fuzzy.
+    `progress`, if given, is called with the ImportStats after every batch.
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, upsert=False, retire=False, matcher=None, progress=None):
+        self.batch_size = batch_size
+        self.upsert = upsert
+        self.retire = retire
+        self.matcher = matcher
+        self.progress = progress
+        self.stats = ImportStats()
+        self.facility_index = {
+            (name, subcounty, ward): pk
+            for pk, name, subcounty, ward in Facility.objects.order_by("pk").values_list(
+                "pk", "name", "subcounty", "ward"
+            )
+        }
+        # Row keys handed out in this run, to keep them unique.
+        self.assigned_keys = set()
+        self.seen_keys = set()
+        self.seen_facilities = set()
+        self.rejects = []
+        self.record_index = {}
+        # (pk, facility pk) of records whose import_key another record already has
+        self.duplicates = []
+        if upsert:
+            self.load_record_index()
+
+    def load_record_index(self):
+        """
+        Load import_key -> (pk, import_hash, facility pk) for previously
+        imported records. If a key was imported more than once (plain
+        imports re-run over the same sheet), the oldest record wins and the
+        copies can be retired.
+        """
+        records = (
+            LandRecord.objects.exclude(import_key="")
+            .order_by("pk")
+            .values_list("import_key", "pk", "import_hash", "facility_id")
+        )
+        for key, pk, content_hash, facility_pk in records.iterator(chunk_size=self.batch_size):
+            if key in self.record_index:
+                self.duplicates.append((pk, facility_pk))
+            else:
+                self.record_index[key] = (pk, content_hash, facility_pk)
+
+    def assign_keys(self, rows):
+        for row in rows:
+            repeat = 1
+            key = row_key(row)
+            while key in self.assigned_keys:
+                repeat += 1
+                key = row_key(row, repeat)
+            self.assigned_keys.add(key)
+            row["import_key"] = key
+            row["import_hash"] = row_hash(row)
+
+    def resolve_facilities(self, rows):
+        """
+        Create any facilities in `rows` that are not in the index yet. With
+        a matcher, spelling variants of a known facility are mapped onto it
+        instead, and near misses are created but queued for review.
+        """
+        new, aliases, reviews = {}, {}, []
+        for row in rows:
+            key = (row["name"], row["subcounty"], row["ward"])
+            if key in self.facility_index or key in new or key in aliases:
+                continue
+            if self.matcher is not None:
+                match, score = self.matcher.match(*key)
+                if match is not None and self.matcher.is_same(score):
+                    aliases[key] = match
+                    continue
+                if match is not None and self.matcher.needs_review(score):
+                    reviews.append((match, key, score))
+                # Facilities created in this batch have no pk yet; their key
+                # stands in for it until bulk_create has run.
+                self.matcher.add(key, *key)
+            new[key] = Facility(
+                name=row["name"],
+                subcounty=row["subcounty"],
+                ward=row["ward"],
+                location=row["location"],
+            )
+        if new:
+            created = Facility.objects.bulk_create(new.values(), batch_size=self.batch_size)
+            fill_pks(created, Facility, ("name", "subcounty", "ward"))
+            for key, facility in zip(new.keys(), created):
+                self.facility_index[key] = facility.pk
+            self.stats.facilities_created += len(created)
+            bulk_saved.send(sender=Facility, pks=[facility.pk for facility in created], created=True)
+        for key, match in aliases.items():
+            self.facility_index[key] = self.facility_pk(match)
+        self.stats.facilities_matched += len(aliases)
+        if reviews:
+            queue_for_review((self.facility_pk(a), self.facility_pk(b), score) for a, b, score in reviews)
+
+    def facility_pk(self, match):
+        """Resolve a matcher entry, which is a pk or a facility key, to a pk."""
+        return self.facility_index[match] if isinstance(match, tuple) else match
+
+    def build_record(self, row, pk=None):
+        return LandRecord(
+            pk=pk,
+            facility_id=self.facility_index[(row["name"], row["subcounty"], row["ward"])],
+            import_key=row["import_key"],
+            import_hash=row["import_hash"],
+            **{field: row[field] for field in LAND_FIELDS},
+        )
+
+    def write_batch(self, rows):
+        self.assign_keys(rows)
+        self.resolve_facilities(rows)
+
+        new, changed = [], []
+        for row in rows:
+            key = row["import_key"]
+            self.seen_keys.add(key)
+            self.seen_facilities.add(self.facility_index[(row["name"], row["subcounty"], row["ward"])])
+            existing = self.record_index.get(key)
+            if existing is None:
+                new.append(self.build_record(row))
+            elif existing[1] == row["import_hash"]:
+                self.stats.unchanged += 1
+            else:
+                changed.append(self.build_record(row, pk=existing[0]))
+
+        if new:
+            LandRecord.objects.bulk_create(new, batch_size=self.batch_size)
+            fill_pks(new, LandRecord, ("import_key",))
+            self.stats.inserted += len(new)
+            bulk_saved.send(sender=LandRecord, pks=[record.pk for record in new], created=True)
+        if changed:
+            bulk_saving.send(sender=LandRecord, pks=[record.pk for record in changed])
+            LandRecord.objects.bulk_update(
+                changed, LAND_FIELDS + ("facility", "import_hash"), batch_size=self.batch_size
+            )
+            self.stats.updated += len(changed)
+            bulk_saved.send(sender=LandRecord, pks=[record.pk for record in changed], created=False)
+
+    def retire_missing(self):
+        """Delete imported land records of the facilities in this run whose key was not in it."""
+        stale = [
+            pk for key, (pk, _, facility_pk) in self.record_index.items()
+            if key not in self.seen_keys and facility_pk in self.seen_facilities
+        ]
+        stale.extend(pk for pk, facility_pk in self.duplicates if facility_pk in self.seen_facilities)
+        for start in range(0, len(stale), self.batch_size):
+            batch = stale[start:start + self.batch_size]
+            self.stats.retired += delete_rows(LandRecord.objects.filter(pk__in=batch), self.batch_size)
+
+    def add_rejects(self, rejects, source):
+        if len(rejects):
+            rejects = rejects.assign(source=source)
+            self.rejects.append(rejects)
+            errors = rejects["severity"] == ERROR
+            self.stats.rejected += rejects["row"][errors].nunique()
+            self.stats.warnings += int((~errors).sum())
+
+    def normalized(self, rows, headers, columns, source=""):
+        """Normalize raw sheet row tuples chunk by chunk as they stream past."""
+        for records, rejects, blank, read in normalize_rows(rows, headers, columns, self.batch_size):
+            self.stats.rows += read
+            self.stats.skipped += blank
+            self.add_rejects(rejects, source)
+            yield from records
+
+    def parsed(self, result, source=""):
+        """Rows of a sheet already normalized by sheets.parse_sheet."""
+        self.stats.rows += result["read"]
+        self.stats.skipped += result["skipped"]
+        self.add_rejects(pd.DataFrame(result["rejects"], columns=REJECT_COLUMNS), source)
+        return result["rows"]
+
+    def rejects_frame(self):
+        """All rejected cells and warnings of the run as one DataFrame."""
+        if not self.rejects:
+            return pd.DataFrame(columns=["source"] + REJECT_COLUMNS)
+        return pd.concat(self.rejects, ignore_index=True)[["source"] + REJECT_COLUMNS]
+
+    def skip_batch(self, rows):
+        """Account for rows committed by an earlier, interrupted run without writing them."""
+        self.assign_keys(rows)
+        self.seen_keys.update(row["import_key"] for row in rows)
+        # Facilities matched fuzzily by the interrupted run are not in the
+        # index; their records are kept rather than retired.
+        facilities = (self.facility_index.get((row["name"], row["subcounty"], row["ward"])) for row in rows)
+        self.seen_facilities.update(pk for pk in facilities if pk is not None)
+
+    def run(self, row_groups, checkpoint=None, resume_from=0):
+        """
+        Write one or more iterables of normalized rows (one per sheet), in
+        order, in batches of batch_size. Only this process writes, and every
+        batch commits on its own: the database write lock is held while a
+        batch is written, not while the next one is read and parsed, so web
+        requests can write in between.
+
+        If the run fails, the batches before the failure stay committed; an
+        --upsert re-run picks up from there. checkpoint(rows_written, stats),
+        if given, is called inside each batch's transaction, so what it
+        records is exactly what was committed. A later run given
+        resume_from=rows_written skips those rows (their keys are still
+        assigned, so row keys and retire see the whole sheet).
+        """
+        self.write_all(row_groups, checkpoint, resume_from)
+        if self.retire:
+            self.retire_missing()
+        self.stats.finish()
+        return self.stats
+
+    def write_all(self, row_groups, checkpoint=None, resume_from=0):
+        written = 0
+        for rows in row_groups:
+            for chunk in iter_chunks(rows, self.batch_size):
+                if written < resume_from:
+                    done = chunk[:resume_from - written]
+                    self.skip_batch(done)
+                    written += len(done)
+                    chunk = chunk[len(done):]
+                    if not chunk:
+                        continue
+                with transaction.atomic():
+                    self.write_batch(chunk)
+                    if checkpoint is not None:
+                        checkpoint(written + len(chunk), self.stats)
+                written += len(chunk)
+                if self.progress:
+                    self.progress(self.stats)
+
+
+def run_import(import_run, job=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Import an uploaded workbook (ImportRun), committing batch by batch and
+    resuming after import_run.rows_done. Counts of rows written add up
+    across attempts; rows read and rejected are recounted, since every
+    attempt reads the sheet from the top.
+    """
+    path = import_run.workbook.path
+    if import_run.rows_total is None:
+        import_run.rows_total = count_data_rows(path)
+        import_run.save(update_fields=["rows_total", "updated_at"])
+    base = {name: getattr(import_run, name) for name in ("facilities_created", "inserted", "updated", "unchanged")}
+    resume_from = import_run.rows_done
+
+    matcher = FacilityMatcher.from_database() if import_run.fuzzy else None
+    importer = StreamingImporter(
+        batch_size=batch_size,
+        upsert=import_run.upsert,
+        retire=import_run.retire and import_run.upsert,
+        matcher=matcher,
+    )
+
+    def checkpoint(rows_written, stats):
+        elapsed = time.perf_counter() - stats.started
+        progress = {
+            "rows_done": rows_written,
+            "rows_read": stats.rows,
+            "rejected": stats.rejected,
+            "rows_per_second": stats.rows / elapsed if elapsed else 0,
+            **{name: base[name] + getattr(stats, name) for name in base},
+        }
+        ImportRun.objects.filter(pk=import_run.pk).update(**progress)
+        if job is not None:
+            job.report(stats.rows, import_run.rows_total, f"{rows_written} rows committed")
+
+    headers, columns, rows = read_workbook(path)
+    stats = importer.run([importer.normalized(rows, headers, columns, import_run.original_name)], checkpoint, resume_from)
+    import_run.refresh_from_db()
+    ImportRun.objects.filter(pk=import_run.pk).update(rows_read=stats.rows, rejected=stats.rejected)
+    return {
+        "rows": stats.rows,
+        "facilities_created": import_run.facilities_created,
+        "inserted": import_run.inserted,
+        "updated": import_run.updated,
+        "unchanged": import_run.unchanged,
+        "retired": stats.retired,
+        "rejected": stats.rejected,
+        "resumed_from": resume_from,
+    }
@@ -0,0 +1,238 @@
+"""
+Database-backed background jobs.
+
+enqueue() stores a Job row; `manage.py run_worker` polls for due jobs and
+runs them on a thread pool, so slow work (document processing, imports)
+happens outside the web request. There is no broker: the jobs table is the
+queue.
+
+A worker claims a job with a conditional UPDATE (status still 'queued'), so
+two workers never run the same job. A failed job is retried after an
+exponential backoff until max_attempts is reached. Handlers report progress
+with job.report().
+
+While a worker runs jobs, a heartbeat thread refreshes their locks every
+HEARTBEAT_INTERVAL, however long a handler goes without reporting. Jobs
+whose lock is older than STALE_AFTER belong to a worker that died: they go
+back to the queue as a failed attempt (or fail for good after
+max_attempts), and the outcome of a job is only recorded while its worker
+still holds the lock.
+
+Handlers are registered with @register("name") and called as
+handler(job, **payload).
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import close_old_connections, connection
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+RETRY_DELAY = 30  # seconds, doubled after each failed attempt
+HEARTBEAT_INTERVAL = 60  # seconds
+STALE_AFTER = timedelta(minutes=5)
+
+
+def register(name):
+    """Decorator registering a job handler under `name`."""
+    def decorator(func):
+        HANDLERS[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, max_attempts=3, delay=0):
+    """Queue a job; workers see it once the current transaction commits."""
+    if name not in HANDLERS:
+        raise ValueError(f"Unknown job: {name}")
+    return Job.objects.create(
+        name=name,
+        payload=payload or {},
+        max_attempts=max_attempts,
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def requeue_stale():
+    """
+    Put jobs whose worker stopped beating back in the queue, counting the
+    attempt; jobs out of attempts fail. Returns the number requeued.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(status="running", locked_at__lt=now - STALE_AFTER)
+    released = {"attempts": F("attempts") + 1, "locked_by": "", "locked_at": None}
+    stale.filter(attempts__gte=F("max_attempts") - 1).update(
+        status="failed", error="The worker running this job stopped.", finished_at=now, **released
+    )
+    return stale.update(status="queued", **released)
+
+
+def claim(worker, limit=1):
+    """Claim up to `limit` due jobs for `worker`; returns them."""
+    now = timezone.now()
+    candidates = list(
+        Job.objects.filter(status="queued", run_after__lte=now).order_by("run_after", "id")
+        .values_list("pk", flat=True)[: limit * 2]
+    )
+    claimed = []
+    for pk in candidates:
+        if len(claimed) == limit:
+            break
+        taken = Job.objects.filter(pk=pk, status="queued").update(
+            status="running", locked_by=worker, locked_at=now, started_at=now,
+        )
+        if taken:
+            claimed.append(Job.objects.get(pk=pk))
+    return claimed
+
+
+def run(job):
+    """
+    Run a claimed job and record the outcome, unless the job's lock was
+    taken away meanwhile (see requeue_stale).
+    """
+    handler = HANDLERS.get(job.name)
+    attempts = job.attempts + 1
+    try:
+        if handler is None:
+            raise LookupError(f"No handler registered for {job.name}")
+        result = handler(job, **job.payload)
+    except Exception:
+        logger.exception("Job %s failed (attempt %s of %s)", job, attempts, job.max_attempts)
+        fields = {"attempts": attempts, "error": traceback.format_exc(), "locked_by": "", "locked_at": None}
+        if attempts < job.max_attempts and handler is not None:
+            fields.update(status="queued", run_after=timezone.now() + timedelta(seconds=RETRY_DELAY * 2 ** (attempts - 1)))
+        else:
+            fields.update(status="failed", finished_at=timezone.now())
+        _finish(job, fields)
+        return False
+    _finish(job, {
+        "status": "succeeded", "attempts": attempts, "result": result, "error": "",
+        "locked_by": "", "locked_at": None, "finished_at": timezone.now(),
+    })
+    return True
+
+
+def _finish(job, fields):
+    if not Job.objects.filter(pk=job.pk, status="running", locked_by=job.locked_by).update(**fields):
+        logger.warning("Job %s lost its lock; its outcome was not recorded", job)
+
+
+def _run_in_thread(job):
+    # Each pool thread has its own database connection; don't leave it open
+    # past its useful life.
+    close_old_connections()
+    try:
+        return run(job)
+    finally:
+        close_old_connections()
+
+
+class Worker:
+    """
+    Poll for jobs and run up to `threads` of them at a time (threads=1 runs
+    them in the calling thread). A job is claimed whenever a thread is free,
+    so a long job only holds up its own thread. run_once() drains what is
+    due now (for cron or tests); run_forever() keeps polling.
+    """
+
+    def __init__(self, threads=2, poll_interval=1.0, worker=None, heartbeat_interval=HEARTBEAT_INTERVAL):
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.worker = worker or worker_id()
+        self.heartbeat_interval = heartbeat_interval
+
+    def beat(self):
+        """Refresh the locks of the jobs this worker is running."""
+        return Job.objects.filter(status="running", locked_by=self.worker).update(locked_at=timezone.now())
+
+    def _beat_until(self, stop):
+        try:
+            while not stop.wait(self.heartbeat_interval):
+                self.beat()
+        finally:
+            connection.close()
+
+    @contextmanager
+    def heartbeat(self):
+        stop = threading.Event()
+        thread = threading.Thread(target=self._beat_until, args=(stop,), name=f"heartbeat {self.worker}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def run_once(self):
+        requeue_stale()
+        with self.heartbeat():
+            if self.threads <= 1:
+                return self._run_in_caller()
+            return self._run_in_pool()
+
+    def _run_in_caller(self):
+        # In the calling thread (and its connection and transaction).
+        ran = 0
+        while True:
+            batch = claim(self.worker)
+            if not batch:
+                return ran
+            run(batch[0])
+            ran += 1
+
+    def _run_in_pool(self):
+        ran = 0
+        running = set()
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            while True:
+                free = self.threads - len(running)
+                if free:
+                    running.update(pool.submit(_run_in_thread, job) for job in claim(self.worker, free))
+                if not running:
+                    return ran
+                # Wake up when a job finishes, or to look for new jobs for free threads.
+                done, running = wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                ran += len(done)
+
+    def run_forever(self, stop=None):
+        while stop is None or not stop.is_set():
+            if not self.run_once():
+                time.sleep(self.poll_interval)
+
+
+def status(job):
+    """A job as a JSON-serialisable dict, for the status endpoint."""
+    percent = None
+    if job.progress_total:
+        percent = round(100 * job.progress_done / job.progress_total, 1)
+    return {
+        "id": job.pk,
+        "name": job.name,
+        "status": job.status,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "progress": {"done": job.progress_done, "total": job.progress_total, "percent": percent},
+        "message": job.message,
+        "result": job.result,
+        "error": job.error.strip().splitlines()[-1] if job.error else "",
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
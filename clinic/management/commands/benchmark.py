@@ -0,0 +1,101 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from clinic import benchmark
+from clinic.seeding import seed
+
+
+class Command(BaseCommand):
+    help = (
+        "Time every clinic URL (p50 / p95 latency, queries per request) and import_health_land "
+        "throughput, and save the results as JSON. Runs against a scratch database, created, "
+        "migrated and seeded for the run and dropped afterwards; the configured database and "
+        "page cache are not touched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--facilities", type=int, default=500, help="Facilities to seed (default 500).")
+        parser.add_argument("--parcels-per", type=int, default=4, help="Land records per facility (default 4).")
+        parser.add_argument("--issues-per", type=int, default=2, help="Issues per facility (default 2).")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed of the data (default 0).")
+        parser.add_argument("--repeat", type=int, default=20, help="Timed requests per URL (default 20).")
+        parser.add_argument("--warmup", type=int, default=1, help="Untimed requests per URL first (default 1).")
+        parser.add_argument("--url", action="append", dest="names", help="Only this URL name (repeatable).")
+        parser.add_argument(
+            "--import-rows", type=int, default=2000,
+            help="Rows in the generated workbook for the import benchmark; 0 skips it (default 2000).",
+        )
+        parser.add_argument(
+            "--cold-cache", action="store_true",
+            help="Empty the benchmark's page cache before every request.",
+        )
+        parser.add_argument("--output", help="JSON file to write (default benchmark-<commit>-<time>.json).")
+        parser.add_argument("--compare", help="Earlier results JSON file to compare against.")
+
+    def handle(self, *args, **options):
+        if options["repeat"] < 1:
+            raise CommandError("--repeat must be at least 1.")
+        if min(options["facilities"], options["parcels_per"], options["issues_per"]) < 0:
+            raise CommandError("Counts cannot be negative.")
+        previous = None
+        if options["compare"]:
+            try:
+                previous = json.loads(Path(options["compare"]).read_text())
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"Cannot read {options['compare']}: {exc}")
+
+        with benchmark.scratch_database():
+            seed(
+                options["facilities"],
+                parcels_per=options["parcels_per"],
+                issues_per=options["issues_per"],
+                seed_value=options["seed"],
+            )
+            results = benchmark.run(
+                repeat=options["repeat"],
+                warmup=options["warmup"],
+                import_rows=options["import_rows"],
+                names=options["names"],
+                cold_cache=options["cold_cache"],
+            )
+
+        rows = results["rows"]
+        self.stdout.write(
+            f"{rows['facilities']} facilities, {rows['land_records']} land records, {rows['issues']} issues; "
+            f"{results['repeat']} requests per URL"
+        )
+        self.stdout.write(f"{'p50 ms':>9} {'p95 ms':>9} {'queries':>8} {'status':>6}  url")
+        for row in results["urls"]:
+            if row["url"] is None:
+                self.stdout.write(f"{'':>9} {'':>9} {'':>8} {'':>6}  {row['name']}: skipped, {row['skipped']}")
+                continue
+            self.stdout.write(
+                f"{row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['queries']:>8} {row['status']:>6}  {row['url']}"
+            )
+        if results["import"]:
+            result = results["import"]
+            self.stdout.write(
+                f"import_health_land: {result['rows']} rows in {result['seconds']:.2f}s, "
+                f"{result['rows_per_second']:.0f} rows/sec"
+            )
+
+        if previous:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"Compared with {previous.get('commit') or options['compare']}:"))
+            for name, url, p50_was, p50, p95_was, p95, queries_was, queries in benchmark.compare(previous, results):
+                change = (p50 - p50_was) / p50_was * 100 if p50_was else 0
+                line = f"{change:+7.1f}% p50 {p50_was:.2f} -> {p50:.2f}, p95 {p95_was:.2f} -> {p95:.2f}"
+                if queries != queries_was:
+                    line += f", queries {queries_was} -> {queries}"
+                self.stdout.write(f"{line}  {url}")
+            if previous.get("import") and results["import"]:
+                self.stdout.write(
+                    f"import_health_land rows/sec {previous['import']['rows_per_second']:.0f} -> "
+                    f"{results['import']['rows_per_second']:.0f}"
+                )
+
+        stamp = results["created_at"][:19].replace(":", "").replace("-", "")
+        output = Path(options["output"] or f"benchmark-{results['commit'] or 'nocommit'}-{stamp}.json")
+        output.write_text(json.dumps(results, indent=2))
+        self.stdout.write(self.style.SUCCESS(f"Results written to {output}"))
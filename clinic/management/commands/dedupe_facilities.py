@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+
+from clinic.matching import (
+    AUTO_MERGE_THRESHOLD,
+    REVIEW_THRESHOLD,
+    FacilityMatcher,
+    find_duplicates,
+    merge_facilities,
+    queue_for_review,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Find facilities that are spelling variants of each other within the same subcounty/ward. "
+        "Close matches are merged, borderline ones are queued for review in the admin."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--match-threshold",
+            type=float,
+            default=AUTO_MERGE_THRESHOLD,
+            help="Pairs scoring at least this are merged automatically.",
+        )
+        parser.add_argument(
+            "--review-threshold",
+            type=float,
+            default=REVIEW_THRESHOLD,
+            help="Pairs scoring at least this (but below --match-threshold) are queued for review.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report what would be merged or queued.",
+        )
+
+    def handle(self, *args, **options):
+        matcher = FacilityMatcher(
+            auto_threshold=options["match_threshold"],
+            review_threshold=options["review_threshold"],
+        )
+        merges, reviews = find_duplicates(matcher)
+
+        groups = {}
+        for duplicate, target in merges.items():
+            groups.setdefault(target, []).append(duplicate)
+
+        if options["dry_run"]:
+            for target, duplicates in sorted(groups.items()):
+                self.stdout.write(f"Would merge {duplicates} into {target}")
+            for a, b, score in reviews:
+                self.stdout.write(f"Would queue {a} ~ {b} ({score:.2f})")
+            return
+
+        merged = sum(merge_facilities(target, duplicates) for target, duplicates in groups.items())
+        queue_for_review(reviews)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Done. Facilities merged: {merged}, pairs queued for review: {len(reviews)}"
+            )
+        )
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from clinic.explain import explain_views
+from clinic.seeding import seed
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Request each list and detail view, print the query plans of the SELECTs it runs and flag "
+        "full table scans. Runs in a transaction that is rolled back, seeding data first unless "
+        "--existing is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--facilities", type=int, default=300, help="Facilities to seed (default 300).")
+        parser.add_argument("--parcels-per", type=int, default=3, help="Land records per seeded facility.")
+        parser.add_argument("--issues-per", type=int, default=2, help="Issues per seeded facility.")
+        parser.add_argument("--existing", action="store_true", help="Use the data already in the database.")
+        parser.add_argument("--flagged-only", action="store_true", help="Only print queries with a full scan.")
+        parser.add_argument("--fail-on-scan", action="store_true", help="Exit with an error if any scan is flagged.")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                if not options["existing"]:
+                    seed(options["facilities"], options["parcels_per"], options["issues_per"])
+                reports = explain_views()
+                raise Rollback
+        except Rollback:
+            pass
+
+        flagged = 0
+        for report in reports:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"GET {report.url} -> {report.status}"))
+            for plan in report.plans:
+                if options["flagged_only"] and not plan.flagged:
+                    continue
+                marker = self.style.ERROR("FULL SCAN " + ", ".join(plan.scans)) if plan.flagged else "ok"
+                if plan.sorts:
+                    marker += ", sorted"
+                self.stdout.write(f"  [{marker}] {plan.sql}")
+                for line in plan.lines:
+                    self.stdout.write(f"      {line}")
+            flagged += len(report.flagged)
+
+        summary = f"{len(reports)} pages, {sum(len(report.plans) for report in reports)} queries, {flagged} flagged."
+        if flagged and options["fail_on_scan"]:
+            raise CommandError(summary)
+        self.stdout.write(self.style.WARNING(summary) if flagged else self.style.SUCCESS(summary))
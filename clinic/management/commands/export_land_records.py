@@ -0,0 +1,52 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from clinic import exports
+
+
+class Command(BaseCommand):
+    help = "Export the land record register, with facility locality columns, as CSV or XLSX."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format",
+            choices=["csv", "xlsx"],
+            help="Output format (default: from the --output extension, else csv).",
+        )
+        parser.add_argument(
+            "--output",
+            help="File to write. CSV goes to standard output if omitted.",
+        )
+        parser.add_argument(
+            "--search",
+            help="Only records whose facility name contains this.",
+        )
+        parser.add_argument(
+            "--parcel",
+            help="Only records whose parcel number contains this.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=exports.CHUNK_SIZE,
+            help="Rows fetched from the database at a time.",
+        )
+
+    def handle(self, *args, **options):
+        output = options["output"]
+        fmt = options["format"] or ("xlsx" if output and output.endswith(".xlsx") else "csv")
+        if fmt == "xlsx" and not output:
+            raise CommandError("--output is required for XLSX")
+
+        params = {"search": options["search"], "parcel": options["parcel"]}
+        rows = exports.export_rows(params, chunk_size=options["chunk_size"])
+        if fmt == "xlsx":
+            count = exports.write_xlsx(rows, output)
+        elif output:
+            with open(output, "w", newline="", encoding="utf-8") as file:
+                count = exports.write_csv(rows, file)
+        else:
+            count = exports.write_csv(rows, sys.stdout)
+
+        self.stderr.write(self.style.SUCCESS(f"Done. Land records exported: {count}"))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from clinic import blobs, rollups, search
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the search index, land rollups and document references for rows "
+        "that existed before they were introduced. Run once after migrating; "
+        "no document files are deleted."
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            search.rebuild()
+            rows = rollups.rebuild()
+        referenced, _ = blobs.recount(delete_unreferenced=False)
+        self.stdout.write(
+            self.style.SUCCESS(f"Done. Rollup rows: {rows}, blobs referenced: {referenced}")
+        )
@@ -1,135 +1,224 @@
-import pandas as pd
-from django.core.management.base import BaseCommand
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
 
-from clinic.models import Facility, LandRecord
+from django.core.management.base import BaseCommand, CommandError
 
-
-def find_column(df, *keywords):
-    """
-    Find a column whose name (lowercased) contains ALL given keywords.
-    Returns the column name or None if not found.
-    """
-    for col in df.columns:
-        lower = str(col).lower()
-        if all(k in lower for k in keywords):
-            return col
-    return None
+from clinic import jobs
+from clinic.importer import DEFAULT_BATCH_SIZE, StreamingImporter, peak_memory_mb
+from clinic.matching import AUTO_MERGE_THRESHOLD, REVIEW_THRESHOLD, FacilityMatcher
+from clinic.sheets import expand_sources, list_sheets, parse_sheet, read_workbook
 
 
 class Command(BaseCommand):
-    help = "Import facilities and land data from an Excel file into Facility and LandRecord."
+    help = "Import facilities and land data from Excel files into Facility and LandRecord."
+    # Passed by the import job (clinic.tasks) to report progress.
+    stealth_options = ("progress",)
 
     def add_arguments(self, parser):
         parser.add_argument(
             "--file",
-            default="/home/user/Downloads/HEALTH 13062025-1.xlsx",
-            help="Path to the Excel file to import.",
+            nargs="+",
+            required=True,
+            help="Excel file(s) to import. Each may be a file, a directory or a glob pattern.",
         )
-
-    def handle(self, *args, **options):
-        path = options["file"]
-        self.stdout.write(f"Reading Excel file: {path}")
-
-        df = pd.read_excel(path)
-
-        # Try to automatically detect important columns based on keywords.
-        facility_col = (
-            find_column(df, "facility", "name")
-            or find_column(df, "public", "utility")
-            or find_column(df, "health", "facility")
+        parser.add_argument(
+            "--sheet",
+            action="append",
+            default=None,
+            help="Worksheet to import (repeatable; defaults to the first sheet of each file).",
         )
-
-        subcounty_col = find_column(df, "sub", "county")
-        ward_col = find_column(df, "ward")
-        location_col = find_column(df, "village") or find_column(df, "location")
-
-        # Land size (acres / hectares / size)
-        land_size_col = (
-            find_column(df, "land", "acre")
-            or find_column(df, "land", "ha")
-            or find_column(df, "land", "size")
+        parser.add_argument(
+            "--all-sheets",
+            action="store_true",
+            help="Import every worksheet of every file.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Number of processes used to parse sheets (default: one per CPU).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help="Number of rows read and written per bulk insert.",
+        )
+        parser.add_argument(
+            "--upsert",
+            action="store_true",
+            help="Match rows to earlier imports: skip unchanged rows and update changed ones.",
+        )
+        parser.add_argument(
+            "--retire",
+            action="store_true",
+            help="With --upsert, delete imported land records of the facilities in the file that are no longer in it.",
+        )
+        parser.add_argument(
+            "--fuzzy",
+            action="store_true",
+            help="Match facility names fuzzily within each subcounty/ward instead of exactly.",
+        )
+        parser.add_argument(
+            "--match-threshold",
+            type=float,
+            default=AUTO_MERGE_THRESHOLD,
+            help="With --fuzzy, names scoring at least this are treated as the same facility.",
+        )
+        parser.add_argument(
+            "--review-threshold",
+            type=float,
+            default=REVIEW_THRESHOLD,
+            help="With --fuzzy, new facilities scoring at least this against an existing one are queued for review.",
+        )
+        parser.add_argument(
+            "--background",
+            action="store_true",
+            help="Queue the import as a background job (run by manage.py run_worker) and exit.",
+        )
+        parser.add_argument(
+            "--rejects",
+            default=None,
+            help="Write rejected rows and warnings (source, row, column, value, reason, severity) to this CSV file.",
         )
 
-        # Land use description
-        land_use_col = find_column(df, "land", "use") or find_column(df, "current", "use")
-
-        # Dispute status column (e.g. "Disputed/ undisputed")
-        dispute_col = None
-        for col in df.columns:
-            if "disputed" in str(col).lower():
-                dispute_col = col
-                break
-
-        if facility_col is None:
-            raise RuntimeError("Could not find a column for facility/public utility name.")
-
-        self.stdout.write("Detected columns:")
-        self.stdout.write(f"  Facility name: {facility_col}")
-        self.stdout.write(f"  Subcounty:     {subcounty_col}")
-        self.stdout.write(f"  Ward:          {ward_col}")
-        self.stdout.write(f"  Location:      {location_col}")
-        self.stdout.write(f"  Land size:     {land_size_col}")
-        self.stdout.write(f"  Land use:      {land_use_col}")
-        self.stdout.write(f"  Dispute:       {dispute_col}")
-
-        created_facilities = 0
-        created_land_records = 0
-
-        for _, row in df.iterrows():
-            name_raw = row.get(facility_col)
-            if pd.isna(name_raw):
-                continue
-            name = str(name_raw).strip()
-            if not name:
-                continue
-
-            subcounty = str(row.get(subcounty_col, "") or "").strip() if subcounty_col else ""
-            ward = str(row.get(ward_col, "") or "").strip() if ward_col else ""
-            location = str(row.get(location_col, "") or "").strip() if location_col else ""
-
-            # Land size
-            acreage = 0.0
-            if land_size_col:
-                size_raw = row.get(land_size_col, 0)
-                try:
-                    acreage = float(size_raw) if size_raw not in (None, "") else 0.0
-                except Exception:
-                    acreage = 0.0
-
-            # Land use
-            land_use = ""
-            if land_use_col:
-                land_use = str(row.get(land_use_col, "") or "").strip()
-
-            # Dispute / undisputed
-            dispute_status = ""
-            if dispute_col:
-                dispute_raw = str(row.get(dispute_col, "") or "").strip().lower()
-                if "disputed" in dispute_raw and "un" not in dispute_raw:
-                    dispute_status = "Disputed"
-                elif "undisputed" in dispute_raw or "not disputed" in dispute_raw:
-                    dispute_status = "Undisputed"
-
-            facility, fac_created = Facility.objects.get_or_create(
-                name=name,
-                subcounty=subcounty,
-                ward=ward,
-                defaults={"location": location},
-            )
-            if fac_created:
-                created_facilities += 1
-
-            LandRecord.objects.create(
-                facility=facility,
-                acreage=acreage,
-                land_use=land_use,
-                dispute_status=dispute_status,
+    def handle(self, *args, **options):
+        if options["retire"] and not options["upsert"]:
+            raise CommandError("--retire can only be used together with --upsert.")
+
+        files = expand_sources(options["file"])
+        if not files:
+            raise CommandError("No Excel files matched " + ", ".join(options["file"]))
+        if options["background"]:
+            self.enqueue(files, options)
+            return
+        sources = self.get_sources(files, options)
+
+        matcher = None
+        if options["fuzzy"]:
+            matcher = FacilityMatcher.from_database(
+                auto_threshold=options["match_threshold"],
+                review_threshold=options["review_threshold"],
             )
-            created_land_records += 1
+        importer = StreamingImporter(
+            batch_size=options["batch_size"],
+            upsert=options["upsert"],
+            retire=options["retire"],
+            matcher=matcher,
+            progress=options.get("progress"),
+        )
+        workers = max(1, min(options["workers"], len(sources)))
+        if workers == 1:
+            stats = importer.run(self.read_in_process(importer, sources))
+        else:
+            self.stdout.write(f"Parsing {len(sources)} sheet(s) with {workers} worker processes")
+            stats = importer.run(self.read_in_pool(importer, sources, workers))
 
         self.stdout.write(
             self.style.SUCCESS(
-                f"Done. Facilities created: {created_facilities}, land records created: {created_land_records}"
+                f"Done. Facilities created: {stats.facilities_created}, "
+                f"land records created: {stats.land_records_created}"
             )
         )
-
+        if options["fuzzy"]:
+            self.stdout.write(f"Facility name variants matched to existing facilities: {stats.facilities_matched}")
+        if options["upsert"]:
+            self.stdout.write(
+                f"Land records: {stats.inserted} inserted, {stats.updated} updated, "
+                f"{stats.unchanged} unchanged, {stats.retired} retired"
+            )
+        self.write_rejects(importer, options["rejects"])
+        self.write_throughput(stats)
+
+    def enqueue(self, files, options):
+        arguments = {
+            name: options[name]
+            for name in (
+                "sheet", "all_sheets", "workers", "batch_size", "upsert", "retire",
+                "fuzzy", "match_threshold", "review_threshold", "rejects",
+            )
+        }
+        job = jobs.enqueue("import_health_land", {"files": [os.path.abspath(path) for path in files], "options": arguments})
+        self.stdout.write(self.style.SUCCESS(f"Queued import job #{job.pk}; run manage.py run_worker to process it."))
+
+    def get_sources(self, files, options):
+        """List the (file, sheet) pairs to import, in a deterministic order."""
+        sources = []
+        for path in files:
+            if options["all_sheets"]:
+                sources.extend((path, sheet) for sheet in list_sheets(path))
+            elif options["sheet"]:
+                sources.extend((path, sheet) for sheet in options["sheet"])
+            else:
+                sources.append((path, None))
+        return sources
+
+    def read_in_process(self, importer, sources):
+        """Stream each sheet straight into the writer, one chunk at a time."""
+        for path, sheet in sources:
+            self.stdout.write(f"Reading Excel file: {self.label(path, sheet)}")
+            try:
+                headers, columns, rows = read_workbook(path, sheet)
+            except (RuntimeError, KeyError, OSError) as exc:
+                self.skip(path, sheet, exc, fatal=len(sources) == 1)
+                continue
+            self.write_columns(columns)
+            yield importer.normalized(rows, headers, columns, self.label(path, sheet))
+
+    def read_in_pool(self, importer, sources, workers):
+        """
+        Parse sheets in worker processes and hand the results to the writer
+        in source order, so row keys do not depend on which worker finished
+        first. The spawn start method keeps the parent's database connection
+        out of the workers; they never touch the database.
+        """
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+            paths = [path for path, _ in sources]
+            sheets = [sheet for _, sheet in sources]
+            for result in pool.map(parse_sheet, paths, sheets):
+                if result["error"]:
+                    self.skip(result["path"], result["sheet"], result["error"])
+                    continue
+                label = self.label(result["path"], result["sheet"])
+                self.stdout.write(f"Parsed {label}: {result['read']} rows")
+                yield importer.parsed(result, label)
+
+    def label(self, path, sheet):
+        return f"{path} [{sheet}]" if sheet else path
+
+    def skip(self, path, sheet, reason, fatal=False):
+        if fatal:
+            raise CommandError(str(reason))
+        self.stderr.write(self.style.WARNING(f"Skipping {self.label(path, sheet)}: {reason}"))
+
+    def write_columns(self, columns):
+        self.stdout.write("Detected columns:")
+        self.stdout.write(f"  Facility name: {columns['facility']}")
+        self.stdout.write(f"  Subcounty:     {columns['subcounty']}")
+        self.stdout.write(f"  Ward:          {columns['ward']}")
+        self.stdout.write(f"  Location:      {columns['location']}")
+        self.stdout.write(f"  Parcel:        {columns['parcel']}")
+        self.stdout.write(f"  Land size:     {columns['land_size']}")
+        self.stdout.write(f"  Land use:      {columns['land_use']}")
+        self.stdout.write(f"  Dispute:       {columns['dispute']}")
+
+    def write_rejects(self, importer, path):
+        stats = importer.stats
+        if not stats.rejected and not stats.warnings:
+            return
+        message = f"{stats.rejected} row(s) rejected, {stats.warnings} cell(s) imported blank"
+        if path:
+            importer.rejects_frame().to_csv(path, index=False)
+            message += f", see {path}"
+        else:
+            message += "; use --rejects FILE to export them"
+        self.stderr.write(self.style.WARNING(message))
+
+    def write_throughput(self, stats):
+        peak = peak_memory_mb()
+        self.stdout.write(
+            f"Rows read: {stats.rows} ({stats.skipped} skipped) in {stats.elapsed:.2f}s "
+            f"- {stats.rows_per_second:.0f} rows/sec"
+            + (f", peak memory {peak:.1f} MB" if peak is not None else "")
+        )
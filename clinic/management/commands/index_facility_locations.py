@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from clinic import geo
+from clinic.models import Facility
+
+
+class Command(BaseCommand):
+    help = "Recompute the grid cell of every facility from its GPS coordinates."
+
+    def handle(self, *args, **options):
+        updated = Facility.objects.update(geo_cell=geo.cell_expression())
+        located = Facility.objects.filter(geo_cell__isnull=False).count()
+        self.stdout.write(
+            self.style.SUCCESS(f"Done. Facilities updated: {updated}, with coordinates: {located}")
+        )
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from clinic.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recompute the land portfolio rollup table from the land records."
+
+    def handle(self, *args, **options):
+        rows = rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Done. Rollup rows: {rows}"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from clinic import search
+
+
+class Command(BaseCommand):
+    help = "Recreate the full-text search index from the facility, land record and issue tables."
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            self.stdout.write(f"No search index on {connection.vendor}; search uses plain lookups.")
+            return
+        with transaction.atomic():
+            search.rebuild()
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {search.TABLE}")
+            (documents,) = cursor.fetchone()
+        self.stdout.write(self.style.SUCCESS(f"Done. Documents indexed: {documents}"))
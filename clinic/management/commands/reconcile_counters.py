@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from clinic.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = "Recount facilities, land records and issues and repair the dashboard counters."
+
+    def handle(self, *args, **options):
+        row, drift = reconcile()
+        for name, difference in sorted(drift.items()):
+            self.stdout.write(f"{name}: was off by {difference:+d}, now {getattr(row, name)}")
+        self.stdout.write(
+            self.style.SUCCESS(f"Done. Counters corrected: {len(drift)}")
+        )
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from clinic.jobs import Worker
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (document processing, imports) until stopped."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=2,
+            help="Number of jobs run at the same time (default: 2).",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait between polls when the queue is empty.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Run the jobs that are due now, then exit.",
+        )
+
+    def handle(self, *args, **options):
+        worker = Worker(threads=max(1, options["threads"]), poll_interval=options["poll_interval"])
+        if options["once"]:
+            ran = worker.run_once()
+            self.stdout.write(self.style.SUCCESS(f"Done. Jobs run: {ran}"))
+            return
+        self.stdout.write(f"Worker {worker.worker} running {worker.threads} job(s) at a time; Ctrl-C to stop")
+        try:
+            worker.run_forever()
+        except KeyboardInterrupt:
+            self.stdout.write("Stopped.")
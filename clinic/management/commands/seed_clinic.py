@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from clinic.seeding import seed
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate synthetic facilities, each with land records and issues, with bulk inserts. "
+        "The same --seed always produces the same data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--facilities", type=int, required=True, help="Number of facilities to create.")
+        parser.add_argument("--parcels-per", type=int, default=0, help="Land records per facility.")
+        parser.add_argument("--issues-per", type=int, default=0, help="Issues per facility.")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed (default 0).")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows per bulk insert.")
+
+    def handle(self, *args, **options):
+        if min(options["facilities"], options["parcels_per"], options["issues_per"]) < 0:
+            raise CommandError("Counts cannot be negative.")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        pks = seed(
+            options["facilities"],
+            parcels_per=options["parcels_per"],
+            issues_per=options["issues_per"],
+            seed_value=options["seed"],
+            batch_size=options["batch_size"],
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Done. Facilities: {len(pks)}, land records: {len(pks) * options['parcels_per']}, "
+                f"issues: {len(pks) * options['issues_per']}"
+            )
+        )
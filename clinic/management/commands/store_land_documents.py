@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from clinic import blobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Move land documents stored under their original names into the hashed "
+        "document storage, recount references and delete unreferenced files."
+    )
+
+    def handle(self, *args, **options):
+        moved = blobs.store_legacy_documents()
+        referenced, deleted = blobs.recount()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Done. Documents moved: {moved}, blobs referenced: {referenced}, "
+                f"unreferenced files deleted: {deleted}"
+            )
+        )
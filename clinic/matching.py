@@ -0,0 +1,184 @@
+"""
+Fuzzy matching and merging of duplicate facilities.
+
+Facility names arrive with spelling variants ("Kiambu H/C", "Kiambu Health
+Centre"). Names are normalized (case, punctuation, common abbreviations)
+and candidates are only compared within the same subcounty / ward block,
+so matching a facility costs one comparison per facility in its ward rather
+than one per facility in the county.
+"""
+import re
+from difflib import SequenceMatcher
+
+from django.db import transaction
+
+from .bulk_actions import delete_rows
+from .models import Facility, FacilityMatch, Issue, LandRecord
+from .signals import bulk_saved, bulk_saving
+
+# Scores at or above this are the same facility and are merged automatically.
+AUTO_MERGE_THRESHOLD = 0.92
+# Scores between this and AUTO_MERGE_THRESHOLD are queued for review.
+REVIEW_THRESHOLD = 0.80
+
+# Abbreviations seen in the county sheets, matched on whole tokens after
+# punctuation has been removed ("h/c" -> "h c").
+ABBREVIATIONS = [
+    (r"\bh c\b|\bhc\b|\bhealth center\b|\bhealth ctr\b", "health centre"),
+    (r"\bdisp\b|\bdispensery\b", "dispensary"),
+    (r"\bhosp\b|\bhsp\b", "hospital"),
+    (r"\bsub co\b|\bsub county\b|\bsubcounty\b|\bs c\b", "subcounty"),
+    (r"\bdist\b", "district"),
+    (r"\bst\b", "saint"),
+    (r"\bcath\b", "catholic"),
+    (r"\bmed\b", "medical"),
+]
+ABBREVIATIONS = [(re.compile(pattern), replacement) for pattern, replacement in ABBREVIATIONS]
+PUNCTUATION = re.compile(r"[^\w\s]|_")
+SPACES = re.compile(r"\s+")
+
+
+def normalize_name(name):
+    """Canonical form of a facility name used for matching."""
+    name = PUNCTUATION.sub(" ", str(name).lower())
+    name = SPACES.sub(" ", name).strip()
+    for pattern, replacement in ABBREVIATIONS:
+        name = pattern.sub(replacement, name)
+    return name
+
+
+def block_key(subcounty, ward):
+    """Facilities are only compared with others in the same subcounty and ward."""
+    return (normalize_name(subcounty), normalize_name(ward))
+
+
+def _sorted_tokens(name):
+    # Token order is ignored: "Mission Hospital Kijabe" == "Kijabe Mission Hospital".
+    return " ".join(sorted(name.split()))
+
+
+class FacilityMatcher:
+    """
+    In-memory index of facilities by block and normalized name.
+
+    match() returns the best existing facility for a name, with its score.
+    Exact matches on the normalized name are a dict lookup; anything else
+    is compared against the other names in the block only.
+    """
+
+    def __init__(self, auto_threshold=AUTO_MERGE_THRESHOLD, review_threshold=REVIEW_THRESHOLD):
+        self.auto_threshold = auto_threshold
+        self.review_threshold = review_threshold
+        self.blocks = {}
+
+    @classmethod
+    def from_database(cls, **kwargs):
+        matcher = cls(**kwargs)
+        for pk, name, subcounty, ward in Facility.objects.order_by("pk").values_list(
+            "pk", "name", "subcounty", "ward"
+        ):
+            matcher.add(pk, name, subcounty, ward)
+        return matcher
+
+    def add(self, pk, name, subcounty, ward):
+        names = self.blocks.setdefault(block_key(subcounty, ward), {})
+        names.setdefault(normalize_name(name), pk)
+
+    def match(self, name, subcounty, ward):
+        """Return (pk, score) of the closest facility in the block, or (None, 0.0)."""
+        names = self.blocks.get(block_key(subcounty, ward))
+        if not names:
+            return None, 0.0
+        normalized = normalize_name(name)
+        if normalized in names:
+            return names[normalized], 1.0
+
+        best_pk, best_score = None, 0.0
+        matcher = SequenceMatcher(None, "", _sorted_tokens(normalized))
+        for candidate, pk in names.items():
+            matcher.set_seq1(_sorted_tokens(candidate))
+            # Cheap upper bounds first; most candidates in a block are unrelated.
+            if matcher.real_quick_ratio() < self.review_threshold or matcher.quick_ratio() < self.review_threshold:
+                continue
+            score = matcher.ratio()
+            if score > best_score:
+                best_pk, best_score = pk, score
+        return best_pk, best_score
+
+    def is_same(self, score):
+        return score >= self.auto_threshold
+
+    def needs_review(self, score):
+        return self.review_threshold <= score < self.auto_threshold
+
+
+def queue_for_review(pairs):
+    """
+    Queue (facility_pk, duplicate_pk, score) pairs for review. Pairs that are
+    already queued or were rejected before are left alone.
+    """
+    matches = [
+        FacilityMatch(facility_id=min(a, b), duplicate_id=max(a, b), score=score)
+        for a, b, score in pairs
+    ]
+    FacilityMatch.objects.bulk_create(matches, ignore_conflicts=True)
+
+
+@transaction.atomic
+def merge_facilities(target, duplicates):
+    """
+    Merge `duplicates` into `target`: land records and issues are re-pointed
+    with one UPDATE each, blank locality fields on the target are filled in
+    from the duplicates, and the duplicates are deleted. Returns the number
+    of facilities removed.
+    """
+    target_pk = getattr(target, "pk", target)
+    duplicate_pks = [getattr(dup, "pk", dup) for dup in duplicates]
+    duplicate_pks = [pk for pk in duplicate_pks if pk != target_pk]
+    if not duplicate_pks:
+        return 0
+
+    target = Facility.objects.select_for_update().get(pk=target_pk)
+    for model in (LandRecord, Issue):
+        moved = model.objects.filter(facility_id__in=duplicate_pks)
+        pks = list(moved.values_list("pk", flat=True))
+        bulk_saving.send(sender=model, pks=pks)
+        moved.update(facility_id=target_pk)
+        bulk_saved.send(sender=model, pks=pks, created=False)
+
+    changed = []
+    for duplicate in Facility.objects.filter(pk__in=duplicate_pks).order_by("pk"):
+        for field in ("location", "gps_x", "gps_y"):
+            if getattr(target, field) in (None, "") and getattr(duplicate, field) not in (None, ""):
+                setattr(target, field, getattr(duplicate, field))
+                changed.append(field)
+    if "gps_x" in changed or "gps_y" in changed:
+        changed.append("geo_cell")
+    if changed:
+        target.save(update_fields=sorted(set(changed)) + ["updated_at", "change_seq"])
+
+    delete_rows(Facility.objects.filter(pk__in=duplicate_pks))
+    return len(duplicate_pks)
+
+
+def find_duplicates(matcher=None, facilities=None):
+    """
+    Scan facilities block by block. Returns (merges, reviews): a dict of
+    duplicate pk -> target pk for pairs at or above the auto-merge
+    threshold, and (pk, pk, score) pairs that need review. Facilities are
+    visited oldest first, so the oldest of a group is the one kept.
+    """
+    matcher = matcher or FacilityMatcher()
+    if facilities is None:
+        facilities = Facility.objects.order_by("pk").values_list("pk", "name", "subcounty", "ward")
+
+    merges, reviews = {}, []
+    for pk, name, subcounty, ward in facilities:
+        match_pk, score = matcher.match(name, subcounty, ward)
+        if match_pk is not None and matcher.is_same(score):
+            merges[pk] = match_pk
+            continue
+        if match_pk is not None and matcher.needs_review(score):
+            reviews.append((match_pk, pk, score))
+        matcher.add(pk, name, subcounty, ward)
+    return merges, reviews
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.11 on 2026-10-17 01:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Facility',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('location', models.CharField(max_length=200)),
+                ('subcounty', models.CharField(max_length=100)),
+                ('ward', models.CharField(max_length=100)),
+                ('gps_x', models.FloatField(blank=True, null=True)),
+                ('gps_y', models.FloatField(blank=True, null=True)),
+                ('facility_type', models.CharField(choices=[('Dispensary', 'Dispensary'), ('Health Center', 'Health Center'), ('Clinic', 'Clinic'), ('Hospital', 'Hospital')], default='Clinic', max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Issue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('description', models.TextField(help_text='Observation / issue on the land.')),
+                ('remarks', models.TextField(blank=True)),
+                ('recommendation', models.TextField(blank=True)),
+                ('status', models.CharField(choices=[('Open', 'Open'), ('In Progress', 'In Progress'), ('Closed', 'Closed')], default='Open', max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('facility', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='issues', to='clinic.facility')),
+                ('reported_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LandRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('parcel_number', models.CharField(blank=True, max_length=100)),
+                ('owner', models.CharField(blank=True, max_length=200)),
+                ('acreage', models.FloatField()),
+                ('ownership_status', models.CharField(blank=True, choices=[('Freehold', 'Freehold'), ('Leasehold', 'Leasehold'), ('Community', 'Community'), ('Government', 'Government')], max_length=50)),
+                ('land_use', models.CharField(blank=True, max_length=255)),
+                ('document_type', models.CharField(blank=True, choices=[('Title Deed', 'Title Deed'), ('Certificate', 'Certificate'), ('Allotment Letter', 'Allotment Letter'), ('Other', 'Other')], help_text='Type of ownership document (title deed, certificate, allotment letter, other).', max_length=50)),
+                ('proprietorship', models.CharField(blank=True, help_text='Proprietorship / ownership as per the document.', max_length=255)),
+                ('dispute_status', models.CharField(blank=True, choices=[('Disputed', 'Disputed'), ('Undisputed', 'Undisputed')], max_length=20)),
+                ('planning_status', models.CharField(blank=True, choices=[('Planned', 'Planned'), ('Unplanned', 'Unplanned')], max_length=20)),
+                ('survey_status', models.BooleanField(default=False)),
+                ('acquisition_date', models.DateField(blank=True, null=True)),
+                ('registration_date', models.DateField(blank=True, null=True)),
+                ('encumbrances', models.TextField(blank=True, help_text='Any encumbrances on the land.')),
+                ('acquisition_amount', models.DecimalField(blank=True, decimal_places=2, help_text='Acquisition amount for the land.', max_digits=14, null=True)),
+                ('fair_value', models.DecimalField(blank=True, decimal_places=2, help_text='Fair value / land index.', max_digits=14, null=True)),
+                ('disposal_date', models.DateField(blank=True, help_text='Disposal date / change of use date.', null=True)),
+                ('disposal_value', models.DecimalField(blank=True, decimal_places=2, help_text='Disposal value.', max_digits=14, null=True)),
+                ('annual_rental_income', models.DecimalField(blank=True, decimal_places=2, help_text='Annual rental income from the land.', max_digits=14, null=True)),
+                ('document', models.FileField(blank=True, null=True, upload_to='land_documents/')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('facility', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='land_records', to='clinic.facility')),
+            ],
+        ),
+    ]
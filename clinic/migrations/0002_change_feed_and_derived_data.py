@@ -0,0 +1,246 @@
+# Generated by Django 5.2.11 on 2026-10-17 01:07
+
+import clinic.storage
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FacilityMatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Rejected', 'Rejected')], default='Pending', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ImportRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('workbook', models.FileField(upload_to='imports/')),
+                ('original_name', models.CharField(blank=True, max_length=255)),
+                ('upsert', models.BooleanField(default=False, help_text='Skip unchanged rows and update changed ones.')),
+                ('retire', models.BooleanField(default=False, help_text='With upsert, delete records no longer in the file.')),
+                ('fuzzy', models.BooleanField(default=False, help_text='Match facility name variants to existing facilities.')),
+                ('rows_total', models.PositiveIntegerField(blank=True, null=True)),
+                ('rows_read', models.PositiveIntegerField(default=0)),
+                ('rows_done', models.PositiveIntegerField(default=0)),
+                ('rows_per_second', models.FloatField(default=0)),
+                ('facilities_created', models.PositiveIntegerField(default=0)),
+                ('inserted', models.PositiveIntegerField(default=0)),
+                ('updated', models.PositiveIntegerField(default=0)),
+                ('unchanged', models.PositiveIntegerField(default=0)),
+                ('rejected', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='queued', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('max_attempts', models.PositiveIntegerField(default=3)),
+                ('run_after', models.DateTimeField()),
+                ('progress_done', models.BigIntegerField(default=0)),
+                ('progress_total', models.BigIntegerField(blank=True, null=True)),
+                ('message', models.CharField(blank=True, max_length=255)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('locked_by', models.CharField(blank=True, max_length=100)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LandRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subcounty', models.CharField(max_length=100)),
+                ('ward', models.CharField(max_length=100)),
+                ('facility_type', models.CharField(max_length=50)),
+                ('ownership_status', models.CharField(max_length=50)),
+                ('dispute_status', models.CharField(max_length=20)),
+                ('record_count', models.IntegerField(default=0)),
+                ('acreage', models.FloatField(default=0)),
+                ('acquisition_amount', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('fair_value', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('disposal_value', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('annual_rental_income', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StoredBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('name', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField(default=0)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('content_type', models.CharField(blank=True, max_length=100)),
+                ('page_count', models.PositiveIntegerField(blank=True, null=True)),
+                ('text', models.TextField(blank=True)),
+                ('thumbnail', models.CharField(blank=True, max_length=255)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SummaryCounters',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facilities', models.IntegerField(default=0)),
+                ('land_records', models.IntegerField(default=0)),
+                ('disputed_land_records', models.IntegerField(default=0)),
+                ('issues', models.IntegerField(default=0)),
+                ('open_issues', models.IntegerField(default=0)),
+                ('in_progress_issues', models.IntegerField(default=0)),
+                ('closed_issues', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'summary counters',
+            },
+        ),
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('facility', 'Facility'), ('landrecord', 'Land record'), ('issue', 'Issue')], max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('change_seq', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='facility',
+            name='change_seq',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='facility',
+            name='geo_cell',
+            field=models.IntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='issue',
+            name='change_seq',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='issue',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='landrecord',
+            name='change_seq',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='landrecord',
+            name='import_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='landrecord',
+            name='import_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='landrecord',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AlterField(
+            model_name='landrecord',
+            name='document',
+            field=models.FileField(blank=True, null=True, storage=clinic.storage.document_storage, upload_to='land_documents/'),
+        ),
+        migrations.AddIndex(
+            model_name='facility',
+            index=models.Index(fields=['created_at', 'id'], name='facility_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facility',
+            index=models.Index(fields=['change_seq', 'id'], name='facility_change_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['created_at', 'id'], name='issue_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['change_seq', 'id'], name='issue_change_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='landrecord',
+            index=models.Index(fields=['created_at', 'id'], name='landrecord_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='landrecord',
+            index=models.Index(fields=['change_seq', 'id'], name='landrecord_change_idx'),
+        ),
+        migrations.AddField(
+            model_name='facilitymatch',
+            name='duplicate',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='clinic.facility'),
+        ),
+        migrations.AddField(
+            model_name='facilitymatch',
+            name='facility',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='clinic.facility'),
+        ),
+        migrations.AddField(
+            model_name='importrun',
+            name='created_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['status', 'run_after', 'id'], name='job_queue_idx'),
+        ),
+        migrations.AddField(
+            model_name='importrun',
+            name='job',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='import_run', to='clinic.job'),
+        ),
+        migrations.AddConstraint(
+            model_name='landrollup',
+            constraint=models.UniqueConstraint(fields=('subcounty', 'ward', 'facility_type', 'ownership_status', 'dispute_status'), name='unique_land_rollup'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['change_seq', 'id'], name='tombstone_change_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='facilitymatch',
+            constraint=models.UniqueConstraint(fields=('facility', 'duplicate'), name='unique_facility_match'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.11 on 2026-10-17 01:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0002_change_feed_and_derived_data'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='facility',
+            index=models.Index(fields=['subcounty', 'ward', 'name'], name='facility_locality_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facility',
+            index=models.Index(fields=['facility_type', 'created_at', 'id'], name='facility_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['facility', 'created_at', 'id'], name='issue_facility_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='issue_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='landrecord',
+            index=models.Index(fields=['facility', 'created_at', 'id'], name='landrecord_facility_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='landrecord',
+            index=models.Index(fields=['dispute_status', 'created_at', 'id'], name='landrecord_dispute_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+"""
+Fill in the facility grid cells added by 0002 for rows that were already
+there, on whichever database is being migrated. The formula is copied from
+clinic.geo.cell_expression() as it stood when this migration was written,
+so later changes to that module do not change what this migration does.
+
+The other derived data (the search index, land rollups and document
+references) is built by application code that follows the current models,
+so it is not filled here. After deploying 0002-0004, run once:
+
+    python manage.py fill_derived_data
+
+clinic.signals keeps all of it up to date from then on.
+"""
+from django.db import migrations
+from django.db.models import F, IntegerField
+from django.db.models.functions import Cast, Floor
+
+CELL_SIZE = 0.01
+COLUMNS = 36000
+
+
+def fill_geo_cells(apps, schema_editor):
+    Facility = apps.get_model("clinic", "Facility")
+    row = Floor((F("gps_y") + 90) / CELL_SIZE)
+    column = Floor((F("gps_x") + 180) / CELL_SIZE)
+    Facility.objects.using(schema_editor.connection.alias).update(
+        geo_cell=Cast(row * COLUMNS + column, IntegerField())
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0003_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_geo_cells, migrations.RunPython.noop),
+    ]
@@ -1,11 +1,62 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.utils import timezone
+
+from . import geo
+from .storage import blob_hash, document_storage
+
+
+class FacilityQuerySet(models.QuerySet):
+    """Location lookups on the geo_cell grid index (see clinic.geo)."""
+
+    def within_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        return self.filter(geo.bbox_filter(min_lat, min_lon, max_lat, max_lon))
+
+    def with_distance(self, lat, lon):
+        return self.annotate(distance_km=geo.DistanceKm(lat, lon))
+
+    def within_radius(self, lat, lon, radius_km):
+        """Facilities within radius_km of (lat, lon), nearest first, with distance_km."""
+        return (
+            self.within_bbox(*geo.radius_bbox(lat, lon, radius_km))
+            .with_distance(lat, lon)
+            .filter(distance_km__lte=radius_km)
+            .order_by("distance_km", "pk")
+        )
+
+    def nearest(self, lat, lon, k=1, start_km=2.0, max_km=2000.0):
+        """
+        The k facilities nearest to (lat, lon), with distance_km. Searches
+        circles of doubling radius until one holds k facilities: everything
+        inside the circle is nearer than anything outside it.
+        """
+        radius = start_km
+        while True:
+            found = list(self.within_radius(lat, lon, radius)[:k])
+            if len(found) >= k:
+                return found
+            if radius >= max_km:
+                located = self.filter(gps_x__isnull=False, gps_y__isnull=False)
+                return list(located.with_distance(lat, lon).order_by("distance_km", "pk")[:k])
+            radius *= 2
+
+
+class ChangeTrackedMixin:
+    """
+    Saves in a transaction of their own (or the caller's), so the change_seq
+    allocated in pre_save and the row it numbers commit together.
+    """
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get("using")):
+            super().save(*args, **kwargs)
+
 
 # =========================
 # Facility / Clinic Model
 # =========================
-class Facility(models.Model):
+class Facility(ChangeTrackedMixin, models.Model):
     FACILITY_TYPES = [
         ('Dispensary', 'Dispensary'),
         ('Health Center', 'Health Center'),
@@ -20,6 +71,8 @@ class Facility(models.Model):
 
     gps_x = models.FloatField(null=True, blank=True)
     gps_y = models.FloatField(null=True, blank=True)
+    # Grid cell of (gps_y, gps_x), maintained by clinic.signals
+    geo_cell = models.IntegerField(null=True, blank=True, db_index=True, editable=False)
 
     facility_type = models.CharField(
         max_length=50,
@@ -29,6 +82,21 @@ class Facility(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Position in the change feed (see clinic.changes)
+    change_seq = models.BigIntegerField(default=0, editable=False)
+
+    objects = FacilityQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination order of the facility list
+            models.Index(fields=["created_at", "id"], name="facility_created_idx"),
+            models.Index(fields=["change_seq", "id"], name="facility_change_idx"),
+            # ?subcounty= / &ward= filters, duplicate blocking and rollups
+            models.Index(fields=["subcounty", "ward", "name"], name="facility_locality_idx"),
+            # ?facility_type= filter, in list order
+            models.Index(fields=["facility_type", "created_at", "id"], name="facility_type_idx"),
+        ]
 
     def get_absolute_url(self):
          return reverse("clinic:facility_detail", kwargs={"pk": self.pk})
@@ -37,7 +105,7 @@ class Facility(models.Model):
 # =========================
 # Land Record Model
 # =========================
-class LandRecord(models.Model):
+class LandRecord(ChangeTrackedMixin, models.Model):
     OWNERSHIP_STATUS = [
         ('Freehold', 'Freehold'),
         ('Leasehold', 'Leasehold'),
@@ -161,22 +229,57 @@ class LandRecord(models.Model):
         help_text="Annual rental income from the land.",
     )
 
+    # Stored once per distinct content, under its SHA-256 (clinic.storage)
     document = models.FileField(
         upload_to="land_documents/",
+        storage=document_storage,
         null=True,
         blank=True
     )
 
+    # Set by import_health_land: a stable key for the source row and a hash
+    # of its imported values, so re-imports can skip unchanged rows.
+    import_key = models.CharField(max_length=64, blank=True, db_index=True, editable=False)
+    import_hash = models.CharField(max_length=64, blank=True, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Position in the change feed (see clinic.changes)
+    change_seq = models.BigIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination order of the land record list
+            models.Index(fields=["created_at", "id"], name="landrecord_created_idx"),
+            models.Index(fields=["change_seq", "id"], name="landrecord_change_idx"),
+            # A facility's parcels and the ?facility= / ?dispute_status= filters, in list order
+            models.Index(fields=["facility", "created_at", "id"], name="landrecord_facility_idx"),
+            models.Index(fields=["dispute_status", "created_at", "id"], name="landrecord_dispute_idx"),
+            # No index on parcel_number: ?parcel= is a substring match, which
+            # no B-tree index serves. Nothing filters or sorts on
+            # ownership_status or survey_status, so indexes there would only
+            # slow down imports.
+        ]
 
     def __str__(self):
         return f"{self.parcel_number} - {self.facility.name}"
 
+    @property
+    def document_url(self):
+        """
+        Download URL of the document, or None. Files stored before hashing
+        (until store_land_documents moves them) keep their storage URL.
+        """
+        if not self.document:
+            return None
+        sha256 = blob_hash(self.document.name)
+        return reverse("clinic:document", kwargs={"sha256": sha256}) if sha256 else self.document.url
+
 
 # =========================
 # Issue / Observation Model
 # =========================
-class Issue(models.Model):
+class Issue(ChangeTrackedMixin, models.Model):
     STATUS_CHOICES = [
         ('Open', 'Open'),
         ('In Progress', 'In Progress'),
@@ -209,8 +312,290 @@ class Issue(models.Model):
     )
 
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Position in the change feed (see clinic.changes)
+    change_seq = models.BigIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination order of the issue list
+            models.Index(fields=["created_at", "id"], name="issue_created_idx"),
+            models.Index(fields=["change_seq", "id"], name="issue_change_idx"),
+            # A facility's issues and the ?facility= / ?status= filters, in list order
+            models.Index(fields=["facility", "created_at", "id"], name="issue_facility_idx"),
+            models.Index(fields=["status", "created_at", "id"], name="issue_status_idx"),
+        ]
 
     def __str__(self):
         return f"Issue - {self.facility.name}"
 
 
+# =========================
+# Possible Duplicate Facilities
+# =========================
+class FacilityMatch(models.Model):
+    """
+    A pair of facilities whose names are similar enough to be the same place
+    but not similar enough to merge automatically. Queued for review; merging
+    deletes the duplicate (and with it this row), rejecting keeps the row so
+    the pair is not queued again.
+    """
+    STATUS_CHOICES = [
+        ('Pending', 'Pending'),
+        ('Rejected', 'Rejected'),
+    ]
+
+    facility = models.ForeignKey(
+        Facility,
+        on_delete=models.CASCADE,
+        related_name="+"
+    )
+    duplicate = models.ForeignKey(
+        Facility,
+        on_delete=models.CASCADE,
+        related_name="+"
+    )
+
+    score = models.FloatField()
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='Pending'
+    )
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["facility", "duplicate"], name="unique_facility_match"),
+        ]
+
+    def __str__(self):
+        return f"{self.facility.name} ~ {self.duplicate.name} ({self.score:.2f})"
+
+
+# =========================
+# Dashboard Counters
+# =========================
+class SummaryCounters(models.Model):
+    """
+    Running totals shown on the home page and dashboard, kept in a single
+    row (pk=1) so the pages read one row instead of counting the tables.
+    Maintained by clinic.counters; reconcile_counters repairs any drift.
+    """
+    facilities = models.IntegerField(default=0)
+    land_records = models.IntegerField(default=0)
+    disputed_land_records = models.IntegerField(default=0)
+    issues = models.IntegerField(default=0)
+    open_issues = models.IntegerField(default=0)
+    in_progress_issues = models.IntegerField(default=0)
+    closed_issues = models.IntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "summary counters"
+
+    def __str__(self):
+        return f"Counters at {self.updated_at:%Y-%m-%d %H:%M}"
+
+
+# =========================
+# Land Portfolio Rollups
+# =========================
+class LandRollup(models.Model):
+    """
+    Land record totals for one combination of subcounty, ward, facility
+    type, ownership status and dispute status. Maintained incrementally by
+    clinic.rollups; rebuild_land_rollups recomputes the table.
+    """
+    subcounty = models.CharField(max_length=100)
+    ward = models.CharField(max_length=100)
+    facility_type = models.CharField(max_length=50)
+    ownership_status = models.CharField(max_length=50)
+    dispute_status = models.CharField(max_length=20)
+
+    record_count = models.IntegerField(default=0)
+    acreage = models.FloatField(default=0)
+    acquisition_amount = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    fair_value = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    disposal_value = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    annual_rental_income = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["subcounty", "ward", "facility_type", "ownership_status", "dispute_status"],
+                name="unique_land_rollup",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.subcounty} / {self.ward}: {self.record_count} records"
+
+
+# =========================
+# Change Feed
+# =========================
+class ChangeSequence(models.Model):
+    """
+    The last change sequence number handed out, in a single row (pk=1).
+    Incrementing it locks the row until the writing transaction commits,
+    so numbers become visible in the order they were allocated.
+    """
+    value = models.BigIntegerField(default=0)
+
+
+class Tombstone(models.Model):
+    """A deleted facility, land record or issue, kept for the change feed."""
+    KIND_CHOICES = [
+        ('facility', 'Facility'),
+        ('landrecord', 'Land record'),
+        ('issue', 'Issue'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    change_seq = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["change_seq", "id"], name="tombstone_change_idx"),
+        ]
+
+    def __str__(self):
+        return f"Deleted {self.kind} {self.object_id}"
+
+
+# =========================
+# Document Blobs
+# =========================
+class StoredBlob(models.Model):
+    """
+    A file in the content-addressed document storage, with the number of
+    land records that refer to it. The file is deleted when that drops to 0.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255)
+    size = models.BigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    # Filled in by the process_document job (clinic.documents)
+    content_type = models.CharField(max_length=100, blank=True)
+    page_count = models.PositiveIntegerField(null=True, blank=True)
+    text = models.TextField(blank=True)
+    thumbnail = models.CharField(max_length=255, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
+
+
+# =========================
+# Background Jobs
+# =========================
+class Job(models.Model):
+    """A unit of background work, run by `manage.py run_worker` (clinic.jobs)."""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField()
+
+    progress_done = models.BigIntegerField(default=0)
+    progress_total = models.BigIntegerField(null=True, blank=True)
+    message = models.CharField(max_length=255, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    # Set while running; refreshed by the worker's heartbeat
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The worker's poll: queued jobs that are due, oldest first
+            models.Index(fields=["status", "run_after", "id"], name="job_queue_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+    def report(self, done, total=None, message=None):
+        """Record a handler's progress; this also refreshes the job's lock."""
+        fields = {"progress_done": done, "locked_at": timezone.now()}
+        if total is not None:
+            fields["progress_total"] = total
+        if message is not None:
+            fields["message"] = message[:255]
+        Job.objects.filter(pk=self.pk).update(**fields)
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+
+# =========================
+# Web Imports
+# =========================
+class ImportRun(models.Model):
+    """
+    A workbook uploaded for import, run by the import_workbook job. The
+    job commits in batches and records the rows committed in rows_done,
+    so a run that dies resumes from there instead of starting over.
+    """
+    workbook = models.FileField(upload_to="imports/")
+    original_name = models.CharField(max_length=255, blank=True)
+    upsert = models.BooleanField(default=False, help_text="Skip unchanged rows and update changed ones.")
+    retire = models.BooleanField(default=False, help_text="With upsert, delete records no longer in the file.")
+    fuzzy = models.BooleanField(default=False, help_text="Match facility name variants to existing facilities.")
+    job = models.OneToOneField(Job, on_delete=models.SET_NULL, null=True, blank=True, related_name="import_run")
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+
+    # Progress, updated at every checkpoint
+    rows_total = models.PositiveIntegerField(null=True, blank=True)
+    rows_read = models.PositiveIntegerField(default=0)
+    rows_done = models.PositiveIntegerField(default=0)
+    rows_per_second = models.FloatField(default=0)
+    facilities_created = models.PositiveIntegerField(default=0)
+    inserted = models.PositiveIntegerField(default=0)
+    updated = models.PositiveIntegerField(default=0)
+    unchanged = models.PositiveIntegerField(default=0)
+    rejected = models.PositiveIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return self.original_name or self.workbook.name
+
+    def get_absolute_url(self):
+        return reverse("clinic:import_detail", kwargs={"pk": self.pk})
+
+    @property
+    def status(self):
+        return self.job.status if self.job else "queued"
+
+    @property
+    def eta_seconds(self):
+        """Seconds left at the current rate, or None when unknown."""
+        if self.status != "running" or not self.rows_total or not self.rows_per_second:
+            return None
+        return max(self.rows_total - self.rows_read, 0) / self.rows_per_second
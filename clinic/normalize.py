@@ -0,0 +1,144 @@
+"""
+Column-wise normalization and validation of imported sheet rows.
+
+normalize_frame() takes a chunk of raw sheet rows as a DataFrame and does the
+string stripping, acreage parsing and dispute classification with pandas
+operations over whole columns. Rows with values that cannot be stored are
+not coerced to "" / 0.0 any more: they are left out of the typed frame and
+reported, one entry per bad cell, in a rejects frame. Cells that can be
+stored blank without losing the row (an unrecognised dispute status) are
+reported there too, as warnings, and the row is kept.
+
+Like clinic.sheets, this module does not touch Django so it can run in the
+import worker processes.
+"""
+import numpy as np
+import pandas as pd
+
+# Normalized field -> maximum length of the model field it is stored in.
+TEXT_FIELDS = {
+    "name": 200,
+    "subcounty": 100,
+    "ward": 100,
+    "location": 200,
+    "parcel_number": 100,
+    "land_use": 255,
+}
+
+# Normalized field -> key in the detected column map.
+SOURCE_COLUMNS = {
+    "name": "facility",
+    "subcounty": "subcounty",
+    "ward": "ward",
+    "location": "location",
+    "parcel_number": "parcel",
+    "land_use": "land_use",
+    "acreage": "land_size",
+    "dispute_status": "dispute",
+}
+
+OUTPUT_COLUMNS = [
+    "row", "name", "subcounty", "ward", "location", "parcel_number", "acreage", "land_use", "dispute_status",
+]
+REJECT_COLUMNS = ["row", "column", "value", "reason", "severity"]
+# "error": the row is left out; "warning": the row is imported with the cell blank.
+ERROR, WARNING = "error", "warning"
+
+# Negative forms ("not disputed", "no dispute", "non-disputed") are matched
+# before the positive one, which they contain.
+UNDISPUTED = r"\b(?:un|non)[\s-]?disputed|\bnot?\s*(?:in\s+|under\s+)?disput"
+DISPUTED = r"disput"
+
+# Sheet row of the first data row: row 1 is the header.
+FIRST_DATA_ROW = 2
+
+
+def _blank(series):
+    """True where a raw cell is empty (None / NaN / whitespace only)."""
+    return series.isna() | series.astype(str).str.strip().eq("")
+
+
+def _text(series):
+    """Raw cells as stripped strings, with empty cells as ""."""
+    return series.where(series.notna(), "").astype(str).str.strip()
+
+
+def classify_dispute(series):
+    """
+    Map free-text dispute cells onto LandRecord.DISPUTE_STATUS.
+    Returns (statuses, unrecognised) where `unrecognised` flags non-empty
+    cells that are neither disputed nor undisputed.
+    """
+    raw = _text(series).str.lower()
+    undisputed = raw.str.contains(UNDISPUTED, regex=True)
+    disputed = raw.str.contains(DISPUTED, regex=True) & ~undisputed
+    statuses = pd.Series(
+        np.select([undisputed, disputed], ["Undisputed", "Disputed"], default=""),
+        index=series.index,
+    )
+    return statuses, raw.ne("") & ~disputed & ~undisputed
+
+
+def normalize_frame(raw, columns, first_row=FIRST_DATA_ROW):
+    """
+    Normalize a DataFrame of raw sheet cells.
+
+    `columns` maps the import fields to columns of `raw` (as returned by
+    sheets.detect_columns, with None for missing columns). `first_row` is the
+    sheet row number of raw's first row, used in the rejects report.
+
+    Returns (frame, rejects, blank): the typed frame of importable rows
+    (OUTPUT_COLUMNS), a frame of rejected cells and warnings
+    (REJECT_COLUMNS) and the number of completely empty rows that were
+    skipped.
+    """
+    index = pd.RangeIndex(len(raw))
+    raw = raw.reset_index(drop=True)
+    missing = pd.Series([None] * len(raw), index=index, dtype=object)
+
+    def source(field):
+        col = columns.get(SOURCE_COLUMNS[field])
+        return (raw[col] if col is not None else missing), col
+
+    frame = pd.DataFrame({"row": index + first_row})
+    problems = []
+
+    def reject(mask, column, values, reason, severity=ERROR):
+        if mask.any():
+            problems.append(pd.DataFrame({
+                "row": frame["row"][mask],
+                "column": str(column),
+                "value": values[mask].astype(str),
+                "reason": reason,
+                "severity": severity,
+            }))
+
+    for field, max_length in TEXT_FIELDS.items():
+        values, col = source(field)
+        frame[field] = _text(values)
+        reject(frame[field].str.len() > max_length, col, values, f"longer than {max_length} characters")
+
+    values, col = source("acreage")
+    acreage = pd.to_numeric(values, errors="coerce")
+    empty = _blank(values)
+    reject(acreage.isna() & ~empty, col, values, "not a number")
+    reject(acreage < 0, col, values, "negative land size")
+    frame["acreage"] = acreage.fillna(0.0).astype("float64")
+
+    values, col = source("dispute_status")
+    frame["dispute_status"], unrecognised = classify_dispute(values)
+    reject(unrecognised, col, values, "unrecognised dispute status, imported blank", WARNING)
+
+    # Rows that are empty across every column we read are padding, not data.
+    used = {col for col in columns.values() if col is not None}
+    blank_rows = pd.concat([_blank(raw[col]) for col in used], axis=1).all(axis=1)
+
+    name_col = columns.get("facility")
+    reject(frame["name"].eq("") & ~blank_rows, name_col, source("name")[0], "missing facility name")
+
+    rejects = (
+        pd.concat(problems, ignore_index=True).sort_values("row", kind="stable")
+        if problems else pd.DataFrame(columns=REJECT_COLUMNS)
+    )
+    keep = ~blank_rows & ~frame["row"].isin(rejects["row"][rejects["severity"] == ERROR])
+    return frame[keep][OUTPUT_COLUMNS].reset_index(drop=True), rejects.reset_index(drop=True), int(blank_rows.sum())
@@ -0,0 +1,161 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are selected with a WHERE clause on the ordering columns, starting
+just after the last row of the previous page, instead of OFFSET. With an
+index on the ordering columns every page costs the same as the first one,
+and no COUNT(*) is needed: one extra row is fetched to know whether there
+is a next page.
+"""
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import Http404
+
+DEFAULT_ORDERING = ("-created_at", "-pk")
+
+
+def encode_cursor(values, backwards=False):
+    payload = json.dumps({"v": values, "b": backwards}, separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Return (values, backwards) for a cursor string; raise ValueError if it is garbled."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return list(payload["v"]), bool(payload["b"])
+    except (TypeError, KeyError, ValueError, UnicodeDecodeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+class KeysetPage:
+    """One page of results plus the cursors of its neighbours."""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Paginate `queryset` on `ordering`, which must end in a unique field
+    (the pk) so the ordering is total. Works on model querysets and on
+    .values() querysets.
+    """
+
+    def __init__(self, queryset, per_page, ordering=DEFAULT_ORDERING):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = [(name.lstrip("-"), name.startswith("-")) for name in ordering]
+
+    def _field(self, name):
+        meta = self.queryset.model._meta
+        return meta.pk if name == "pk" else meta.get_field(name)
+
+    def _value(self, obj, name):
+        if isinstance(obj, dict):
+            return obj[name] if name in obj else obj[self._field(name).attname]
+        return getattr(obj, name)
+
+    def _cursor_for(self, obj, backwards):
+        return encode_cursor([self._value(obj, name) for name, _ in self.ordering], backwards)
+
+    def _after(self, values, backwards):
+        """
+        Filter for rows strictly after `values` in the ordering (or before
+        them when going backwards): (a > x) OR (a = x AND b > y) ...
+        """
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(self.ordering, values):
+            value = self._field(name).to_python(value)
+            lookup = "lt" if descending != backwards else "gt"
+            condition |= equal & Q(**{f"{name}__{lookup}": value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def _order_by(self, backwards):
+        return [
+            ("-" if descending != backwards else "") + name
+            for name, descending in self.ordering
+        ]
+
+    def page(self, cursor=None):
+        """
+        Return the page after (or, for a backwards cursor, before) the row
+        the cursor points at. Raise Http404 for a cursor that does not decode.
+        """
+        backwards = False
+        queryset = self.queryset
+        if cursor:
+            try:
+                values, backwards = decode_cursor(cursor)
+                if len(values) != len(self.ordering):
+                    raise ValueError("Invalid cursor")
+                queryset = queryset.filter(self._after(values, backwards))
+            except (ValueError, TypeError, ValidationError) as exc:
+                raise Http404("Invalid page cursor.") from exc
+
+        rows = list(queryset.order_by(*self._order_by(backwards))[: self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+        if backwards:
+            rows.reverse()
+        if not rows:
+            return KeysetPage(rows)
+
+        # Going forwards there is a previous page if we came from a cursor;
+        # going backwards there is always a next page (the one we came from).
+        more_after = has_more if not backwards else True
+        more_before = has_more if backwards else bool(cursor)
+        return KeysetPage(
+            rows,
+            next_cursor=self._cursor_for(rows[-1], backwards=False) if more_after else None,
+            previous_cursor=self._cursor_for(rows[0], backwards=True) if more_before else None,
+        )
+
+
+class KeysetPaginationMixin:
+    """
+    ListView mixin that pages with KeysetPaginator via ?cursor=. Other query
+    parameters (search filters) are kept in the next / previous links, which
+    are available in the template as page_obj.next_url / previous_url.
+    """
+
+    paginate_by = 25
+    keyset_ordering = DEFAULT_ORDERING
+    cursor_param = "cursor"
+
+    def _page_url(self, cursor):
+        if cursor is None:
+            return None
+        query = self.request.GET.copy()
+        query[self.cursor_param] = cursor
+        return "?" + query.urlencode()
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, page_size, self.keyset_ordering)
+        page = paginator.page(self.request.GET.get(self.cursor_param))
+        page.next_url = self._page_url(page.next_cursor)
+        page.previous_url = self._page_url(page.previous_cursor)
+        return paginator, page, page.object_list, page.has_other_pages()
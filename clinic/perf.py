@@ -0,0 +1,254 @@
+"""
+Per-request performance instrumentation.
+
+PerformanceMiddleware times every request: total time, the number and
+total time of SQL statements (through a connection execute_wrapper, so it
+works with DEBUG off), the slowest few statements and the time spent
+rendering templates (through the TimedDjangoTemplates backend in
+TEMPLATES, which only times renders while a request is being timed). It
+
+- adds a Server-Timing header (db, tpl, app; shown in the browser's
+  network panel),
+- logs requests slower than CLINIC_SLOW_REQUEST_MS (default 500) to the
+  "clinic.perf" logger as one JSON object; statements are logged by shape,
+  with literals replaced by ?, so no parameter values reach the log,
+- adds the request to a per-view histogram kept in this process, shown to
+  staff by MetricsView.
+
+The cost per request is a few perf_counter() calls per statement and one
+lock acquisition for the histogram, so it can stay on in production. Each
+worker process keeps its own histograms; they start empty on restart.
+"""
+import heapq
+import json
+import logging
+import re
+import threading
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+SLOWEST = 3
+MAX_SQL = 500
+# Upper bounds of the histogram buckets, in milliseconds (plus +Inf).
+BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_current = ContextVar("clinic_perf_request", default=None)
+
+# String and number literals and placeholders; IN lists of them.
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%s")
+_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+def sql_shape(sql):
+    """The statement with every literal as ? and every IN list as (...)."""
+    return _LISTS.sub("(...)", _LITERALS.sub("?", sql))
+
+
+class RequestTimer:
+    """What one request spent its time on."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.rendering = False
+        self.slowest = []  # heap of (seconds, sql)
+
+    def __call__(self, execute, sql, params, many, context):
+        """Connection execute_wrapper."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.sql_seconds += elapsed
+            if len(self.slowest) < SLOWEST:
+                heapq.heappush(self.slowest, (elapsed, sql))
+            elif elapsed > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, (elapsed, sql))
+
+    @property
+    def total_seconds(self):
+        return time.perf_counter() - self.started
+
+    def slowest_statements(self):
+        return [
+            {"ms": round(seconds * 1000, 2), "sql": sql_shape(sql)[:MAX_SQL]}
+            for seconds, sql in sorted(self.slowest, reverse=True)
+        ]
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        timer = _current.get()
+        if timer is None or timer.rendering:
+            return super().render(context, request)
+        timer.rendering = True
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timer.template_seconds += time.perf_counter() - started
+            timer.rendering = False
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    DjangoTemplates whose renders (render_to_string, TemplateResponse) count
+    towards the current request's template time. Outside a timed request
+    they render as usual. Only the outermost render is timed: templates
+    included from inside a page are already part of its time.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.queries = 0
+        self.max_queries = 0
+        self.sql_ms = 0.0
+        self.errors = 0
+
+    def add(self, total_ms, queries, sql_ms, status):
+        index = next((i for i, bound in enumerate(BUCKETS) if total_ms <= bound), len(BUCKETS))
+        self.counts[index] += 1
+        self.count += 1
+        self.total_ms += total_ms
+        self.max_ms = max(self.max_ms, total_ms)
+        self.queries += queries
+        self.max_queries = max(self.max_queries, queries)
+        self.sql_ms += sql_ms
+        self.errors += status >= 500
+
+    def quantile(self, fraction):
+        """Upper bound of the bucket holding the quantile (None past the last bound)."""
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS + (None,), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean_ms": round(self.total_ms / self.count, 2) if self.count else 0,
+            "max_ms": round(self.max_ms, 2),
+            "p50_ms_le": self.quantile(0.50),
+            "p95_ms_le": self.quantile(0.95),
+            "p99_ms_le": self.quantile(0.99),
+            "mean_queries": round(self.queries / self.count, 2) if self.count else 0,
+            "max_queries": self.max_queries,
+            "mean_sql_ms": round(self.sql_ms / self.count, 2) if self.count else 0,
+            "buckets": {
+                str(bound) if bound else "+Inf": count
+                for bound, count in zip(BUCKETS + (None,), self.counts)
+            },
+        }
+
+
+_histograms = {}
+_lock = threading.Lock()
+STARTED_AT = timezone.now()
+
+
+def record(view, total_ms, queries, sql_ms, status):
+    with _lock:
+        histogram = _histograms.get(view)
+        if histogram is None:
+            histogram = _histograms[view] = Histogram()
+        histogram.add(total_ms, queries, sql_ms, status)
+
+
+def snapshot():
+    """The histograms of this process, by view name."""
+    with _lock:
+        return {view: histogram.as_dict() for view, histogram in sorted(_histograms.items())}
+
+
+def reset():
+    global STARTED_AT
+    with _lock:
+        _histograms.clear()
+        STARTED_AT = timezone.now()
+
+
+def server_timing(timer, total_ms):
+    return ", ".join([
+        f'db;dur={timer.sql_seconds * 1000:.1f};desc="{timer.queries} queries"',
+        f"tpl;dur={timer.template_seconds * 1000:.1f}",
+        f"app;dur={total_ms:.1f}",
+    ])
+
+
+def view_name(request):
+    match = getattr(request, "resolver_match", None)
+    return match.view_name if match is not None else "<unresolved>"
+
+
+class PerformanceMiddleware:
+    """Put first in MIDDLEWARE, so the total covers the other middleware too."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_ms = getattr(settings, "CLINIC_SLOW_REQUEST_MS", 500)
+        self.server_timing = getattr(settings, "CLINIC_SERVER_TIMING", True)
+
+    def __call__(self, request):
+        timer = RequestTimer()
+        token = _current.set(timer)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timer))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        total_ms = timer.total_seconds * 1000
+        sql_ms = timer.sql_seconds * 1000
+        view = view_name(request)
+        record(view, total_ms, timer.queries, sql_ms, response.status_code)
+        if self.server_timing:
+            response["Server-Timing"] = server_timing(timer, total_ms)
+        if total_ms >= self.slow_ms:
+            logger.warning(
+                "Slow request %s",
+                json.dumps({
+                    "view": view,
+                    "method": request.method,
+                    "path": request.path,
+                    "status": response.status_code,
+                    "total_ms": round(total_ms, 1),
+                    "sql_ms": round(sql_ms, 1),
+                    "queries": timer.queries,
+                    "template_ms": round(timer.template_seconds * 1000, 1),
+                    "slowest": timer.slowest_statements(),
+                }),
+            )
+        return response
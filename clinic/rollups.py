@@ -0,0 +1,182 @@
+"""
+Land portfolio rollups.
+
+LandRollup holds the land record count and the sums of acreage and the
+money columns for every combination of DIMENSIONS. Each write adds its
+difference to the affected rows (UPDATE ... SET x = x + delta, inserting
+the row the first time a combination appears), so reports read a few
+hundred pre-summed rows instead of aggregating the land record table.
+clinic.signals calls into this module; rebuild() recomputes everything.
+
+Groups that drop to zero records are kept (with zero sums) until the next
+rebuild; readers skip them.
+"""
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import Facility, LandRecord, LandRollup
+
+FACILITY_DIMENSIONS = ("subcounty", "ward", "facility_type")
+RECORD_DIMENSIONS = ("ownership_status", "dispute_status")
+DIMENSIONS = FACILITY_DIMENSIONS + RECORD_DIMENSIONS
+MEASURES = ("acreage", "acquisition_amount", "fair_value", "disposal_value", "annual_rental_income")
+TOTALS = ("record_count",) + MEASURES
+PK_CHUNK = 500
+
+
+def tracked_fields(model):
+    """Fields whose changes move a rollup, for pre_save snapshots."""
+    if model is Facility:
+        return list(FACILITY_DIMENSIONS)
+    if model is LandRecord:
+        return list(RECORD_DIMENSIONS + MEASURES) + ["facility_id"]
+    return []
+
+
+def instance_values(instance):
+    """The tracked fields of a model instance, as the database would return them."""
+    meta = type(instance)._meta
+    return {
+        name: meta.get_field(name).to_python(getattr(instance, name)) if name != "facility_id" else instance.facility_id
+        for name in tracked_fields(type(instance))
+    }
+
+
+def _zero(measure):
+    return 0.0 if measure == "acreage" else Decimal(0)
+
+
+def _add(groups, key, totals, sign=1):
+    group = groups.setdefault(key, {name: _zero(name) if name != "record_count" else 0 for name in TOTALS})
+    for name in TOTALS:
+        value = totals.get(name)
+        if value is not None:
+            group[name] += sign * value
+
+
+def facility_dimensions(facility_id):
+    return Facility.objects.filter(pk=facility_id).values_list(*FACILITY_DIMENSIONS).first()
+
+
+def record_key(facility_dims, values):
+    return tuple(facility_dims) + tuple(values.get(name) or "" for name in RECORD_DIMENSIONS)
+
+
+def record_totals(values):
+    return {"record_count": 1, **{name: values.get(name) for name in MEASURES}}
+
+
+def record_changes(old, new):
+    """
+    Deltas for one land record: `old` and `new` are dicts of its tracked
+    fields before and after the write, either None for a create / delete.
+    """
+    groups = {}
+    for values, sign in ((old, -1), (new, 1)):
+        if values is None:
+            continue
+        facility_dims = facility_dimensions(values["facility_id"])
+        if facility_dims is not None:
+            _add(groups, record_key(facility_dims, values), record_totals(values), sign)
+    return groups
+
+
+def _sums(rows, names):
+    """Rename the sum_<total> annotations of `rows` back to <total>."""
+    return [
+        {**{name: row[name] for name in names}, **{name: row["sum_" + name] for name in TOTALS}}
+        for row in rows
+    ]
+
+
+def _grouped(queryset):
+    names = ["facility__" + name for name in FACILITY_DIMENSIONS] + list(RECORD_DIMENSIONS)
+    rows = queryset.values(*names).annotate(
+        sum_record_count=Count("pk"), **{"sum_" + name: Sum(name) for name in MEASURES}
+    ).order_by()
+    return [(tuple(row[name] or "" for name in names), row) for row in _sums(rows, names)]
+
+
+def rows_changes(pks, sign=1):
+    """Deltas adding (sign=1) or removing (sign=-1) the given land records."""
+    groups = {}
+    pks = list(pks)
+    for start in range(0, len(pks), PK_CHUNK):
+        for key, totals in _grouped(LandRecord.objects.filter(pk__in=pks[start:start + PK_CHUNK])):
+            _add(groups, key, totals, sign)
+    return groups
+
+
+def facility_move_changes(facility_pks, old_dims=None, sign=1):
+    """
+    Deltas adding (sign=1) or removing (sign=-1) all land records of the
+    given facilities, filed under `old_dims` instead of the facilities'
+    current subcounty / ward / type when given.
+    """
+    groups = {}
+    facility_pks = list(facility_pks)
+    for start in range(0, len(facility_pks), PK_CHUNK):
+        records = LandRecord.objects.filter(facility_id__in=facility_pks[start:start + PK_CHUNK])
+        for key, totals in _grouped(records):
+            if old_dims is not None:
+                key = tuple(old_dims) + key[len(FACILITY_DIMENSIONS):]
+            _add(groups, key, totals, sign)
+    return groups
+
+
+def merge(*changes):
+    groups = {}
+    for change in changes:
+        for key, totals in change.items():
+            _add(groups, key, totals)
+    return groups
+
+
+def apply(groups):
+    """Add the deltas in `groups` ({dimension tuple: {total: delta}}) to the rollup rows."""
+    now = timezone.now()
+    for key, totals in groups.items():
+        totals = {name: value for name, value in totals.items() if value}
+        if not totals:
+            continue
+        dims = dict(zip(DIMENSIONS, key))
+        increments = {name: F(name) + value for name, value in totals.items()}
+        if LandRollup.objects.filter(**dims).update(updated_at=now, **increments):
+            continue
+        try:
+            with transaction.atomic():
+                LandRollup.objects.create(**dims, **totals)
+        except IntegrityError:
+            # Created concurrently since the UPDATE above.
+            LandRollup.objects.filter(**dims).update(updated_at=now, **increments)
+
+
+@transaction.atomic
+def rebuild():
+    """Recompute every rollup row from the land records. Returns the row count."""
+    LandRollup.objects.all().delete()
+    rows = [
+        LandRollup(**dict(zip(DIMENSIONS, key)), **{name: totals[name] or _zero(name) for name in TOTALS})
+        for key, totals in _grouped(LandRecord.objects.all())
+    ]
+    LandRollup.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def report(group_by, **filters):
+    """
+    Totals grouped by `group_by` (a list of DIMENSIONS), from the rollup
+    table, narrowed by dimension filters (e.g. subcounty="Ruiru").
+    """
+    unknown = [name for name in list(group_by) + list(filters) if name not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown dimension(s): {', '.join(unknown)}")
+    queryset = LandRollup.objects.filter(record_count__gt=0, **filters)
+    sums = {"sum_" + name: Sum(name) for name in TOTALS}
+    if not group_by:
+        return _sums([queryset.aggregate(**sums)], [])
+    rows = queryset.values(*group_by).annotate(**sums).order_by(*group_by)
+    return _sums(rows, group_by)
@@ -0,0 +1,320 @@
+"""
+Full-text search over facilities, land records and issues.
+
+Every searchable row has one document in the clinic_search table: a title
+(facility name, parcel number, or the issue's facility) and a body with the
+other text fields. On SQLite the table is an FTS5 virtual table ranked with
+bm25(); on PostgreSQL it is a plain table with a generated tsvector column
+(GIN indexed, ranked with ts_rank) plus a trigram index on the title for
+misspelt names. Other databases fall back to icontains lookups.
+
+Documents are built in SQL with INSERT ... SELECT, so reindexing one row, a
+facility's children or the whole table is a single statement. Each document
+is keyed by object id * 4 + kind code, so it can be replaced or removed
+through the primary key / rowid. clinic.signals keeps the table in sync on
+save and delete; rebuild_search_index recreates it from scratch.
+"""
+import re
+
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Q
+from django.urls import reverse
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Facility, Issue, LandRecord
+
+TABLE = "clinic_search"
+KIND_CODES = {"facility": 1, "landrecord": 2, "issue": 3}
+KIND_MODELS = {"facility": Facility, "landrecord": LandRecord, "issue": Issue}
+# Highlight markers used by snippet() / ts_headline(), swapped for <mark>
+# after the snippet has been HTML-escaped.
+MARK_START, MARK_END = "\x02", "\x03"
+PK_CHUNK = 500
+# Queries matching more documents than this are ordered newest first
+# rather than ranked (SQLite).
+RANK_LIMIT = 10000
+
+FACILITY = Facility._meta.db_table
+LANDRECORD = LandRecord._meta.db_table
+ISSUE = Issue._meta.db_table
+
+# kind -> (alias of the kind's table, SELECT producing
+# (key, kind, object_id, facility_id, title, body) without a WHERE clause).
+DOCUMENTS = {
+    "facility": ("f", f"""
+        SELECT f.id * 4 + 1, 'facility', f.id, f.id, f.name,
+               f.location || ' ' || f.subcounty || ' ' || f.ward || ' ' || f.facility_type
+        FROM {FACILITY} f"""),
+    "landrecord": ("r", f"""
+        SELECT r.id * 4 + 2, 'landrecord', r.id, r.facility_id, r.parcel_number,
+               r.owner || ' ' || r.land_use || ' ' || r.proprietorship || ' '
+               || r.encumbrances || ' ' || f.name
+        FROM {LANDRECORD} r JOIN {FACILITY} f ON f.id = r.facility_id"""),
+    "issue": ("i", f"""
+        SELECT i.id * 4 + 3, 'issue', i.id, i.facility_id, f.name,
+               i.description || ' ' || i.remarks || ' ' || i.recommendation
+        FROM {ISSUE} i JOIN {FACILITY} f ON f.id = i.facility_id"""),
+}
+
+SQLITE_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5(
+        kind UNINDEXED, object_id UNINDEXED, facility_id UNINDEXED, title, body,
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')""",
+]
+POSTGRES_DDL = [
+    f"""CREATE TABLE IF NOT EXISTS {TABLE} (
+        doc_id bigint PRIMARY KEY,
+        kind varchar(20) NOT NULL,
+        object_id bigint NOT NULL,
+        facility_id bigint NOT NULL,
+        title text NOT NULL,
+        body text NOT NULL,
+        document tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', body), 'B')
+        ) STORED)""",
+    f"CREATE INDEX IF NOT EXISTS {TABLE}_document_idx ON {TABLE} USING gin (document)",
+]
+POSTGRES_TRIGRAM_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS {TABLE}_title_trgm_idx ON {TABLE} USING gin (title gin_trgm_ops)",
+]
+
+
+def is_supported(conn=connection):
+    return conn.vendor in ("sqlite", "postgresql")
+
+
+def _key_column(conn):
+    return "rowid" if conn.vendor == "sqlite" else "doc_id"
+
+
+def ensure_index(conn=connection):
+    """Create the search table (and indexes) if it does not exist yet."""
+    if not is_supported(conn):
+        return
+    with conn.cursor() as cursor:
+        for statement in SQLITE_DDL if conn.vendor == "sqlite" else POSTGRES_DDL:
+            cursor.execute(statement)
+    if conn.vendor == "postgresql":
+        # pg_trgm needs the right to create extensions; search still works
+        # without it, just without typo tolerance on titles.
+        try:
+            with transaction.atomic(using=conn.alias), conn.cursor() as cursor:
+                for statement in POSTGRES_TRIGRAM_DDL:
+                    cursor.execute(statement)
+        except DatabaseError:
+            pass
+
+
+def _chunks(pks):
+    pks = list(pks)
+    for start in range(0, len(pks), PK_CHUNK):
+        yield pks[start:start + PK_CHUNK]
+
+
+def _reindex_where(kind, where, params):
+    alias, select = DOCUMENTS[kind]
+    code = KIND_CODES[kind]
+    table = KIND_MODELS[kind]._meta.db_table
+    key = _key_column(connection)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {TABLE} WHERE {key} IN (SELECT {alias}.id * 4 + {code} FROM {table} {alias} WHERE {where})",
+            params,
+        )
+        cursor.execute(
+            f"INSERT INTO {TABLE} ({key}, kind, object_id, facility_id, title, body) {select} WHERE {where}",
+            params,
+        )
+
+
+def reindex(kind, pks):
+    """Rebuild the documents of the given objects of one kind."""
+    if not is_supported():
+        return
+    alias = DOCUMENTS[kind][0]
+    for chunk in _chunks(pks):
+        _reindex_where(kind, f"{alias}.id IN ({', '.join(['%s'] * len(chunk))})", chunk)
+
+
+def reindex_facility_children(facility_pk):
+    """Land record / issue documents include the facility name."""
+    if not is_supported():
+        return
+    for kind in ("landrecord", "issue"):
+        alias = DOCUMENTS[kind][0]
+        _reindex_where(kind, f"{alias}.facility_id = %s", [facility_pk])
+
+
+def remove(kind, pks):
+    """Drop the documents of deleted objects."""
+    if not is_supported():
+        return
+    code = KIND_CODES[kind]
+    key = _key_column(connection)
+    with connection.cursor() as cursor:
+        for chunk in _chunks(pks):
+            cursor.execute(
+                f"DELETE FROM {TABLE} WHERE {key} IN ({', '.join(['%s'] * len(chunk))})",
+                [pk * 4 + code for pk in chunk],
+            )
+
+
+def rebuild():
+    """Recreate every document from the model tables."""
+    if not is_supported():
+        return
+    ensure_index()
+    key = _key_column(connection)
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE}")
+        for _, select in DOCUMENTS.values():
+            cursor.execute(f"INSERT INTO {TABLE} ({key}, kind, object_id, facility_id, title, body) {select}")
+
+
+def tokenize(query):
+    return re.findall(r"\w+", query.lower())
+
+
+def _snippet(text):
+    text = escape(text or "")
+    return mark_safe(text.replace(MARK_START, "<mark>").replace(MARK_END, "</mark>"))
+
+
+def result_url(kind, object_id):
+    if kind == "facility":
+        return reverse("clinic:facility_detail", kwargs={"pk": object_id})
+    if kind == "landrecord":
+        return reverse("clinic:landrecord_edit", kwargs={"pk": object_id})
+    return reverse("clinic:issue_edit", kwargs={"pk": object_id})
+
+
+def _kind_filter(kinds, params):
+    if not kinds:
+        return ""
+    params.extend(kinds)
+    return f" AND kind IN ({', '.join(['%s'] * len(kinds))})"
+
+
+def _match_expressions(tokens):
+    """
+    FTS5 MATCH expressions to try in order: every token as a whole word,
+    then with the last one as a prefix since it may still be being typed
+    ("ndumberi disp" finds "Ndumberi Dispensary"). Prefix queries read the
+    whole doclist of every term they expand to, so they are only run when
+    whole words do not find enough rows.
+    """
+    exact = " ".join('"{}"'.format(token) for token in tokens)
+    if len(tokens[-1]) < 2:
+        return [exact]
+    return [exact, exact + "*"]
+
+
+def _search_sqlite(tokens, kinds, limit):
+    with connection.cursor() as cursor:
+        for match in _match_expressions(tokens):
+            params = [match]
+            where = _kind_filter(kinds, params)
+            cursor.execute(
+                f"SELECT COUNT(*) FROM (SELECT 1 FROM {TABLE} WHERE {TABLE} MATCH %s{where} LIMIT {RANK_LIMIT + 1})",
+                params,
+            )
+            count = cursor.fetchone()[0]
+            if count >= limit:
+                break
+        # bm25() is computed for every match before sorting, so for terms
+        # that match most of the table order by recency instead.
+        order = "rank" if count <= RANK_LIMIT else "rowid DESC"
+        cursor.execute(
+            f"""
+            SELECT kind, object_id, facility_id, title,
+                   snippet({TABLE}, 4, %s, %s, '…', 16),
+                   bm25({TABLE}, 0, 0, 0, 10.0, 1.0) AS rank
+            FROM {TABLE} WHERE {TABLE} MATCH %s{where}
+            ORDER BY {order} LIMIT %s""",
+            [MARK_START, MARK_END, *params, limit],
+        )
+        return cursor.fetchall()
+
+
+def _has_trigram():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def _search_postgres(tokens, kinds, query, limit):
+    tsquery = " & ".join(tokens[:-1] + [f"{tokens[-1]}:*" if len(tokens[-1]) > 1 else tokens[-1]])
+    options = f"StartSel={MARK_START}, StopSel={MARK_END}, MaxWords=20, MinWords=5"
+    if _has_trigram():
+        # Titles also match on trigram similarity, which catches misspelt names.
+        rank, rank_params = "ts_rank(document, q) + similarity(title, %s)", [query]
+        match, match_params = "(document @@ q OR title %% %s)", [query]
+    else:
+        rank, rank_params = "ts_rank(document, q)", []
+        match, match_params = "document @@ q", []
+    params = [options, *rank_params, tsquery, *match_params]
+    where = _kind_filter(kinds, params)
+    params.append(limit)
+    sql = f"""
+        SELECT kind, object_id, facility_id, title,
+               ts_headline('simple', body, q, %s), {rank} AS rank
+        FROM {TABLE}, to_tsquery('simple', %s) q
+        WHERE {match}{where}
+        ORDER BY rank DESC LIMIT %s"""
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _search_fallback(tokens, kinds, limit):
+    """icontains search for databases without a search index."""
+    fields = {
+        "facility": ("name", "location", "subcounty", "ward"),
+        "landrecord": ("parcel_number", "owner", "land_use", "encumbrances", "facility__name"),
+        "issue": ("description", "remarks", "recommendation", "facility__name"),
+    }
+    rows = []
+    for kind, model in KIND_MODELS.items():
+        if kinds and kind not in kinds:
+            continue
+        condition = Q()
+        for token in tokens:
+            token_match = Q()
+            for field in fields[kind]:
+                token_match |= Q(**{f"{field}__icontains": token})
+            condition &= token_match
+        for obj in model.objects.filter(condition).select_related(*(["facility"] if kind != "facility" else []))[:limit]:
+            facility = obj if kind == "facility" else obj.facility
+            title = obj.parcel_number if kind == "landrecord" else facility.name
+            rows.append((kind, obj.pk, facility.pk, title, "", 0))
+    return rows[:limit]
+
+
+def search(query, kinds=None, limit=20):
+    """
+    Ranked search. Returns up to `limit` dicts with kind, id, facility_id,
+    title, snippet (safe HTML with <mark> around matches) and url.
+    """
+    tokens = tokenize(query)
+    kinds = [kind for kind in (kinds or []) if kind in KIND_CODES]
+    if not tokens:
+        return []
+    if connection.vendor == "sqlite":
+        rows = _search_sqlite(tokens, kinds, limit)
+    elif connection.vendor == "postgresql":
+        rows = _search_postgres(tokens, kinds, query, limit)
+    else:
+        rows = _search_fallback(tokens, kinds, limit)
+    return [
+        {
+            "kind": kind,
+            "id": object_id,
+            "facility_id": facility_id,
+            "title": title,
+            "snippet": _snippet(snippet),
+            "url": result_url(kind, object_id),
+        }
+        for kind, object_id, facility_id, title, snippet, _ in rows
+    ]
@@ -0,0 +1,123 @@
+"""
+Synthetic facilities, land records and issues for tests and benchmarks.
+
+Everything is written with bulk_create, so seeding thousands of rows takes
+a handful of queries. Values are drawn from a seeded random.Random, so the
+same arguments always produce the same data.
+"""
+import random
+from decimal import Decimal
+
+from django.db import transaction
+
+from .models import Facility, Issue, LandRecord
+from .signals import bulk_saved
+
+SUBCOUNTIES = {
+    "Kiambu": ["Ting'ang'a", "Ndumberi", "Riabai", "Township"],
+    "Thika Town": ["Township", "Kamenu", "Hospital", "Gatuanyaga", "Ngoliba"],
+    "Ruiru": ["Gitothua", "Biashara", "Gatongora", "Kahawa Sukari", "Kahawa Wendani", "Kiuu", "Mwiki", "Mwihoko"],
+    "Limuru": ["Bibirioni", "Limuru Central", "Ndeiya", "Limuru East", "Ngecha Tigoni"],
+    "Gatundu North": ["Gituamba", "Githobokoni", "Chania", "Mang'u"],
+    "Lari": ["Kinale", "Kijabe", "Nyanduma", "Kamburu", "Lari/Kirenga"],
+}
+PLACES = ["Kiambu", "Ndumberi", "Riabai", "Githunguri", "Kamenu", "Kijabe", "Ngecha", "Mwiki", "Kiuu", "Ngoliba"]
+FACILITY_SUFFIXES = {
+    "Dispensary": "Dispensary",
+    "Health Center": "Health Centre",
+    "Clinic": "Medical Clinic",
+    "Hospital": "Level 4 Hospital",
+}
+LAND_USES = ["Health facility", "Staff houses", "Vacant", "Farming", "Leased out", "Parking"]
+OWNERS = ["County Government of Kiambu", "Ministry of Health", "Catholic Diocese", "Community", "Private"]
+ISSUE_TEXT = [
+    "Encroachment on the eastern boundary.",
+    "Title deed not yet processed.",
+    "Boundary beacons missing.",
+    "Ownership disputed by neighbouring school.",
+    "Part of the land used for informal market.",
+]
+
+
+def _facility(rng, index):
+    subcounty = rng.choice(list(SUBCOUNTIES))
+    facility_type = rng.choice([choice for choice, _ in Facility.FACILITY_TYPES])
+    return Facility(
+        name=f"{rng.choice(PLACES)} {FACILITY_SUFFIXES[facility_type]} {index}",
+        location=rng.choice(PLACES),
+        subcounty=subcounty,
+        ward=rng.choice(SUBCOUNTIES[subcounty]),
+        gps_x=round(rng.uniform(36.55, 37.25), 6),
+        gps_y=round(rng.uniform(-1.30, -0.75), 6),
+        facility_type=facility_type,
+    )
+
+
+def _land_record(rng, facility_pk, index):
+    disputed = rng.random() < 0.15
+    return LandRecord(
+        facility_id=facility_pk,
+        parcel_number=f"KIAMBU/{rng.choice(PLACES).upper()}/{index}",
+        owner=rng.choice(OWNERS),
+        acreage=round(rng.uniform(0.1, 25), 2),
+        ownership_status=rng.choice([choice for choice, _ in LandRecord.OWNERSHIP_STATUS]),
+        land_use=rng.choice(LAND_USES),
+        document_type=rng.choice([choice for choice, _ in LandRecord.DOCUMENT_TYPES]),
+        dispute_status="Disputed" if disputed else "Undisputed",
+        survey_status=rng.random() < 0.6,
+        acquisition_amount=Decimal(rng.randrange(100_000, 20_000_000)),
+        fair_value=Decimal(rng.randrange(500_000, 50_000_000)),
+        annual_rental_income=Decimal(rng.randrange(0, 500_000)) if rng.random() < 0.2 else None,
+    )
+
+
+def _issue(rng, facility_pk):
+    return Issue(
+        facility_id=facility_pk,
+        description=rng.choice(ISSUE_TEXT),
+        status=rng.choice([choice for choice, _ in Issue.STATUS_CHOICES]),
+    )
+
+
+@transaction.atomic
+def add_land_records(facility_pks, per_facility, rng=None, batch_size=1000):
+    """Create `per_facility` land records for each facility pk."""
+    rng = rng or random.Random(0)
+    start = LandRecord.objects.count()
+    records = [
+        _land_record(rng, pk, start + n)
+        for n, pk in enumerate(pk for pk in facility_pks for _ in range(per_facility))
+    ]
+    created = LandRecord.objects.bulk_create(records, batch_size=batch_size)
+    bulk_saved.send(sender=LandRecord, pks=[record.pk for record in created], created=True)
+    return created
+
+
+@transaction.atomic
+def add_issues(facility_pks, per_facility, rng=None, batch_size=1000):
+    """Create `per_facility` issues for each facility pk."""
+    rng = rng or random.Random(0)
+    issues = [_issue(rng, pk) for pk in facility_pks for _ in range(per_facility)]
+    created = Issue.objects.bulk_create(issues, batch_size=batch_size)
+    bulk_saved.send(sender=Issue, pks=[issue.pk for issue in created], created=True)
+    return created
+
+
+@transaction.atomic
+def seed(facilities, parcels_per=0, issues_per=0, seed_value=0, batch_size=1000):
+    """
+    Create `facilities` facilities, each with `parcels_per` land records and
+    `issues_per` issues. Returns the pks of the new facilities.
+    """
+    rng = random.Random(seed_value)
+    start = Facility.objects.count()
+    created = Facility.objects.bulk_create(
+        [_facility(rng, start + index) for index in range(facilities)], batch_size=batch_size
+    )
+    pks = [facility.pk for facility in created]
+    bulk_saved.send(sender=Facility, pks=pks, created=True)
+    if parcels_per:
+        add_land_records(pks, parcels_per, rng, batch_size)
+    if issues_per:
+        add_issues(pks, issues_per, rng, batch_size)
+    return pks
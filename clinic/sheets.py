@@ -0,0 +1,222 @@
+"""
+Reading and normalizing the county health facility / land workbooks.
+
+Nothing in here touches the database or Django models, so these functions
+can run in worker processes without setting Django up (see parse_sheet).
+Workbooks are read with openpyxl in read-only mode, so rows are streamed
+from disk rather than loaded all at once.
+"""
+import glob
+import os
+
+import pandas as pd
+
+from .normalize import FIRST_DATA_ROW, normalize_frame
+
+EXCEL_SUFFIXES = (".xlsx", ".xlsm")
+
+
+def find_column(columns, *keywords):
+    """
+    Find a column whose name (lowercased) contains ALL given keywords.
+    Accepts a DataFrame or any iterable of column names.
+    Returns the column name or None if not found.
+    """
+    for col in getattr(columns, "columns", columns):
+        if col is None:
+            continue
+        lower = str(col).lower()
+        if all(k in lower for k in keywords):
+            return col
+    return None
+
+
+def detect_columns(headers):
+    """
+    Work out which sheet columns hold the values we import.
+    Returns a dict of field -> column name (None when the column is missing).
+    """
+    columns = {
+        "facility": (
+            find_column(headers, "facility", "name")
+            or find_column(headers, "public", "utility")
+            or find_column(headers, "health", "facility")
+        ),
+        "subcounty": find_column(headers, "sub", "county"),
+        "ward": find_column(headers, "ward"),
+        "location": find_column(headers, "village") or find_column(headers, "location"),
+        # Parcel / LR number, when the sheet has one
+        "parcel": find_column(headers, "parcel"),
+        # Land size (acres / hectares / size)
+        "land_size": (
+            find_column(headers, "land", "acre")
+            or find_column(headers, "land", "ha")
+            or find_column(headers, "land", "size")
+        ),
+        # Land use description
+        "land_use": find_column(headers, "land", "use") or find_column(headers, "current", "use"),
+        # Dispute status column (e.g. "Disputed/ undisputed")
+        "dispute": find_column(headers, "disputed"),
+    }
+    if columns["facility"] is None:
+        raise RuntimeError("Could not find a column for facility/public utility name.")
+    return columns
+
+
+def iter_sheet_rows(path, sheet=None):
+    """
+    Yield the rows of one worksheet as tuples, starting with the header row.
+    The workbook is opened in read-only mode so rows are streamed from disk.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet] if sheet else workbook.worksheets[0]
+        for row in worksheet.iter_rows(values_only=True):
+            yield row
+    finally:
+        workbook.close()
+
+
+def count_data_rows(path, sheet=None):
+    """
+    Number of data rows of a worksheet according to its stored dimensions
+    (cheap, but only as exact as the file that wrote them), or None.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet] if sheet else workbook.worksheets[0]
+        return max(worksheet.max_row - 1, 0) if worksheet.max_row else None
+    finally:
+        workbook.close()
+
+
+def iter_chunks(rows, size):
+    """Group an iterable of rows into lists of at most `size` rows."""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def frame_from_rows(rows, headers, columns):
+    """
+    Build a DataFrame of the raw cells we import from a chunk of row tuples,
+    with one column per detected sheet column, labelled by its header.
+    Cells keep their Python types (dtype=object); normalize_frame does the
+    conversions.
+    """
+    raw = pd.DataFrame(rows, dtype=object)
+    data = {}
+    for col in columns.values():
+        if col is None or col in data:
+            continue
+        position = headers.index(col)
+        if position in raw.columns:
+            data[col] = raw[position]
+        else:
+            data[col] = pd.Series([None] * len(raw), index=raw.index, dtype=object)
+    return pd.DataFrame(data, index=raw.index)
+
+
+def normalize_rows(rows, headers, columns, chunk_size):
+    """
+    Normalize streamed row tuples chunk by chunk. Yields a
+    (records, rejects, blank, read) tuple per chunk: the importable rows as
+    dicts, the rejects frame, the number of empty rows and rows read.
+    """
+    first_row = FIRST_DATA_ROW
+    for chunk in iter_chunks(rows, chunk_size):
+        frame, rejects, blank = normalize_frame(frame_from_rows(chunk, headers, columns), columns, first_row)
+        first_row += len(chunk)
+        yield frame.to_dict("records"), rejects, blank, len(chunk)
+
+
+def read_workbook(path, sheet=None):
+    """
+    Open a workbook for streaming. Returns (headers, columns, rows) where
+    `rows` is a lazy iterator over the data rows as tuples.
+    """
+    sheet_rows = iter_sheet_rows(path, sheet)
+    try:
+        headers = list(next(sheet_rows))
+    except StopIteration:
+        raise RuntimeError(f"{path} is empty.")
+    columns = detect_columns(headers)
+    return headers, columns, sheet_rows
+
+
+def expand_sources(paths):
+    """
+    Expand --file arguments into a sorted, de-duplicated list of workbooks.
+    Each argument may be a file, a directory (all workbooks inside it) or a
+    glob pattern.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            matches = sorted(
+                os.path.join(path, name)
+                for name in os.listdir(path)
+                if name.lower().endswith(EXCEL_SUFFIXES) and not name.startswith("~$")
+            )
+        elif glob.has_magic(path):
+            matches = sorted(glob.glob(path))
+        else:
+            matches = [path]
+        for match in matches:
+            if match not in files:
+                files.append(match)
+    return files
+
+
+def list_sheets(path):
+    """Names of all worksheets in a workbook."""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True)
+    try:
+        return list(workbook.sheetnames)
+    finally:
+        workbook.close()
+
+
+def parse_sheet(path, sheet=None, chunk_size=5000):
+    """
+    Read, detect columns for and normalize a whole worksheet.
+
+    This is the unit of work handed to the process pool, so it only returns
+    plain picklable data: a dict with the source, the detected columns, the
+    normalized rows, the rejects report, row counts and an error message if
+    the sheet could not be imported.
+    """
+    result = {
+        "path": path,
+        "sheet": sheet,
+        "columns": None,
+        "rows": [],
+        "rejects": [],
+        "read": 0,
+        "skipped": 0,
+        "error": None,
+    }
+    try:
+        headers, columns, rows = read_workbook(path, sheet)
+    except (RuntimeError, KeyError, OSError) as exc:
+        result["error"] = str(exc)
+        return result
+
+    result["columns"] = columns
+    for records, rejects, blank, read in normalize_rows(rows, headers, columns, chunk_size):
+        result["rows"].extend(records)
+        result["rejects"].extend(rejects.to_dict("records"))
+        result["skipped"] += blank
+        result["read"] += read
+    return result
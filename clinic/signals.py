@@ -0,0 +1,343 @@
+"""
+Signal receivers that keep derived data in sync with the clinic models.
+
+Per-object saves and deletes arrive through Django's post_save / post_delete.
+Code that writes in bulk (bulk_create, bulk_update, queryset.update) bypasses
+those, so it sends bulk_saved afterwards with the pks it touched, and, when
+it changes existing rows, bulk_saving beforehand so receivers can see the
+old values.
+
+Deletes in bulk go through clinic.bulk_actions.delete_rows, which sends
+bulk_deleting (rows still there) and bulk_deleted (rows gone) per batch and
+keeps the per-row post_delete receivers below out of it.
+"""
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
+from django.dispatch import Signal, receiver
+
+from . import blobs, caching, changes, counters, geo, rollups, search
+from .models import Facility, Issue, LandRecord
+
+# Sent by bulk writers with sender=<model class>, pks=<list of pks>,
+# created=<bool>.
+bulk_saved = Signal()
+# Sent before existing rows are changed in bulk, with sender and pks. Every
+# bulk_saved with created=False must follow a bulk_saving for the same pks.
+bulk_saving = Signal()
+# Sent with sender and pks before and after rows are deleted in bulk.
+bulk_deleting = Signal()
+bulk_deleted = Signal()
+
+_deleting_in_bulk = ContextVar("clinic_deleting_in_bulk", default=False)
+
+
+@contextmanager
+def deleting_in_bulk():
+    """Silence the per-row post_delete receivers for deletes announced with bulk_deleting."""
+    token = _deleting_in_bulk.set(True)
+    try:
+        yield
+    finally:
+        _deleting_in_bulk.reset(token)
+
+KINDS = {Facility: "facility", LandRecord: "landrecord", Issue: "issue"}
+
+
+@receiver(post_migrate)
+def create_search_index(sender, app_config=None, using="default", **kwargs):
+    if app_config is not None and app_config.label == "clinic":
+        search.ensure_index(connections[using])
+
+
+@receiver(post_save, sender=Facility)
+@receiver(post_save, sender=LandRecord)
+@receiver(post_save, sender=Issue)
+def index_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    search.reindex(KINDS[sender], [instance.pk])
+    if sender is Facility and not created:
+        search.reindex_facility_children(instance.pk)
+
+
+@receiver(post_delete, sender=Facility)
+@receiver(post_delete, sender=LandRecord)
+@receiver(post_delete, sender=Issue)
+def unindex_deleted(sender, instance, **kwargs):
+    if _deleting_in_bulk.get():
+        return
+    search.remove(KINDS[sender], [instance.pk])
+
+
+@receiver(bulk_deleted)
+def unindex_bulk_deleted(sender, pks, **kwargs):
+    if sender in KINDS:
+        search.remove(KINDS[sender], pks)
+
+
+@receiver(bulk_saved)
+def index_bulk_saved(sender, pks, created=False, **kwargs):
+    if sender in KINDS:
+        search.reindex(KINDS[sender], pks)
+    if sender is Facility and not created:
+        for pk in pks:
+            search.reindex_facility_children(pk)
+
+
+def snapshot_fields(model):
+    """Fields whose previous values receivers need when a row is updated."""
+    fields = set(counters.tracked_fields(model)) | set(rollups.tracked_fields(model)) | set(blobs.tracked_fields(model))
+    if model is not Facility:
+        fields.add("facility_id")
+    return sorted(fields)
+
+
+@receiver(pre_save, sender=Facility)
+@receiver(pre_save, sender=LandRecord)
+@receiver(pre_save, sender=Issue)
+def snapshot_previous(sender, instance, raw=False, **kwargs):
+    fields = snapshot_fields(sender)
+    if raw or instance._state.adding or not fields:
+        instance._previous = None
+        return
+    instance._previous = sender.objects.filter(pk=instance.pk).values(*fields).first()
+
+
+@receiver(post_save, sender=Facility)
+@receiver(post_save, sender=LandRecord)
+@receiver(post_save, sender=Issue)
+def count_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    values = {field: getattr(instance, field) for field in counters.tracked_fields(sender)}
+    if created:
+        counters.apply(counters.contribution(sender, values))
+    elif getattr(instance, "_previous", None) is not None:
+        old = counters.contribution(sender, instance._previous)
+        counters.apply(counters.subtract(counters.contribution(sender, values), old))
+
+
+@receiver(post_delete, sender=Facility)
+@receiver(post_delete, sender=LandRecord)
+@receiver(post_delete, sender=Issue)
+def count_deleted(sender, instance, **kwargs):
+    if _deleting_in_bulk.get():
+        return
+    values = {field: getattr(instance, field) for field in counters.tracked_fields(sender)}
+    counters.apply({name: -n for name, n in counters.contribution(sender, values).items()})
+
+
+@receiver(bulk_saving)
+def uncount_bulk_saving(sender, pks, **kwargs):
+    if sender in KINDS and counters.tracked_fields(sender):
+        counters.apply({name: -n for name, n in counters.contribution_of_rows(sender, pks).items()})
+
+
+@receiver(bulk_saved)
+def count_bulk_saved(sender, pks, created=False, **kwargs):
+    if sender in KINDS and (created or counters.tracked_fields(sender)):
+        counters.apply(counters.contribution_of_rows(sender, pks))
+
+
+@receiver(bulk_deleting)
+def uncount_bulk_deleting(sender, pks, **kwargs):
+    if sender in KINDS:
+        counters.apply({name: -n for name, n in counters.contribution_of_rows(sender, pks).items()})
+
+
+def facility_ids(sender, pks):
+    if sender is Facility:
+        return set(pks)
+    ids = set()
+    for start in range(0, len(pks), counters.PK_CHUNK):
+        chunk = pks[start:start + counters.PK_CHUNK]
+        ids.update(sender.objects.filter(pk__in=chunk).values_list("facility_id", flat=True).distinct())
+    return ids
+
+
+@receiver(post_save, sender=Facility)
+@receiver(post_save, sender=LandRecord)
+@receiver(post_save, sender=Issue)
+@receiver(post_delete, sender=Facility)
+@receiver(post_delete, sender=LandRecord)
+@receiver(post_delete, sender=Issue)
+def bump_cache_versions(sender, instance, raw=False, **kwargs):
+    if raw or _deleting_in_bulk.get():
+        return
+    caching.bump([caching.model_key(sender)])
+    if sender is Facility:
+        caching.bump_facilities([instance.pk])
+    else:
+        previous = getattr(instance, "_previous", None) or {}
+        caching.bump_facilities({instance.facility_id, previous.get("facility_id", instance.facility_id)})
+
+
+@receiver(bulk_saving)
+def bump_cache_versions_bulk_saving(sender, pks, **kwargs):
+    # Rows may be moving to another facility; the one they leave changes too.
+    if sender in KINDS and sender is not Facility:
+        caching.bump_facilities(facility_ids(sender, pks))
+
+
+@receiver(bulk_saved)
+def bump_cache_versions_bulk_saved(sender, pks, **kwargs):
+    if sender in KINDS:
+        caching.bump([caching.model_key(sender)])
+        caching.bump_facilities(facility_ids(sender, pks))
+
+
+@receiver(bulk_deleting)
+def bump_cache_versions_bulk_deleting(sender, pks, **kwargs):
+    # Before the delete, while the rows still say which facility they were on.
+    if sender in KINDS:
+        caching.bump([caching.model_key(sender)])
+        caching.bump_facilities(facility_ids(sender, pks))
+
+
+connection_created.connect(geo.register_sqlite_functions)
+
+
+@receiver(pre_save, sender=Facility)
+def set_geo_cell(sender, instance, raw=False, **kwargs):
+    instance.geo_cell = geo.cell_for(instance.gps_y, instance.gps_x)
+
+
+@receiver(bulk_saved)
+def set_geo_cells_bulk_saved(sender, pks, **kwargs):
+    if sender is Facility:
+        for start in range(0, len(pks), counters.PK_CHUNK):
+            Facility.objects.filter(pk__in=pks[start:start + counters.PK_CHUNK]).update(
+                geo_cell=geo.cell_expression()
+            )
+
+
+@receiver(post_save, sender=LandRecord)
+def roll_up_saved_record(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = None if created else getattr(instance, "_previous", None)
+    if created or previous is not None:
+        rollups.apply(rollups.record_changes(previous, rollups.instance_values(instance)))
+
+
+@receiver(post_delete, sender=LandRecord)
+def roll_up_deleted_record(sender, instance, **kwargs):
+    if _deleting_in_bulk.get():
+        return
+    rollups.apply(rollups.record_changes(rollups.instance_values(instance), None))
+
+
+@receiver(post_save, sender=Facility)
+def roll_up_moved_facility(sender, instance, created, raw=False, **kwargs):
+    previous = getattr(instance, "_previous", None)
+    if raw or created or previous is None:
+        return
+    old_dims = tuple(previous[name] for name in rollups.FACILITY_DIMENSIONS)
+    if old_dims != tuple(getattr(instance, name) for name in rollups.FACILITY_DIMENSIONS):
+        rollups.apply(rollups.merge(
+            rollups.facility_move_changes([instance.pk], old_dims, sign=-1),
+            rollups.facility_move_changes([instance.pk]),
+        ))
+
+
+@receiver(bulk_saving)
+def roll_up_bulk_saving(sender, pks, **kwargs):
+    if sender is LandRecord:
+        rollups.apply(rollups.rows_changes(pks, sign=-1))
+    elif sender is Facility:
+        rollups.apply(rollups.facility_move_changes(pks, sign=-1))
+
+
+@receiver(bulk_saved)
+def roll_up_bulk_saved(sender, pks, created=False, **kwargs):
+    if sender is LandRecord:
+        rollups.apply(rollups.rows_changes(pks))
+    elif sender is Facility and not created:
+        rollups.apply(rollups.facility_move_changes(pks))
+
+
+@receiver(bulk_deleting)
+def roll_up_bulk_deleting(sender, pks, **kwargs):
+    if sender is LandRecord:
+        rollups.apply(rollups.rows_changes(pks, sign=-1))
+    elif sender is Facility:
+        # Land records left on the facilities (bulk_actions.delete_rows deletes them first).
+        rollups.apply(rollups.facility_move_changes(pks, sign=-1))
+
+
+@receiver(pre_save, sender=Facility)
+@receiver(pre_save, sender=LandRecord)
+@receiver(pre_save, sender=Issue)
+def number_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        instance.change_seq = changes.allocate()
+
+
+@receiver(post_delete, sender=Facility)
+@receiver(post_delete, sender=LandRecord)
+@receiver(post_delete, sender=Issue)
+def leave_tombstone(sender, instance, **kwargs):
+    if _deleting_in_bulk.get():
+        return
+    changes.record_deletions(sender, [instance.pk])
+
+
+@receiver(bulk_deleted)
+def leave_bulk_tombstones(sender, pks, **kwargs):
+    if sender in KINDS:
+        changes.record_deletions(sender, pks)
+
+
+@receiver(bulk_saved)
+def number_bulk_changes(sender, pks, **kwargs):
+    if sender in KINDS:
+        changes.mark_changed(sender, pks)
+
+
+@receiver(post_save, sender=LandRecord)
+def reference_saved_document(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    name = instance.document.name or ""
+    previous = None if created else getattr(instance, "_previous", None)
+    if created:
+        blobs.add_reference(name)
+    elif previous is not None and (previous["document"] or "") != name:
+        blobs.add_reference(name)
+        blobs.release(previous["document"])
+
+
+@receiver(post_delete, sender=LandRecord)
+def release_deleted_document(sender, instance, **kwargs):
+    if _deleting_in_bulk.get():
+        return
+    blobs.release(instance.document.name)
+
+
+@receiver(bulk_saved)
+def reference_bulk_created_documents(sender, pks, created=False, **kwargs):
+    if sender is LandRecord and created:
+        names = Counter()
+        for start in range(0, len(pks), counters.PK_CHUNK):
+            chunk = pks[start:start + counters.PK_CHUNK]
+            names.update(LandRecord.objects.filter(pk__in=chunk).exclude(document="").exclude(document=None)
+                         .values_list("document", flat=True))
+        for name, count in names.items():
+            blobs.add_reference(name, count)
+
+
+@receiver(bulk_deleting)
+def release_bulk_deleted_documents(sender, pks, **kwargs):
+    if sender is LandRecord:
+        names = Counter()
+        for start in range(0, len(pks), counters.PK_CHUNK):
+            chunk = pks[start:start + counters.PK_CHUNK]
+            names.update(LandRecord.objects.filter(pk__in=chunk).exclude(document="").exclude(document=None)
+                         .values_list("document", flat=True))
+        for name, count in names.items():
+            blobs.release(name, count)
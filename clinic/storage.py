@@ -0,0 +1,64 @@
+"""
+Content-addressed file storage for land documents.
+
+An upload is streamed to a temporary file chunk by chunk while its SHA-256
+is computed, then moved to <upload dir>/<first two hex digits>/<hash><ext>.
+If that file already exists the copy is dropped, so a deed uploaded for ten
+parcels is stored once. Files are shared between records, so they are only
+deleted through clinic.blobs, which counts the references to each one.
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASH_NAME = re.compile(r"(?:^|/)[0-9a-f]{2}/(?P<sha256>[0-9a-f]{64})(?:\.[A-Za-z0-9]{1,10})?$")
+
+
+def blob_hash(name):
+    """The SHA-256 a stored name was derived from, or None for other names."""
+    match = HASH_NAME.search(name or "")
+    return match.group("sha256") if match else None
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # The name is derived from the content in _save(); equal content
+        # means the same file, never a renamed copy.
+        return name
+
+    def _save(self, name, content):
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        if not re.fullmatch(r"\.[a-z0-9]{1,10}", extension):
+            extension = ""
+
+        os.makedirs(self.path(directory), exist_ok=True)
+        digest = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(dir=self.path(directory), suffix=".upload", delete=False) as temp:
+            if hasattr(content, "seek"):
+                content.seek(0)
+            for chunk in content.chunks():
+                digest.update(chunk)
+                temp.write(chunk)
+        sha256 = digest.hexdigest()
+
+        final = f"{directory}/{sha256[:2]}/{sha256}{extension}" if directory else f"{sha256[:2]}/{sha256}{extension}"
+        if self.exists(final):
+            os.remove(temp.name)
+        else:
+            os.makedirs(os.path.dirname(self.path(final)), exist_ok=True)
+            file_move_safe(temp.name, self.path(final), allow_overwrite=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(self.path(final), self.file_permissions_mode)
+        return final
+
+
+def document_storage():
+    """Storage of LandRecord.document (a callable, so settings are read when it is first used)."""
+    return ContentAddressedStorage()
@@ -0,0 +1,41 @@
+"""
+Background job handlers (see clinic.jobs). Imported when the app is ready,
+so enqueue() and the worker know every job name.
+"""
+import time
+from io import StringIO
+
+from django.core.management import call_command
+
+from . import blobs, documents
+from .importer import run_import
+from .jobs import register
+from .models import ImportRun, StoredBlob
+
+
+@register("process_document")
+def process_document(job, sha256):
+    """Extract metadata, text and a thumbnail from a newly stored document."""
+    blob = StoredBlob.objects.filter(sha256=sha256).first()
+    if blob is None:
+        return {"skipped": "document no longer stored"}
+    return documents.process(blob, blobs.get_storage(), report=job.report)
+
+
+@register("import_health_land")
+def import_health_land(job, files, options):
+    """Run the import_health_land command, reporting rows written as progress."""
+    output = StringIO()
+
+    def progress(stats):
+        rate = stats.rows / max(time.perf_counter() - stats.started, 1e-9)
+        job.report(stats.rows, message=f"{stats.rows} rows, {rate:.0f} rows/sec")
+
+    call_command("import_health_land", file=files, progress=progress, stdout=output, stderr=output, **options)
+    return {"output": output.getvalue()[-4000:]}
+
+
+@register("import_workbook")
+def import_workbook(job, run):
+    """Import a workbook uploaded on the imports page, resuming from its last checkpoint."""
+    return run_import(ImportRun.objects.get(pk=run), job)
@@ -1,5 +1,6 @@
 from django.urls import path
 from . import views
+from .models import Issue, LandRecord
 
 app_name = "clinic"
 
@@ -10,6 +11,34 @@ urlpatterns = [
     path("logout/", views.LogoutView.as_view(), name="logout"),
     path("dashboard/", views.AdminDashboardView.as_view(), name="admin_dashboard"),
 
+    # Search
+    path("search/", views.SearchView.as_view(), name="search"),
+    path("api/search/", views.SearchApiView.as_view(), name="search_api"),
+    path("api/facilities/nearby/", views.NearbyFacilitiesView.as_view(), name="facility_nearby_api"),
+
+    # Analytics
+    path("analytics/land/", views.LandAnalyticsView.as_view(), name="land_analytics"),
+    path("api/analytics/land/", views.LandAnalyticsApiView.as_view(), name="land_analytics_api"),
+
+    # JSON API
+    path("api/v1/facilities/", views.ApiListView.as_view(resource_name="facilities"), name="api_facility_list"),
+    path("api/v1/facilities/<int:pk>/", views.ApiDetailView.as_view(resource_name="facilities"), name="api_facility_detail"),
+    path("api/v1/landrecords/", views.ApiListView.as_view(resource_name="landrecords"), name="api_landrecord_list"),
+    path("api/v1/landrecords/bulk/", views.ApiBulkActionView.as_view(model=LandRecord), name="api_landrecord_bulk"),
+    path("api/v1/landrecords/<int:pk>/", views.ApiDetailView.as_view(resource_name="landrecords"), name="api_landrecord_detail"),
+    path("api/v1/issues/", views.ApiListView.as_view(resource_name="issues"), name="api_issue_list"),
+    path("api/v1/issues/bulk/", views.ApiBulkActionView.as_view(model=Issue), name="api_issue_bulk"),
+    path("api/v1/issues/<int:pk>/", views.ApiDetailView.as_view(resource_name="issues"), name="api_issue_detail"),
+    path("api/v1/sync/", views.SyncView.as_view(), name="api_sync"),
+    path("api/v1/batch/", views.BatchView.as_view(), name="api_batch"),
+    path("api/v1/jobs/<int:pk>/", views.JobStatusView.as_view(), name="api_job_status"),
+    path("api/v1/imports/<int:pk>/", views.ImportStatusApiView.as_view(), name="api_import_status"),
+    path("api/metrics/", views.MetricsView.as_view(), name="metrics"),
+
+    # Web imports
+    path("imports/", views.ImportListView.as_view(), name="import_list"),
+    path("imports/<int:pk>/", views.ImportDetailView.as_view(), name="import_detail"),
+
     # Facility URLs
     path("facilities/", views.FacilityListView.as_view(), name="facility_list"),
     path("facility/add/", views.FacilityCreateView.as_view(), name="facility_add"),
@@ -22,13 +51,18 @@ urlpatterns = [
 
     # LandRecord URLs
     path("landrecords/", views.LandRecordListView.as_view(), name="landrecord_list"),
+    path("landrecords/export.csv", views.LandRecordExportView.as_view(), {"format": "csv"}, name="landrecord_export_csv"),
+    path("landrecords/export.xlsx", views.LandRecordExportView.as_view(), {"format": "xlsx"}, name="landrecord_export_xlsx"),
+    path("landrecords/bulk/", views.BulkActionView.as_view(model=LandRecord, success_url="clinic:landrecord_list"), name="landrecord_bulk"),
     path("landrecords/add/", views.LandRecordCreateView.as_view(), name="landrecord_add"),
     path("landrecords/<int:pk>/", views.LandRecordDetailView.as_view(), name="landrecord_detail"),
     path("landrecords/<int:pk>/edit/", views.LandRecordUpdateView.as_view(), name="landrecord_edit"),
+    path("documents/<str:sha256>/", views.DocumentView.as_view(), name="document"),
     path("landrecords/<int:pk>/delete/", views.LandRecordDeleteView.as_view(), name="landrecord_delete"),
 
     # Issue URLs
     path("issues/", views.IssueListView.as_view(), name="issue_list"),
+    path("issues/bulk/", views.BulkActionView.as_view(model=Issue, success_url="clinic:issue_list"), name="issue_bulk"),
     path("issues/<int:pk>/", views.IssueDetailView.as_view(), name="issue_detail"),
     path("issues/<int:pk>/edit/", views.IssueUpdateView.as_view(), name="issue_edit"),
     path("issues/<int:pk>/delete/", views.IssueDeleteView.as_view(), name="issue_delete"),
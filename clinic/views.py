@@ -1,12 +1,30 @@
+import json
+import math
+import os
+import tempfile
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.exceptions import ValidationError
+from django.http import FileResponse, Http404, HttpResponseBadRequest, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.urls import reverse_lazy, reverse
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.utils.http import url_has_allowed_host_and_scheme, urlencode
 from django.views import generic
+from django.views.decorators.gzip import gzip_page
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.auth import logout
 from django.contrib.auth.views import LoginView
 
-from .models import Facility, LandRecord, Issue
-from .forms import LandRecordForm, FacilityLocalityForm, IssueForm
+from .models import Facility, ImportRun, Job, LandRecord, Issue, StoredBlob
+from .forms import LandRecordForm, FacilityLocalityForm, IssueForm, ImportRunForm
+from . import api, batch, blobs, bulk_actions, caching, changes, exports, jobs, perf, rollups, search
+from .caching import CachedPageMixin
+from .counters import get_counters
+from .exports import filter_land_records
+from .pagination import KeysetPaginationMixin
 from django.views.generic import CreateView, DetailView, ListView, UpdateView, DeleteView
 
 
@@ -15,9 +33,7 @@ class HomeView(generic.TemplateView):
 
 	def get_context_data(self, **kwargs):
 		ctx = super().get_context_data(**kwargs)
-		ctx["facility_count"] = Facility.objects.count()
-		ctx["landrecord_count"] = LandRecord.objects.count()
-		ctx["issue_count"] = Issue.objects.count()
+		ctx["counters"] = get_counters()
 		return ctx
 
 
@@ -38,9 +54,8 @@ class AdminDashboardView(AdminRequiredMixin, generic.TemplateView):
 
 	def get_context_data(self, **kwargs):
 		ctx = super().get_context_data(**kwargs)
-		ctx["facility_count"] = Facility.objects.count()
-		ctx["landrecord_count"] = LandRecord.objects.count()
-		ctx["issue_count"] = Issue.objects.count()
+		ctx["counters"] = get_counters()
+		ctx["cache_stats"] = caching.stats()
 		ctx["recent_facilities"] = Facility.objects.order_by("-created_at")[:5]
 		return ctx
 
@@ -68,14 +83,381 @@ class AppLoginView(LoginView):
 		return reverse_lazy("clinic:admin_dashboard")
 
 
+# -------------------------
+# Search Views
+# -------------------------
+class SearchView(AdminRequiredMixin, generic.TemplateView):
+	"""
+	Ranked search over facilities, land records and issues: ?q=...&kind=...
+	"""
+
+	template_name = "clinic/search.html"
+	limit = 50
+
+	def get_results(self):
+		query = self.request.GET.get("q", "")
+		kinds = self.request.GET.getlist("kind")
+		return query, kinds, search.search(query, kinds=kinds, limit=self.limit)
+
+	def get_context_data(self, **kwargs):
+		ctx = super().get_context_data(**kwargs)
+		ctx["query"], ctx["kinds"], ctx["results"] = self.get_results()
+		return ctx
+
+
+class SearchApiView(SearchView):
+	"""
+	JSON version of SearchView.
+	"""
+
+	def get(self, request, *args, **kwargs):
+		try:
+			self.limit = max(1, min(int(request.GET.get("limit", 20)), 100))
+		except ValueError:
+			self.limit = 20
+		query, kinds, results = self.get_results()
+		for result in results:
+			result["snippet"] = str(result["snippet"])
+		return JsonResponse({"query": query, "results": results})
+
+
+class NearbyFacilitiesView(AdminRequiredMixin, generic.View):
+	"""
+	Facilities by location, as JSON. One of:
+	?lat=&lon=&radius_km=   within a radius, nearest first
+	?lat=&lon=&k=           the k nearest
+	?bbox=min_lat,min_lon,max_lat,max_lon
+	optionally narrowed with &type=<facility type>.
+	"""
+
+	max_results = 500
+	fields = ("id", "name", "facility_type", "subcounty", "ward", "gps_y", "gps_x")
+
+	def get(self, request, *args, **kwargs):
+		try:
+			facilities = self.get_facilities(request.GET)
+		except ValueError as exc:
+			return JsonResponse({"error": str(exc)}, status=400)
+		results = [
+			{
+				"id": facility.pk,
+				"name": facility.name,
+				"facility_type": facility.facility_type,
+				"subcounty": facility.subcounty,
+				"ward": facility.ward,
+				"lat": facility.gps_y,
+				"lon": facility.gps_x,
+				"distance_km": getattr(facility, "distance_km", None),
+			}
+			for facility in facilities
+		]
+		return JsonResponse({"results": results})
+
+	def get_facilities(self, params):
+		queryset = Facility.objects.only(*self.fields)
+		if params.get("type"):
+			queryset = queryset.filter(facility_type=params["type"])
+		if params.get("bbox"):
+			try:
+				min_lat, min_lon, max_lat, max_lon = map(float, params["bbox"].split(","))
+			except ValueError:
+				raise ValueError("bbox must be min_lat,min_lon,max_lat,max_lon")
+			if not all(math.isfinite(value) for value in (min_lat, min_lon, max_lat, max_lon)):
+				raise ValueError("bbox must be finite numbers")
+			return queryset.within_bbox(min_lat, min_lon, max_lat, max_lon).order_by("pk")[: self.max_results]
+		try:
+			lat, lon = float(params["lat"]), float(params["lon"])
+		except (KeyError, ValueError):
+			raise ValueError("lat and lon are required")
+		if not (math.isfinite(lat) and math.isfinite(lon)) or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+			raise ValueError("lat or lon out of range")
+		if params.get("radius_km"):
+			radius_km = float(params["radius_km"])
+			if not math.isfinite(radius_km) or not 0 < radius_km <= 20000:
+				raise ValueError("radius_km must be between 0 and 20000")
+			return queryset.within_radius(lat, lon, radius_km)[: self.max_results]
+		k = int(params.get("k", 1))
+		if not 1 <= k <= self.max_results:
+			raise ValueError(f"k must be between 1 and {self.max_results}")
+		return queryset.nearest(lat, lon, k)
+
+
+# -------------------------
+# Analytics Views
+# -------------------------
+class LandAnalyticsView(AdminRequiredMixin, generic.TemplateView):
+	"""
+	Land portfolio totals from the rollup table:
+	?group_by=subcounty&group_by=ward&dispute_status=Disputed ...
+	"""
+
+	template_name = "clinic/land_analytics.html"
+	default_group_by = ["subcounty"]
+
+	def get_report(self):
+		group_by = [name for name in self.request.GET.getlist("group_by") if name] or self.default_group_by
+		filters = {
+			name: self.request.GET[name] for name in rollups.DIMENSIONS if self.request.GET.get(name)
+		}
+		return group_by, filters, rollups.report(group_by, **filters)
+
+	def get(self, request, *args, **kwargs):
+		try:
+			self.report = self.get_report()
+		except ValueError as exc:
+			return HttpResponseBadRequest(str(exc))
+		return super().get(request, *args, **kwargs)
+
+	def drill_down_url(self, group_by, filters, name, value):
+		"""The same report narrowed to name=value; replaces any filter on name already set."""
+		query = [("group_by", dimension) for dimension in group_by]
+		query += {**filters, name: "" if value is None else value}.items()
+		return "?" + urlencode(query)
+
+	def get_context_data(self, **kwargs):
+		ctx = super().get_context_data(**kwargs)
+		group_by, filters, rows = self.report
+		ctx["group_by"], ctx["filters"] = group_by, filters
+		ctx["rows"] = [
+			(row, [(row.get(name), self.drill_down_url(group_by, filters, name, row.get(name))) for name in group_by])
+			for row in rows
+		]
+		ctx["dimensions"] = rollups.DIMENSIONS
+		return ctx
+
+
+class LandAnalyticsApiView(LandAnalyticsView):
+	"""
+	JSON version of LandAnalyticsView.
+	"""
+
+	def get(self, request, *args, **kwargs):
+		try:
+			group_by, filters, rows = self.get_report()
+		except ValueError as exc:
+			return JsonResponse({"error": str(exc)}, status=400)
+		return JsonResponse({"group_by": group_by, "filters": filters, "results": rows})
+
+
+# -------------------------
+# JSON API (v1)
+# -------------------------
+class ApiAccessMixin(AdminRequiredMixin):
+	"""
+	Staff-only like the pages, but answers with a JSON 403 instead of a
+	redirect to the login page.
+	"""
+
+	def handle_no_permission(self):
+		return JsonResponse({"error": "Staff login required."}, status=403)
+
+
+class ApiListView(ApiAccessMixin, generic.View):
+	"""
+	?fields=a,b  ?include=rel  ?limit=n  ?cursor=...  plus the resource's filters.
+	"""
+
+	resource_name = None
+
+	def get(self, request, *args, **kwargs):
+		resource = api.RESOURCES[self.resource_name]
+		try:
+			limit = int(request.GET.get("limit", api.DEFAULT_LIMIT))
+		except ValueError:
+			return JsonResponse({"error": "limit must be a number"}, status=400)
+		limit = max(1, min(limit, api.MAX_LIMIT))
+		try:
+			rows, next_cursor, previous_cursor = resource.page(request.GET, request.GET.get("cursor"), limit)
+		except ValueError as exc:
+			return JsonResponse({"error": str(exc)}, status=400)
+		except Http404:
+			return JsonResponse({"error": "Invalid cursor."}, status=400)
+		return JsonResponse({
+			"results": rows,
+			"next": self.page_url(next_cursor),
+			"previous": self.page_url(previous_cursor),
+		})
+
+	def page_url(self, cursor):
+		if cursor is None:
+			return None
+		query = self.request.GET.copy()
+		query["cursor"] = cursor
+		return self.request.build_absolute_uri(f"{self.request.path}?{query.urlencode()}")
+
+
+class ApiDetailView(ApiAccessMixin, generic.View):
+	resource_name = None
+
+	def get(self, request, *args, **kwargs):
+		try:
+			row = api.RESOURCES[self.resource_name].get(kwargs["pk"], request.GET)
+		except ValueError as exc:
+			return JsonResponse({"error": str(exc)}, status=400)
+		if row is None:
+			return JsonResponse({"error": "Not found."}, status=404)
+		return JsonResponse(row)
+
+
+@method_decorator(gzip_page, name="dispatch")
+class SyncView(ApiAccessMixin, generic.View):
+	"""
+	Change feed for offline devices: ?since=<next from the previous batch>
+	&limit=n. Without `since` the feed starts from the beginning; keep
+	asking with the returned `next` while `has_more` is true.
+	"""
+
+	# Rows carry the fields the API exposes.
+	fields = {
+		"facility": api.RESOURCES["facilities"].fields,
+		"landrecord": api.RESOURCES["landrecords"].fields,
+		"issue": api.RESOURCES["issues"].fields,
+	}
+
+	def get(self, request, *args, **kwargs):
+		try:
+			limit = int(request.GET.get("limit", changes.DEFAULT_LIMIT))
+		except ValueError:
+			return JsonResponse({"error": "limit must be a number"}, status=400)
+		limit = max(1, min(limit, changes.MAX_LIMIT))
+		try:
+			batch = changes.changes_since(request.GET.get("since"), fields=self.fields, limit=limit)
+		except ValueError:
+			return JsonResponse({"error": "Invalid token."}, status=400)
+		return JsonResponse(batch, json_dumps_params={"separators": (",", ":")})
+
+
+class BatchView(ApiAccessMixin, generic.View):
+	"""
+	POST NDJSON or a JSON array of land records and issues (see clinic.batch).
+	Valid items are created in one transaction; the response has one result
+	per item.
+	"""
+
+	def post(self, request, *args, **kwargs):
+		try:
+			items = batch.parse(request.body, request.content_type)
+		except ValueError as exc:
+			return JsonResponse({"error": str(exc)}, status=400)
+		results = batch.ingest(items, request.user)
+		created = sum(result["status"] == "created" for result in results)
+		return JsonResponse({"created": created, "invalid": len(results) - created, "results": results})
+
+
+class ApiBulkActionView(ApiAccessMixin, generic.View):
+	"""
+	POST {"ids": [...], "field": "status", "value": "Closed"}: one UPDATE for
+	all the rows (see clinic.bulk_actions).
+	"""
+
+	model = None
+
+	def post(self, request, *args, **kwargs):
+		try:
+			payload = json.loads(request.body)
+			updated = bulk_actions.apply(self.model, payload["ids"], payload["field"], payload.get("value"))
+		except (ValueError, KeyError, TypeError):
+			return JsonResponse({"error": "Expected {\"ids\": [...], \"field\": ..., \"value\": ...}."}, status=400)
+		except ValidationError as exc:
+			return JsonResponse({"error": " ".join(exc.messages)}, status=400)
+		return JsonResponse({"updated": updated})
+
+
+class JobStatusView(ApiAccessMixin, generic.View):
+	"""Status and progress of a background job (see clinic.jobs)."""
+
+	def get(self, request, *args, **kwargs):
+		job = Job.objects.filter(pk=kwargs["pk"]).first()
+		if job is None:
+			return JsonResponse({"error": "Not found."}, status=404)
+		return JsonResponse(jobs.status(job))
+
+
+class ImportStatusApiView(ApiAccessMixin, generic.View):
+	"""Progress of a web import, polled by its page."""
+
+	def get(self, request, *args, **kwargs):
+		run = ImportRun.objects.select_related("job").filter(pk=kwargs["pk"]).first()
+		if run is None:
+			return JsonResponse({"error": "Not found."}, status=404)
+		return JsonResponse(import_status(run))
+
+
+class MetricsView(ApiAccessMixin, generic.View):
+	"""Request timing histograms per view, of this process (see clinic.perf)."""
+
+	def get(self, request, *args, **kwargs):
+		return JsonResponse({
+			"pid": os.getpid(),
+			"started_at": perf.STARTED_AT.isoformat(),
+			"slow_request_ms": getattr(settings, "CLINIC_SLOW_REQUEST_MS", 500),
+			"views": perf.snapshot(),
+		})
+
+
+def import_status(run):
+	return {
+		"id": run.pk,
+		"status": run.status,
+		"rows_total": run.rows_total,
+		"rows_read": run.rows_read,
+		"rows_done": run.rows_done,
+		"rows_per_second": round(run.rows_per_second, 1),
+		"eta_seconds": round(run.eta_seconds) if run.eta_seconds is not None else None,
+		"facilities_created": run.facilities_created,
+		"inserted": run.inserted,
+		"updated": run.updated,
+		"unchanged": run.unchanged,
+		"rejected": run.rejected,
+		"attempts": run.job.attempts if run.job else 0,
+		"error": jobs.status(run.job)["error"] if run.job else "",
+	}
+
+
+# -------------------------
+# Web Imports
+# -------------------------
+class ImportListView(AdminRequiredMixin, generic.CreateView):
+	"""Upload a workbook to import in the background, and the recent imports."""
+	model = ImportRun
+	form_class = ImportRunForm
+	template_name = "clinic/import_list.html"
+
+	def get_context_data(self, **kwargs):
+		context = super().get_context_data(**kwargs)
+		context["runs"] = ImportRun.objects.select_related("job", "created_by")[:20]
+		return context
+
+	def form_valid(self, form):
+		form.instance.original_name = form.cleaned_data["workbook"].name
+		form.instance.created_by = self.request.user
+		response = super().form_valid(form)
+		# Resumes from its checkpoint on every retry.
+		self.object.job = jobs.enqueue("import_workbook", {"run": self.object.pk}, max_attempts=5)
+		self.object.save(update_fields=["job", "updated_at"])
+		return response
+
+
+class ImportDetailView(AdminRequiredMixin, generic.DetailView):
+	model = ImportRun
+	queryset = ImportRun.objects.select_related("job")
+	template_name = "clinic/import_detail.html"
+	context_object_name = "run"
+
+	def get_context_data(self, **kwargs):
+		context = super().get_context_data(**kwargs)
+		context["progress"] = import_status(self.object)
+		return context
+
+
 # -------------------------
 # Facility Views
 # -------------------------
-class FacilityListView(AdminRequiredMixin, generic.ListView):
+class FacilityListView(AdminRequiredMixin, CachedPageMixin, KeysetPaginationMixin, generic.ListView):
     model = Facility
+    cache_models = (Facility,)
     template_name = "clinic/facility_list.html"
     context_object_name = "facilities"
-    # paginate_by = 10  # optional
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -88,13 +470,19 @@ class FacilityListView(AdminRequiredMixin, generic.ListView):
         return queryset
 
 
-class FacilityDetailView(AdminRequiredMixin, generic.DetailView):
+class FacilityDetailView(AdminRequiredMixin, CachedPageMixin, generic.DetailView):
 	model = Facility
+	cache_facility_kwarg = "pk"
 	template_name = "clinic/facility_detail.html"
 	context_object_name = "facility"
 
 	def get_context_data(self, **kwargs):
 		ctx = super().get_context_data(**kwargs)
+		# querysets are evaluated once by the template's {% if %} and reused by its {% for %},
+		# and not at all while the sections' fragments are cached
+		ctx["land_records"] = self.object.land_records.all()
+		ctx["issues"] = self.object.issues.all()
+		ctx.update(caching.facility_fragment_context(self.object.pk))
 		# include an empty LandRecordForm so the facility detail template can embed it
 		ctx["landrecord_form"] = LandRecordForm()
 		# include a locality form prefilled with the facility instance
@@ -141,31 +529,46 @@ class FacilityDeleteView(AdminRequiredMixin, generic.DeleteView):
 # -------------------------
 # LandRecord Views
 # -------------------------
-class LandRecordListView(AdminRequiredMixin, generic.ListView):
+class LandRecordListView(AdminRequiredMixin, CachedPageMixin, KeysetPaginationMixin, generic.ListView):
     model = LandRecord
+    cache_models = (LandRecord, Facility)
     template_name = "clinic/landrecord_list.html"
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        # the template shows record.facility.name on every row
+        queryset = super().get_queryset().select_related("facility")
+        return filter_land_records(queryset, self.request.GET)
 
-        facility_search = self.request.GET.get("search")
-        parcel_search = self.request.GET.get("parcel")
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["dispute_choices"] = LandRecord.DISPUTE_STATUS
+        return context
 
-        if facility_search:
-            queryset = queryset.filter(
-                facility__name__icontains=facility_search
-            )
 
-        if parcel_search:
-            queryset = queryset.filter(
-                parcel_number__icontains=parcel_search
-            )
+class LandRecordExportView(AdminRequiredMixin, generic.View):
+    """
+    The land record register, with the list's filters, as CSV (streamed)
+    or XLSX.
+    """
 
-        return queryset
+    def get(self, request, *args, **kwargs):
+        rows = exports.export_rows(request.GET)
+        filename = f"land_records_{timezone.localdate():%Y%m%d}"
+        if kwargs["format"] == "xlsx":
+            # the XLSX zip can only be written once all rows are in, so it is
+            # spooled to a temporary file (on disk past 10 MB) and sent from there
+            spool = tempfile.SpooledTemporaryFile(max_size=10 * 1024 * 1024)
+            exports.write_xlsx(rows, spool)
+            spool.seek(0)
+            return FileResponse(spool, as_attachment=True, filename=f"{filename}.xlsx")
+        response = StreamingHttpResponse(exports.iter_csv(rows), content_type="text/csv; charset=utf-8")
+        response["Content-Disposition"] = f'attachment; filename="{filename}.csv"'
+        return response
 
 
 class LandRecordDetailView(AdminRequiredMixin, generic.DetailView):
 	model = LandRecord
+	queryset = LandRecord.objects.select_related("facility")
 	template_name = "clinic/landrecord_detail.html"
 	context_object_name = "landrecord"
 
@@ -216,6 +619,17 @@ class LandRecordCreateForFacilityView(AdminRequiredMixin, generic.CreateView):
 		return reverse("clinic:facility_detail", kwargs={"pk": self.facility_pk})
 
 
+class DocumentView(AdminRequiredMixin, generic.View):
+	"""A stored land document by hash, with Range and ETag support (see clinic.blobs)."""
+
+	def get(self, request, *args, **kwargs):
+		blob = get_object_or_404(StoredBlob, sha256=kwargs["sha256"])
+		try:
+			return blobs.serve(request, blob)
+		except FileNotFoundError:
+			raise Http404("Document file is missing.")
+
+
 class FacilityLocalityUpdateView(AdminRequiredMixin, generic.UpdateView):
 	"""Update only the locality fields for a Facility (embedded on facility detail page)."""
 	model = Facility
@@ -256,6 +670,7 @@ class LandRecordUpdateView(AdminRequiredMixin, generic.UpdateView):
 
 class LandRecordDeleteView(AdminRequiredMixin, generic.DeleteView):
 	model = LandRecord
+	queryset = LandRecord.objects.select_related("facility")
 	template_name = "clinic/landrecord_confirm_delete.html"
 	success_url = reverse_lazy("clinic:landrecord_list")
 
@@ -263,14 +678,50 @@ class LandRecordDeleteView(AdminRequiredMixin, generic.DeleteView):
 # -------------------------
 # Issue Views
 # -------------------------
-class IssueListView(AdminRequiredMixin, generic.ListView):
+class IssueListView(AdminRequiredMixin, KeysetPaginationMixin, generic.ListView):
 	model = Issue
+	queryset = Issue.objects.select_related("facility")
 	template_name = "clinic/issue_list.html"
 	context_object_name = "issues"
 
+	def get_context_data(self, **kwargs):
+		context = super().get_context_data(**kwargs)
+		context["status_choices"] = Issue.STATUS_CHOICES
+		return context
+
+
+class BulkActionView(AdminRequiredMixin, generic.View):
+	"""
+	Form POST from a list page: the checked rows (pks), the field to set and
+	its value. Redirects back to the list with a message.
+	"""
+
+	model = None
+	success_url = None
+
+	def post(self, request, *args, **kwargs):
+		try:
+			updated = bulk_actions.apply(
+				self.model, request.POST.getlist("pks"), request.POST.get("field"), request.POST.get("value")
+			)
+		except ValidationError as exc:
+			messages.error(request, " ".join(exc.messages))
+		except ValueError:
+			messages.error(request, "Invalid selection.")
+		else:
+			messages.success(request, f"{updated} {self.model._meta.verbose_name_plural} updated.")
+		return HttpResponseRedirect(self.get_success_url())
+
+	def get_success_url(self):
+		next_url = self.request.POST.get("next")
+		if next_url and url_has_allowed_host_and_scheme(next_url, {self.request.get_host()}):
+			return next_url
+		return reverse(self.success_url)
+
 
 class IssueDetailView(AdminRequiredMixin, generic.DetailView):
 	model = Issue
+	queryset = Issue.objects.select_related("facility")
 	template_name = "clinic/issue_detail.html"
 	context_object_name = "issue"
 
@@ -287,6 +738,7 @@ class IssueUpdateView(AdminRequiredMixin, generic.UpdateView):
 
 class IssueDeleteView(AdminRequiredMixin, generic.DeleteView):
 	model = Issue
+	queryset = Issue.objects.select_related("facility")
 	template_name = "clinic/issue_confirm_delete.html"
 	success_url = reverse_lazy("clinic:issue_list")
 
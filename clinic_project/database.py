@@ -0,0 +1,159 @@
+"""
+Database profiles, chosen from the environment.
+
+DATABASE_URL (postgres://, mysql://, sqlite:///path) or DB_ENGINE
+(sqlite, postgres, mysql) with DB_NAME / DB_USER / DB_PASSWORD / DB_HOST /
+DB_PORT picks the profile; without either the project runs on SQLite
+(db.sqlite3), as before.
+
+- sqlite: WAL journal (readers no longer block the writer and vice versa),
+  a busy timeout so concurrent writers wait instead of failing with
+  "database is locked", synchronous=NORMAL (safe with WAL), a larger page
+  cache and in-memory temp tables. The journal mode is stored in the
+  database file, so enable_wal() switches it once, when a connection finds
+  it is not WAL yet; the other pragmas are set on every new connection.
+  Transactions start IMMEDIATE, taking the write lock up front instead of
+  failing when a reader tries to upgrade mid-transaction.
+- postgres: persistent connections with health checks; with psycopg 3 and
+  psycopg_pool installed, Django's connection pool instead. DB_PGBOUNCER=1
+  disables server-side cursors for pgbouncer in transaction mode.
+- mysql: persistent connections with health checks, utf8mb4, strict mode.
+
+CONN_MAX_AGE (seconds) overrides the persistent connection lifetime.
+"""
+import importlib.util
+import os
+from urllib.parse import parse_qs, unquote, urlparse
+
+DEFAULT_CONN_MAX_AGE = 600
+SQLITE_BUSY_TIMEOUT = 20  # seconds
+SQLITE_JOURNAL_MODE = "wal"
+SQLITE_PRAGMAS = {
+    "synchronous": "NORMAL",
+    "cache_size": -32000,  # KiB, i.e. 32 MB per connection
+    "temp_store": "MEMORY",
+    "mmap_size": 128 * 1024 * 1024,
+}
+
+ENGINES = {
+    "sqlite": "django.db.backends.sqlite3",
+    "postgres": "django.db.backends.postgresql",
+    "mysql": "django.db.backends.mysql",
+}
+SCHEMES = {
+    "sqlite": "sqlite",
+    "postgres": "postgres",
+    "postgresql": "postgres",
+    "pgsql": "postgres",
+    "mysql": "mysql",
+}
+
+
+def _from_url(url):
+    parsed = urlparse(url)
+    profile = SCHEMES.get(parsed.scheme.split("+")[0])
+    if profile is None:
+        raise ValueError(f"Unsupported DATABASE_URL scheme: {parsed.scheme}")
+    if profile == "sqlite":
+        # sqlite:///relative.db, sqlite:////absolute/path.db
+        return profile, {"NAME": unquote(parsed.path[1:])}
+    options = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+    return profile, {
+        "NAME": unquote(parsed.path.lstrip("/")),
+        "USER": unquote(parsed.username or ""),
+        "PASSWORD": unquote(parsed.password or ""),
+        "HOST": parsed.hostname or "",
+        "PORT": str(parsed.port or ""),
+        "OPTIONS": options,
+    }
+
+
+def _from_variables(env, default_name):
+    profile = env.get("DB_ENGINE", "sqlite").lower()
+    profile = SCHEMES.get(profile, profile)
+    if profile not in ENGINES:
+        raise ValueError(f"Unsupported DB_ENGINE: {profile}")
+    if profile == "sqlite":
+        return profile, {"NAME": env.get("DB_NAME", default_name)}
+    return profile, {
+        "NAME": env.get("DB_NAME", "clinic"),
+        "USER": env.get("DB_USER", ""),
+        "PASSWORD": env.get("DB_PASSWORD", ""),
+        "HOST": env.get("DB_HOST", "localhost"),
+        "PORT": env.get("DB_PORT", ""),
+        "OPTIONS": {},
+    }
+
+
+def sqlite_init_command():
+    return "".join(f"PRAGMA {name}={value};" for name, value in SQLITE_PRAGMAS.items())
+
+
+def enable_wal(sender, connection, **kwargs):
+    """connection_created receiver: put a file-backed SQLite database in WAL mode."""
+    if connection.vendor != "sqlite" or connection.is_in_memory_db():
+        return
+    with connection.cursor() as cursor:
+        mode = cursor.execute("PRAGMA journal_mode").fetchone()[0]
+        if mode.lower() != SQLITE_JOURNAL_MODE:
+            cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+
+
+def _has_pool():
+    return all(importlib.util.find_spec(name) for name in ("psycopg", "psycopg_pool"))
+
+
+def database_settings(env=None, default_name="db.sqlite3"):
+    """(profile name, DATABASES["default"] dict) for the environment."""
+    env = os.environ if env is None else env
+    if env.get("DATABASE_URL"):
+        profile, config = _from_url(env["DATABASE_URL"])
+    else:
+        profile, config = _from_variables(env, default_name)
+    config["ENGINE"] = ENGINES[profile]
+    options = config.setdefault("OPTIONS", {})
+    conn_max_age = int(env.get("CONN_MAX_AGE", DEFAULT_CONN_MAX_AGE))
+
+    if profile == "sqlite":
+        options.update(
+            init_command=sqlite_init_command(),
+            timeout=SQLITE_BUSY_TIMEOUT,
+            transaction_mode="IMMEDIATE",
+        )
+        config["CONN_MAX_AGE"] = conn_max_age
+        config["CONN_HEALTH_CHECKS"] = True
+    elif profile == "postgres":
+        if _has_pool() and env.get("DB_POOL", "1") != "0":
+            # Pooled connections are returned to the pool after every request.
+            options["pool"] = {
+                "min_size": int(env.get("DB_POOL_MIN", 2)),
+                "max_size": int(env.get("DB_POOL_MAX", 10)),
+                "timeout": 10,
+            }
+            config["CONN_MAX_AGE"] = 0
+            profile = "postgres (pooled)"
+        else:
+            config["CONN_MAX_AGE"] = conn_max_age
+            config["CONN_HEALTH_CHECKS"] = True
+        options.setdefault("connect_timeout", 5)
+        if env.get("DB_PGBOUNCER") == "1":
+            config["DISABLE_SERVER_SIDE_CURSORS"] = True
+    else:
+        options.setdefault("charset", "utf8mb4")
+        options.setdefault("init_command", "SET sql_mode='STRICT_TRANS_TABLES'")
+        options.setdefault("isolation_level", "read committed")
+        config["CONN_MAX_AGE"] = conn_max_age
+        config["CONN_HEALTH_CHECKS"] = True
+    return profile, config
+
+
+def describe(profile, config):
+    """One line saying which profile is active, for the startup check."""
+    where = config["NAME"] if config["ENGINE"].endswith("sqlite3") else f"{config.get('HOST')}/{config['NAME']}"
+    details = [f"CONN_MAX_AGE={config.get('CONN_MAX_AGE')}"]
+    if "pool" in config.get("OPTIONS", {}):
+        pool = config["OPTIONS"]["pool"]
+        details = [f"pool {pool['min_size']}-{pool['max_size']}"]
+    if config["ENGINE"].endswith("sqlite3"):
+        details.append("WAL, busy_timeout {}s".format(config["OPTIONS"]["timeout"]))
+    return f"Database profile: {profile} ({where}; {', '.join(details)})"
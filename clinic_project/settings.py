@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from .database import database_settings
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -45,6 +48,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover everything below (see clinic/perf.py)
+    'clinic.perf.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # <-- move here
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -60,7 +65,9 @@ ROOT_URLCONF = 'clinic_project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that reports render time to clinic.perf
+        'BACKEND': 'clinic.perf.TimedDjangoTemplates',
+        'NAME': 'django',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -79,14 +86,48 @@ WSGI_APPLICATION = 'clinic_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Profile picked from DATABASE_URL / DB_ENGINE, see clinic_project/database.py;
+# SQLite (WAL) in BASE_DIR / 'db.sqlite3' by default.
+
+DATABASE_PROFILE, _default_database = database_settings(default_name=BASE_DIR / 'db.sqlite3')
+
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': _default_database,
 }
 
 
+# Cache
+# Pages are cached with per-model version keys (see clinic/caching.py). The
+# local-memory backend is per process, so with several worker processes
+# (WEB_CONCURRENCY, which gunicorn also reads) the default is the file-based
+# cache, shared through CACHE_LOCATION, so that invalidation reaches all of
+# them. CACHE_BACKEND=file or locmem picks one explicitly.
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", 1))
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND") or ("file" if WEB_CONCURRENCY > 1 else "locmem")
+if CACHE_BACKEND == "file":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.environ.get("CACHE_LOCATION", BASE_DIR / "cache"),
+            "OPTIONS": {"MAX_ENTRIES": 10000},
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "clinic",
+            "OPTIONS": {"MAX_ENTRIES": 5000},
+        }
+    }
+
+
+# Request timing (clinic/perf.py): requests slower than this are logged to
+# the clinic.perf logger; per-view histograms are at /api/metrics/ (staff).
+CLINIC_SLOW_REQUEST_MS = int(os.environ.get("SLOW_REQUEST_MS", 500))
+CLINIC_SERVER_TIMING = os.environ.get("SERVER_TIMING", "1") != "0"
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 